@@ -0,0 +1,19 @@
+import os
+import sys
+
+# Benchmarks run from the product-api folder (`python -m benchmarks.<name>`)
+# and import the function code plus the common layer the same way Lambda does.
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+layer_path = os.path.join(project_root, 'src', 'layers', 'common', 'python')
+
+for path in (project_root, layer_path):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# boto3 refuses to sign requests without credentials, even against a local endpoint
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'local')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'local')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+# no line per DynamoDB call (set DDB_METRICS=calls to see them); each invocation
+# still logs its totals, so benchmarks that print a report disable texter.metrics
+os.environ.setdefault('DDB_METRICS', 'summary')
@@ -0,0 +1,99 @@
+"""Per-invocation latency of POST /messages with and without the shared DynamoDB client.
+
+    product-api$ python -m benchmarks.client_reuse --invocations 300
+    product-api$ python -m benchmarks.client_reuse --endpoint http://localhost:8000
+
+Without --endpoint a stub DynamoDB server is started in-process.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+
+import benchmarks  # noqa: F401  sets up sys.path
+from benchmarks.stub_dynamodb import StubDynamoDB
+
+
+def post_event(i: int) -> dict:
+    return {
+        'path': '/messages',
+        'resource': '/messages',
+        'httpMethod': 'POST',
+        'body': json.dumps({
+            'message': f'benchmark message {i}',
+            'owner': 'bench',
+            'display_name': 'Bench',
+            'outgoing_phone': '+15555550100',
+            'send_time': '2030-01-01T12:00:00'
+        })
+    }
+
+
+def legacy_get_table(table_name, region_name=None):
+    # what every handler used to do on each request
+    import boto3
+    messages_table = boto3.resource(
+        'dynamodb',
+        region_name=region_name,
+        endpoint_url=os.environ['DYNAMODB_ENDPOINT']
+    )
+    return messages_table.Table(table_name)
+
+
+def run(app, invocations: int) -> list:
+    timings = []
+    for i in range(invocations):
+        start = time.perf_counter()
+        response = app.lambda_handler(post_event(i), None)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response['statusCode'] == 201, response
+    return timings
+
+
+def report(label: str, timings: list, connections: int):
+    ordered = sorted(timings)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f'{label:<8} mean={statistics.mean(timings):7.2f}ms '
+          f'p50={statistics.median(timings):7.2f}ms p95={p95:7.2f}ms '
+          f'connections={connections}')
+
+
+def main(endpoint: str, invocations: int, stub: StubDynamoDB = None):
+    """Connections are only counted against the stub server; another endpoint reports 0."""
+    os.environ['DYNAMODB_ENDPOINT'] = endpoint
+    # every invocation logs its metric totals, which would bury the report
+    logging.getLogger('texter.metrics').disabled = True
+
+    from common import dynamodb
+    from src.create_messages import app
+
+    dynamodb.endpoint_url = endpoint
+    shared_get_table = dynamodb.get_table
+
+    dynamodb.get_table = legacy_get_table
+    run(app, 5)  # warm the botocore loaders so both runs start equal
+    before = run(app, invocations)
+    before_connections = stub.connections_opened if stub else 0
+
+    dynamodb.get_table = shared_get_table
+    dynamodb.reset()
+    after = run(app, invocations)
+    after_connections = (stub.connections_opened - before_connections) if stub else 0
+
+    report('before', before, before_connections)
+    report('after', after, after_connections)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invocations', type=int, default=200)
+    parser.add_argument('--endpoint', help='DynamoDB endpoint, e.g. DynamoDB Local')
+    args = parser.parse_args()
+
+    if args.endpoint:
+        main(args.endpoint, args.invocations)
+    else:
+        with StubDynamoDB() as stub:
+            main(stub.endpoint_url, args.invocations, stub)
@@ -0,0 +1,179 @@
+"""Cold-import time and first-invocation latency of every function in template.yaml.
+
+Each sample runs in a fresh interpreter, like a new Lambda container, with the
+function's CodeUri and the common layer on sys.path and DynamoDB pointed at the
+in-process stub. Results can be saved and compared against a baseline run:
+
+    product-api$ python -m benchmarks.cold_start --samples 5 --save cold_start.json
+    product-api$ python -m benchmarks.cold_start --baseline cold_start.json
+
+Events come from events/<LogicalId>.json when present, otherwise from DEFAULT_EVENTS.
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import benchmarks
+from benchmarks.stub_dynamodb import StubDynamoDB
+
+DEFAULT_EVENTS = {
+    'api': {'httpMethod': 'GET', 'path': '/messages', 'resource': '/messages', 'headers': {}},
+    'schedule': {'source': 'aws.events', 'detail-type': 'Scheduled Event', 'detail': {}},
+}
+
+
+class Context:
+    function_name = 'cold-start-benchmark'
+    aws_request_id = '00000000-0000-0000-0000-000000000000'
+
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+def load_template(path: str) -> dict:
+    import yaml
+
+    class TemplateLoader(yaml.SafeLoader):
+        pass
+
+    # CloudFormation short-form tags (!Ref, !Sub...) are irrelevant here
+    TemplateLoader.add_multi_constructor('!', lambda loader, suffix, node: None)
+    with open(path) as f:
+        return yaml.load(f, Loader=TemplateLoader)
+
+
+def functions(template: dict) -> list:
+    globals_ = (template.get('Globals') or {}).get('Function') or {}
+    global_env = ((globals_.get('Environment') or {}).get('Variables')) or {}
+    result = []
+    for logical_id, resource in template['Resources'].items():
+        if resource.get('Type') != 'AWS::Serverless::Function':
+            continue
+        properties = resource['Properties']
+        env = dict(global_env, **(((properties.get('Environment') or {}).get('Variables')) or {}))
+        kind = 'api' if any(e.get('Type') == 'Api' for e in (properties.get('Events') or {}).values()) else 'schedule'
+        result.append({
+            'name': logical_id,
+            'code_uri': properties['CodeUri'],
+            'handler': properties.get('Handler', 'app.lambda_handler'),
+            'environment': {k: str(v) for k, v in env.items() if v is not None},
+            'kind': kind,
+        })
+    return result
+
+
+def event_for(function: dict) -> dict:
+    path = os.path.join(benchmarks.project_root, 'events', f'{function["name"]}.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return DEFAULT_EVENTS[function['kind']]
+
+
+def child(code_uri: str, handler: str, event: str):
+    """Runs inside the fresh interpreter and prints one JSON line of timings."""
+    sys.path.insert(0, os.path.join(benchmarks.project_root, code_uri))
+    module_name, function_name = handler.rsplit('.', 1)
+    modules_before = len(sys.modules)
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    imported = time.perf_counter()
+    modules_after_import = len(sys.modules)
+
+    result = {'import_ms': (imported - start) * 1000, 'modules': modules_after_import - modules_before}
+    lambda_handler = getattr(module, function_name)
+    try:
+        for label in ('first_invoke_ms', 'warm_invoke_ms'):
+            start = time.perf_counter()
+            lambda_handler(json.loads(event), Context())
+            result[label] = (time.perf_counter() - start) * 1000
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['modules_after_invoke'] = len(sys.modules) - modules_before
+    print(json.dumps(result))
+
+
+def sample(function: dict, endpoint: str) -> dict:
+    env = dict(os.environ, **function['environment'])
+    env['DYNAMODB_ENDPOINT'] = endpoint
+    command = [sys.executable, '-m', 'benchmarks.cold_start', '--child',
+               function['code_uri'], function['handler'], json.dumps(event_for(function))]
+    completed = subprocess.run(command, cwd=benchmarks.project_root, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'error': completed.stderr.strip().splitlines()[-1] if completed.stderr else 'failed'}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples: list) -> dict:
+    summary = {}
+    for key in ('import_ms', 'first_invoke_ms', 'warm_invoke_ms', 'modules', 'modules_after_invoke'):
+        values = [s[key] for s in samples if key in s]
+        if values:
+            summary[key] = statistics.median(values)
+    errors = {s['error'] for s in samples if 'error' in s}
+    if errors:
+        summary['error'] = '; '.join(sorted(errors))
+    return summary
+
+
+def report(results: dict, baseline: dict = None, threshold: float = 0.2) -> bool:
+    regressed = False
+    print(f'{"function":<28} {"import":>9} {"1st call":>9} {"warm":>8} {"modules":>8}')
+    for name, summary in results.items():
+        row = f'{name:<28} {summary.get("import_ms", 0):8.1f}ms {summary.get("first_invoke_ms", 0):8.1f}ms ' \
+              f'{summary.get("warm_invoke_ms", 0):7.1f}ms {summary.get("modules", 0):8.0f}'
+        if baseline and name in baseline:
+            before = baseline[name].get('import_ms', 0) + baseline[name].get('first_invoke_ms', 0)
+            after = summary.get('import_ms', 0) + summary.get('first_invoke_ms', 0)
+            if before:
+                change = (after - before) / before
+                row += f'  {change:+.0%} vs baseline'
+                if change > threshold:
+                    row += '  REGRESSION'
+                    regressed = True
+        if 'error' in summary:
+            row += f'  ({summary["error"]})'
+        print(row)
+    return not regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--template', default=os.path.join(benchmarks.project_root, 'template.yaml'))
+    parser.add_argument('--samples', type=int, default=5)
+    parser.add_argument('--function', action='append', help='only these logical ids')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved with --save')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold, 0.2 = 20%%')
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(*args.child)
+
+    targets = [f for f in functions(load_template(args.template))
+               if not args.function or f['name'] in args.function]
+    results = {}
+    with StubDynamoDB() as stub:
+        for function in targets:
+            results[function['name']] = summarize([sample(function, stub.endpoint_url) for _ in range(args.samples)])
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    ok = report(results, baseline, args.threshold)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Scanner dispatch time for a busy minute: serial sends vs the concurrent dispatcher.
+
+    product-api$ python -m benchmarks.dispatch --messages 200 --twilio-rtt 0.15 --rate 50
+"""
+import argparse
+import time
+
+import benchmarks  # noqa: F401  sets up sys.path
+from benchmarks.fakes import FakeTwilioClient, SlowTable
+from common.dispatch import Dispatcher, Sender
+from common.ratelimit import TokenBucket
+
+
+class FakeTwilioSender(Sender):
+    def __init__(self, client):
+        self.client = client
+
+    def send(self, message: dict):
+        self.client.messages.create(
+            body=f'{message["message"]} -{message["display_name"]}',
+            from_='+15555550000',
+            to=message['outgoing_phone']
+        )
+
+
+def mark_sent(table, message):
+    table.update_item(
+        Key={'id': message['id']},
+        UpdateExpression="set sent = :s",
+        ExpressionAttributeValues={":s": "True"}
+    )
+
+
+def serial(messages, client, table):
+    # what get_messages_to_send used to do: all sends, then all updates
+    sender = FakeTwilioSender(client)
+    for message in messages:
+        sender.send(message)
+    for message in messages:
+        mark_sent(table, message)
+
+
+def concurrent(messages, client, table, workers, rate):
+    dispatcher = Dispatcher(
+        FakeTwilioSender(client),
+        on_sent=lambda message: mark_sent(table, message),
+        max_workers=workers,
+        limiter=TokenBucket(rate, rate)
+    )
+    results = dispatcher.dispatch(messages)
+    assert not results['failed'], results['failed']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100)
+    parser.add_argument('--twilio-rtt', type=float, default=0.15)
+    parser.add_argument('--dynamodb-rtt', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=50, help='provider sends per second')
+    args = parser.parse_args()
+
+    messages = [
+        {'id': str(i), 'message': f'hello {i}', 'display_name': 'Bench', 'outgoing_phone': '+15555550100'}
+        for i in range(args.messages)
+    ]
+    runs = [('serial', lambda c, t: serial(messages, c, t)),
+            ('dispatcher', lambda c, t: concurrent(messages, c, t, args.workers, args.rate))]
+    for label, run in runs:
+        client, table = FakeTwilioClient(args.twilio_rtt), SlowTable(args.dynamodb_rtt)
+        start = time.perf_counter()
+        run(client, table)
+        elapsed = time.perf_counter() - start
+        assert len(client.sent) == len(table.updates) == args.messages
+        print(f'{label:<11} {elapsed:6.2f}s  {args.messages / elapsed:7.1f} msg/s')
+
+
+if __name__ == '__main__':
+    main()
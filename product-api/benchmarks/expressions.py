@@ -0,0 +1,405 @@
+import re
+from decimal import Decimal
+
+# Evaluator for the DynamoDB expression language (condition, key condition,
+# filter, update and projection expressions) used by the local DynamoDB.
+# Items are plain python values as produced by boto3's TypeDeserializer.
+
+MISSING = object()
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+_token = re.compile(r'\s*(?:(#[A-Za-z0-9_]+)|(:[A-Za-z0-9_]+)|([A-Za-z_][A-Za-z0-9_]*)|(\d+)|(<>|<=|>=|[=<>(),.\[\]+-]))')
+_keywords = {'AND', 'OR', 'NOT', 'BETWEEN', 'IN', 'SET', 'REMOVE', 'ADD', 'DELETE'}
+
+
+def tokenize(expression: str) -> list:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _token.match(expression, position)
+        if not match:
+            raise ExpressionError(f'Invalid token at {position}: {expression[position:position + 10]!r}')
+        name, value, word, number, symbol = match.groups()
+        if name:
+            tokens.append(('name', name))
+        elif value:
+            tokens.append(('value', value))
+        elif word:
+            tokens.append(('keyword', word.upper()) if word.upper() in _keywords else ('word', word))
+        elif number:
+            tokens.append(('number', int(number)))
+        else:
+            tokens.append(('symbol', symbol))
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    def __init__(self, expression: str, names: dict = None, values: dict = None):
+        self.tokens = tokenize(expression)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self, offset: int = 0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, kind: str = None, text=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (text is not None and token[1] != text):
+            raise ExpressionError(f'Expected {text or kind}, got {token[1]!r}')
+        self.position += 1
+        return token
+
+    def accept(self, kind: str, text=None) -> bool:
+        token = self.peek()
+        if token[0] == kind and (text is None or token[1] == text):
+            self.position += 1
+            return True
+        return False
+
+    def done(self):
+        if self.peek()[0] is not None:
+            raise ExpressionError(f'Unexpected {self.peek()[1]!r}')
+
+    # paths and operands
+
+    def path(self) -> tuple:
+        parts = [self.name()]
+        while True:
+            if self.accept('symbol', '.'):
+                parts.append(self.name())
+            elif self.accept('symbol', '['):
+                parts.append(self.take('number')[1])
+                self.take('symbol', ']')
+            else:
+                return ('path', tuple(parts))
+
+    def name(self) -> str:
+        kind, text = self.take()
+        if kind == 'name':
+            if text not in self.names:
+                raise ExpressionError(f'Undefined attribute name {text}')
+            return self.names[text]
+        if kind == 'word':
+            return text
+        raise ExpressionError(f'Expected an attribute name, got {text!r}')
+
+    def operand(self) -> tuple:
+        kind, text = self.peek()
+        if kind == 'value':
+            self.position += 1
+            if text not in self.values:
+                raise ExpressionError(f'Undefined attribute value {text}')
+            return ('value', self.values[text])
+        if kind == 'word' and self.peek(1) == ('symbol', '('):
+            self.position += 2
+            arguments = [self.operand()]
+            while self.accept('symbol', ','):
+                arguments.append(self.operand())
+            self.take('symbol', ')')
+            return ('call', text, arguments)
+        return self.path()
+
+    # conditions
+
+    def condition(self) -> tuple:
+        node = self.conjunction()
+        while self.accept('keyword', 'OR'):
+            node = ('or', node, self.conjunction())
+        return node
+
+    def conjunction(self) -> tuple:
+        node = self.negation()
+        while self.accept('keyword', 'AND'):
+            node = ('and', node, self.negation())
+        return node
+
+    def negation(self) -> tuple:
+        if self.accept('keyword', 'NOT'):
+            return ('not', self.negation())
+        if self.accept('symbol', '('):
+            node = self.condition()
+            self.take('symbol', ')')
+            return node
+        left = self.operand()
+        if left[0] == 'call' and left[1] != 'size':
+            return left
+        if self.accept('keyword', 'BETWEEN'):
+            low = self.operand()
+            self.take('keyword', 'AND')
+            return ('between', left, low, self.operand())
+        if self.accept('keyword', 'IN'):
+            self.take('symbol', '(')
+            options = [self.operand()]
+            while self.accept('symbol', ','):
+                options.append(self.operand())
+            self.take('symbol', ')')
+            return ('in', left, options)
+        kind, symbol = self.take('symbol')
+        if symbol not in ('=', '<>', '<', '<=', '>', '>='):
+            raise ExpressionError(f'Unexpected {symbol!r}')
+        return ('compare', symbol, left, self.operand())
+
+    # update expressions
+
+    def update(self) -> list:
+        actions = []
+        while self.peek()[0] is not None:
+            clause = self.take('keyword')[1]
+            while True:
+                path = self.path()
+                if clause == 'SET':
+                    self.take('symbol', '=')
+                    value = self.operand()
+                    if self.peek() in (('symbol', '+'), ('symbol', '-')):
+                        value = ('arithmetic', self.take()[1], value, self.operand())
+                    actions.append(('set', path, value))
+                elif clause == 'REMOVE':
+                    actions.append(('remove', path))
+                elif clause in ('ADD', 'DELETE'):
+                    actions.append((clause.lower(), path, self.operand()))
+                else:
+                    raise ExpressionError(f'Unknown update clause {clause}')
+                if not self.accept('symbol', ','):
+                    break
+        return actions
+
+    def paths(self) -> list:
+        paths = [self.path()]
+        while self.accept('symbol', ','):
+            paths.append(self.path())
+        return paths
+
+
+def parse_condition(expression: str, names: dict = None, values: dict = None) -> tuple:
+    parser = Parser(expression, names, values)
+    node = parser.condition()
+    parser.done()
+    return node
+
+
+def parse_update(expression: str, names: dict = None, values: dict = None) -> list:
+    parser = Parser(expression, names, values)
+    actions = parser.update()
+    parser.done()
+    return actions
+
+
+def parse_projection(expression: str, names: dict = None) -> list:
+    parser = Parser(expression, names)
+    paths = parser.paths()
+    parser.done()
+    return [path[1] for path in paths]
+
+
+# evaluation
+
+def resolve(item: dict, parts: tuple):
+    value = item
+    for part in parts:
+        if isinstance(part, int):
+            if not isinstance(value, list) or part >= len(value):
+                return MISSING
+            value = value[part]
+        else:
+            if not isinstance(value, dict) or part not in value:
+                return MISSING
+            value = value[part]
+    return value
+
+
+def type_of(value) -> str:
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, str):
+        return 'S'
+    if isinstance(value, (int, Decimal)):
+        return 'N'
+    if isinstance(value, dict):
+        return 'M'
+    if isinstance(value, list):
+        return 'L'
+    if isinstance(value, (set, frozenset)):
+        element = next(iter(value))
+        return {'S': 'SS', 'N': 'NS'}.get(type_of(element), 'BS')
+    return 'B'
+
+
+def comparable(value):
+    if type(value).__name__ == 'Binary':
+        return value.value
+    return value
+
+
+def evaluate_operand(node: tuple, item: dict):
+    kind = node[0]
+    if kind == 'value':
+        return node[1]
+    if kind == 'path':
+        return resolve(item, node[1])
+    if kind == 'call':
+        return call(node[1], node[2], item)
+    raise ExpressionError(f'Unexpected operand {kind}')
+
+
+def compare(symbol: str, left, right) -> bool:
+    if left is MISSING or right is MISSING:
+        return symbol == '<>' and not (left is MISSING and right is MISSING)
+    left, right = comparable(left), comparable(right)
+    if symbol == '=':
+        return type_of(left) == type_of(right) and left == right
+    if symbol == '<>':
+        return type_of(left) != type_of(right) or left != right
+    if type_of(left) != type_of(right) or type_of(left) not in ('S', 'N', 'B'):
+        return False
+    return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[symbol]
+
+
+def call(function: str, arguments: list, item: dict):
+    values = [evaluate_operand(argument, item) for argument in arguments]
+    if function == 'attribute_exists':
+        return values[0] is not MISSING
+    if function == 'attribute_not_exists':
+        return values[0] is MISSING
+    if function == 'attribute_type':
+        return values[0] is not MISSING and type_of(values[0]) == values[1]
+    if function == 'begins_with':
+        value, prefix = (comparable(v) for v in values)
+        return isinstance(value, (str, bytes)) and type(value) is type(prefix) and value.startswith(prefix)
+    if function == 'contains':
+        container, element = values
+        if isinstance(container, str):
+            return isinstance(element, str) and element in container
+        return isinstance(container, (list, set, frozenset)) and element in container
+    if function == 'size':
+        value = comparable(values[0])
+        return MISSING if value is MISSING else len(value.encode() if isinstance(value, str) else value)
+    if function == 'if_not_exists':
+        return values[1] if values[0] is MISSING else values[0]
+    if function == 'list_append':
+        return list(values[0]) + list(values[1])
+    raise ExpressionError(f'Unknown function {function}')
+
+
+def evaluate(node: tuple, item: dict) -> bool:
+    kind = node[0]
+    if kind == 'and':
+        return evaluate(node[1], item) and evaluate(node[2], item)
+    if kind == 'or':
+        return evaluate(node[1], item) or evaluate(node[2], item)
+    if kind == 'not':
+        return not evaluate(node[1], item)
+    if kind == 'compare':
+        return compare(node[1], evaluate_operand(node[2], item), evaluate_operand(node[3], item))
+    if kind == 'between':
+        value = evaluate_operand(node[1], item)
+        return compare('>=', value, evaluate_operand(node[2], item)) and \
+            compare('<=', value, evaluate_operand(node[3], item))
+    if kind == 'in':
+        value = evaluate_operand(node[1], item)
+        return any(compare('=', value, evaluate_operand(option, item)) for option in node[2])
+    if kind == 'call':
+        return bool(call(node[1], node[2], item))
+    raise ExpressionError(f'Unexpected condition {kind}')
+
+
+def assign(item: dict, parts: tuple, value):
+    container = resolve(item, parts[:-1]) if len(parts) > 1 else item
+    if container is MISSING:
+        raise ExpressionError('The document path provided in the update expression is invalid for update')
+    if isinstance(parts[-1], int):
+        if parts[-1] >= len(container):
+            container.append(value)
+        else:
+            container[parts[-1]] = value
+    else:
+        container[parts[-1]] = value
+
+
+def discard(item: dict, parts: tuple):
+    container = resolve(item, parts[:-1]) if len(parts) > 1 else item
+    if isinstance(container, dict):
+        container.pop(parts[-1], None)
+    elif isinstance(container, list) and parts[-1] < len(container):
+        del container[parts[-1]]
+
+
+def apply_update(actions: list, item: dict) -> dict:
+    """Apply parsed update actions to a copy of item and return it."""
+    original = item
+    item = copy_item(item)
+    for action in actions:
+        kind, path = action[0], action[1][1]
+        if kind == 'set':
+            value = action[2]
+            if value[0] == 'arithmetic':
+                left = evaluate_operand(value[2], original)
+                right = evaluate_operand(value[3], original)
+                if type_of(left) != 'N' or type_of(right) != 'N':
+                    raise ExpressionError('An operand in the update expression has an incorrect data type')
+                result = Decimal(left) + Decimal(right) if value[1] == '+' else Decimal(left) - Decimal(right)
+            else:
+                result = evaluate_operand(value, original)
+                if result is MISSING:
+                    raise ExpressionError('The provided expression refers to an attribute that does not exist in the item')
+            assign(item, path, copy_value(result))
+        elif kind == 'remove':
+            discard(item, path)
+        elif kind == 'add':
+            current = resolve(item, path)
+            value = evaluate_operand(action[2], original)
+            if current is MISSING:
+                assign(item, path, copy_value(value))
+            elif isinstance(current, (set, frozenset)):
+                assign(item, path, set(current) | set(value))
+            else:
+                assign(item, path, Decimal(current) + Decimal(value))
+        elif kind == 'delete':
+            current = resolve(item, path)
+            if current is not MISSING:
+                remaining = set(current) - set(evaluate_operand(action[2], original))
+                if remaining:
+                    assign(item, path, remaining)
+                else:
+                    discard(item, path)
+    return item
+
+
+def project(item: dict, paths: list) -> dict:
+    result = {}
+    for parts in paths:
+        value = resolve(item, parts)
+        if value is MISSING:
+            continue
+        if len(parts) == 1 or any(isinstance(part, int) for part in parts):
+            # list elements are returned with their whole top-level attribute
+            result[parts[0]] = copy_value(item[parts[0]])
+            continue
+        target = result
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = copy_value(value)
+    return result
+
+
+def copy_value(value):
+    if isinstance(value, dict):
+        return {k: copy_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_value(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return set(value)
+    return value
+
+
+def copy_item(item: dict) -> dict:
+    return copy_value(item) if item else {}
@@ -0,0 +1,40 @@
+import threading
+import time
+
+# Stand-ins for the external services the functions talk to.
+
+
+class FakeMessages:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, body=None, from_=None, to=None):
+        time.sleep(self.client.latency)
+        with self.client.lock:
+            self.client.sent.append({'body': body, 'from_': from_, 'to': to})
+        return {'sid': f'SM{len(self.client.sent):032d}'}
+
+
+class FakeTwilioClient:
+    """Mimics twilio.rest.Client.messages.create with a fixed round trip."""
+
+    def __init__(self, latency: float = 0.15):
+        self.latency = latency
+        self.sent = []
+        self.lock = threading.Lock()
+        self.messages = FakeMessages(self)
+
+
+class SlowTable:
+    """Accepts update_item calls with a fixed round trip, like a remote DynamoDB table."""
+
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.updates = []
+        self.lock = threading.Lock()
+
+    def update_item(self, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            self.updates.append(kwargs['Key'])
+        return {'Attributes': {}}
@@ -0,0 +1,357 @@
+"""Offline load test: every lambda_handler against an in-memory DynamoDB and a fake SMS provider.
+
+For each dataset size the Messages table is seeded, then every API endpoint
+is driven with generated API Gateway events and the scanner is run over a
+batch of due messages. Reported per endpoint and per scanner run: latency
+percentiles, throughput, peak allocated memory per request and the read/write
+capacity units consumed.
+
+    product-api$ python -m benchmarks.load_test --dataset 1000 10000 --requests 200
+    product-api$ python -m benchmarks.load_test --dataset 5000 --due 100 --save load_test.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+import types
+from datetime import datetime, timedelta, timezone
+
+import benchmarks
+from benchmarks.cold_start import functions, load_template
+from benchmarks.fakes import FakeTwilioClient
+from benchmarks.local_dynamodb import LocalDynamoDB, tables_from_template
+
+
+HANDLERS = ['create_messages', 'scan_messages_lambda', 'userService', 'items']
+
+
+class Context:
+    function_name = 'load-test'
+    aws_request_id = '00000000-0000-0000-0000-000000000000'
+
+    def __init__(self, timeout: float = 30):
+        self.deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def load_handlers(template: dict, endpoint: str, twilio_client) -> dict:
+    """Import every handler with its template environment, the way its container would.
+
+    Handlers are keyed by their folder under src/.
+    """
+    os.environ['DYNAMODB_ENDPOINT'] = endpoint
+    # the template passes it in as a stack parameter
+    os.environ.setdefault('TOKEN_SECRET', 'load-test-token-secret-load-test-token-secret')
+    # the scanner imports twilio.rest.Client when something is due
+    twilio = types.ModuleType('twilio')
+    twilio.rest = types.ModuleType('twilio.rest')
+    twilio.rest.Client = lambda *args, **kwargs: twilio_client
+    sys.modules.update({'twilio': twilio, 'twilio.rest': twilio.rest})
+
+    deployed = functions(template)
+    handlers = {}
+    for name in HANDLERS:
+        for function in deployed:
+            if function['code_uri'].strip('/') == f'src/{name}':
+                # except DDB_METRICS: the template's per-call lines would flood the run
+                os.environ.update({k: v for k, v in function['environment'].items() if k != 'DDB_METRICS'})
+        module = __import__(f'src.{name}.app', fromlist=['lambda_handler'])
+        handlers[name] = module.lambda_handler
+    return handlers
+
+
+def random_message(rng: random.Random, owners: int, send_time: datetime) -> dict:
+    return {
+        'message': 'x' * rng.randint(20, 160),
+        'owner': f'owner-{rng.randrange(owners)}',
+        'display_name': 'Load Test',
+        'outgoing_phone': f'+1555{rng.randrange(10 ** 7):07d}',
+        'send_time': send_time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def future(rng: random.Random) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(days=rng.randint(1, 30), seconds=rng.randrange(86400))
+
+
+def seed(messages_app, rng: random.Random, count: int, owners: int, database: LocalDynamoDB, due: int = 0) -> list:
+    """Write count future messages (and due messages already past their send_time); returns their ids.
+
+    Seeding goes around the functions' client, its metrics and its throttling,
+    and around the tables' provisioned throughput.
+    """
+    import boto3
+
+    now = datetime.now(timezone.utc)
+    items = []
+    for i in range(count + due):
+        send_time = now - timedelta(seconds=rng.randint(1, 600)) if i >= count else future(rng)
+        items.append(messages_app.build_message_item(random_message(rng, owners, send_time)))
+    resource = boto3.resource('dynamodb', region_name=messages_app.region, endpoint_url=database.endpoint_url)
+    database.enforce_capacity(False)
+    try:
+        with resource.Table(messages_app.table_name).batch_writer() as writer:
+            for item in items:
+                writer.put_item(Item=item)
+    finally:
+        database.enforce_capacity(database.options['enforce_capacity'])
+    return [item['id'] for item in items[:count]]
+
+
+def api_event(method: str, path: str, resource: str = None, body=None, query: dict = None,
+              path_parameters: dict = None, headers: dict = None) -> dict:
+    return {
+        'httpMethod': method,
+        'path': path,
+        'resource': resource or path,
+        'headers': dict({'Accept-Encoding': 'gzip, br'}, **(headers or {})),
+        'queryStringParameters': query,
+        'pathParameters': path_parameters,
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False,
+    }
+
+
+def random_item(rng: random.Random) -> dict:
+    return {
+        'itemName': f'item-{rng.randrange(10 ** 6)}',
+        'description': 'x' * rng.randint(20, 200),
+        'price': rng.randint(0, 10000),
+        'isActive': rng.random() < 0.8,
+    }
+
+
+def seed_items(items_app, rng: random.Random, count: int, database: LocalDynamoDB) -> list:
+    """Write count catalog items the same way seed() writes messages; returns their ids."""
+    import boto3
+
+    items = [items_app.build_item(random_item(rng)) for _ in range(count)]
+    resource = boto3.resource('dynamodb', region_name=items_app.region, endpoint_url=database.endpoint_url)
+    database.enforce_capacity(False)
+    try:
+        with resource.Table(items_app.table_name).batch_writer() as writer:
+            for item in items:
+                writer.put_item(Item=item)
+    finally:
+        database.enforce_capacity(database.options['enforce_capacity'])
+    return [item['id'] for item in items]
+
+
+USER = {'username': 'load-test', 'password': 'load-test-password'}
+
+
+def seed_user(handler) -> str:
+    """Register the user /login and /verify run as and log it in; returns its token."""
+    handler(api_event('POST', '/register', body=USER), Context())
+    response = handler(api_event('POST', '/login', body=USER), Context())
+    return json.loads(response.get('body') or '{}').get('token')
+
+
+def endpoints(rng: random.Random, ids: list, owners: int, token: str = None, item_ids: list = ()) -> dict:
+    """Event generators by endpoint name: (handler, callable returning one event)."""
+    updatable = list(ids)
+    authorization = {'Authorization': f'Bearer {token}'}
+    deletable = list(ids)
+    rng.shuffle(deletable)
+
+    def owner_event():
+        owner = f'owner-{rng.randrange(owners)}'
+        return api_event('GET', f'/messages/{owner}', '/messages/{owner}', path_parameters={'owner': owner})
+
+    def update_event():
+        body = dict(random_message(rng, owners, future(rng)), id=rng.choice(updatable))
+        return api_event('PUT', '/messages', body=body)
+
+    return {
+        'POST /messages': ('create_messages', lambda: api_event(
+            'POST', '/messages', body=random_message(rng, owners, future(rng)))),
+        'POST /messages/batch': ('create_messages', lambda: api_event(
+            'POST', '/messages/batch', body={'messages': [random_message(rng, owners, future(rng)) for _ in range(25)]})),
+        'GET /messages': ('create_messages', lambda: api_event('GET', '/messages', query={'limit': '100'})),
+        'GET /messages/{owner}': ('create_messages', owner_event),
+        'PUT /messages': ('create_messages', update_event),
+        'DELETE /messages': ('create_messages', lambda: api_event(
+            'DELETE', '/messages', body={'id': deletable.pop() if deletable else 'missing'})),
+        'POST /register': ('userService', lambda: api_event(
+            'POST', '/register', body={'username': f'user-{rng.randrange(10 ** 6)}', 'password': 'load-test'})),
+        'POST /login': ('userService', lambda: api_event('POST', '/login', body=USER)),
+        'GET /verify': ('userService', lambda: api_event('GET', '/verify', headers=authorization)),
+        'GET /verify?include=user': ('userService', lambda: api_event(
+            'GET', '/verify', query={'include': 'user'}, headers=authorization)),
+        'POST /items': ('items', lambda: api_event(
+            'POST', '/items', body={'items': [random_item(rng) for _ in range(25)]})),
+        'GET /items?ids=': ('items', lambda: api_event(
+            'GET', '/items', query={'ids': ','.join(rng.sample(item_ids, min(50, len(item_ids))))})),
+        'GET /items': ('items', lambda: api_event('GET', '/items', query={
+            'min_price': str(rng.randint(0, 5000)), 'max_price': '10000', 'limit': '100'})),
+        'PUT /items': ('items', lambda: api_event('PUT', '/items', body={'items': [
+            {'id': item_id, 'price': rng.randint(0, 10000)} for item_id in rng.sample(item_ids, min(25, len(item_ids)))]})),
+    }
+
+
+def capacity(metrics: dict) -> tuple:
+    read = sum(op['read_units'] for table in metrics.values() for op in table.values())
+    write = sum(op['write_units'] for table in metrics.values() for op in table.values())
+    return read, write
+
+
+def measure(handler, make_event, requests: int, memory_samples: int, database: LocalDynamoDB) -> dict:
+    events = [make_event() for _ in range(requests + memory_samples)]
+    statuses = {}
+    latencies = []
+
+    database.reset_metrics()
+    start = time.perf_counter()
+    for event in events[:requests]:
+        began = time.perf_counter()
+        response = handler(event, Context())
+        latencies.append((time.perf_counter() - began) * 1000)
+        statuses[response.get('statusCode')] = statuses.get(response.get('statusCode'), 0) + 1
+    elapsed = time.perf_counter() - start
+    read, write = capacity(database.metrics())
+
+    # a separate pass, tracemalloc slows everything down
+    peaks = []
+    tracemalloc.start()
+    for event in events[requests:]:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        handler(event, Context())
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'throughput_rps': requests / elapsed if elapsed else 0.0,
+        'peak_kib': max(peaks) / 1024 if peaks else 0.0,
+        'rcu': read,
+        'wcu': write,
+        'rcu_per_request': read / requests if requests else 0.0,
+        'wcu_per_request': write / requests if requests else 0.0,
+        'statuses': {str(k): v for k, v in sorted(statuses.items(), key=lambda kv: str(kv[0]))},
+    }
+
+
+def scanner_runs(scanner, messages_app, rng: random.Random, runs: int, due: int, owners: int,
+                 twilio_client, database: LocalDynamoDB) -> list:
+    results = []
+    for run in range(runs):
+        seed(messages_app, rng, 0, owners, database, due=due)
+        sent_before = len(twilio_client.sent)
+        database.reset_metrics()
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = scanner({'source': 'aws.events', 'detail-type': 'Scheduled Event', 'detail': {}}, Context())
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        read, write = capacity(database.metrics())
+        body = response.get('body') if isinstance(response.get('body'), dict) else {}
+        results.append({
+            'run': run,
+            'due': due,
+            'sent': len(twilio_client.sent) - sent_before,
+            'failed': body.get('failed'),
+            'complete': body.get('complete'),
+            'seconds': elapsed,
+            'messages_per_second': (len(twilio_client.sent) - sent_before) / elapsed if elapsed else 0.0,
+            'peak_kib': peak / 1024,
+            'rcu': read,
+            'wcu': write,
+        })
+    return results
+
+
+def report(size: int, result: dict):
+    print(f'\ndataset: {size} messages')
+    print(f'{"endpoint":<24} {"p50":>8} {"p95":>8} {"p99":>8} {"req/s":>8} {"peak":>9} {"RCU/req":>8} {"WCU/req":>8}  status')
+    for name, m in result['endpoints'].items():
+        statuses = ' '.join(f'{k}x{v}' for k, v in m['statuses'].items())
+        print(f'{name:<24} {m["p50_ms"]:6.2f}ms {m["p95_ms"]:6.2f}ms {m["p99_ms"]:6.2f}ms {m["throughput_rps"]:8.1f} '
+              f'{m["peak_kib"]:7.1f}KiB {m["rcu_per_request"]:8.2f} {m["wcu_per_request"]:8.2f}  {statuses}')
+    print(f'{"scanner run":<24} {"due":>8} {"sent":>8} {"seconds":>8} {"msg/s":>8} {"peak":>9} {"RCU":>8} {"WCU":>8}')
+    for run in result['scanner']:
+        print(f'{run["run"]:<24} {run["due"]:8} {run["sent"]:8} {run["seconds"]:8.2f} {run["messages_per_second"]:8.1f} '
+              f'{run["peak_kib"]:7.1f}KiB {run["rcu"]:8.1f} {run["wcu"]:8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--template', default=os.path.join(benchmarks.project_root, 'template.yaml'))
+    parser.add_argument('--dataset', type=int, nargs='+', default=[1000], help='messages seeded before each run')
+    parser.add_argument('--owners', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--memory-samples', type=int, default=20, help='extra requests traced for memory')
+    parser.add_argument('--endpoint', action='append', help='only these endpoints, e.g. "GET /messages"')
+    parser.add_argument('--scanner-runs', type=int, default=3)
+    parser.add_argument('--due', type=int, default=50, help='messages due at each scanner run')
+    parser.add_argument('--sms-latency', type=float, default=0.15, help='fake SMS provider round trip, seconds')
+    parser.add_argument('--provisioned', action='store_true',
+                        help='hold tables to their template ProvisionedThroughput (seeding is exempt)')
+    parser.add_argument('--burst-seconds', type=float, default=300, help='burst capacity with --provisioned')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--show-metrics', action='store_true', help="print the functions' DynamoDB metric lines")
+    parser.add_argument('--save', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    template = load_template(args.template)
+    if not args.show_metrics:
+        # the functions' per-call metric lines are still built, just not printed
+        logging.getLogger('texter.metrics').disabled = True
+    twilio_client = FakeTwilioClient(args.sms_latency)
+    results = {}
+    handlers = None
+    for size in args.dataset:
+        # a fresh database per dataset size; the handlers (and their warm clients) are reused
+        with LocalDynamoDB(tables_from_template(template), enforce_capacity=args.provisioned,
+                           burst_seconds=args.burst_seconds) as database:
+            if handlers is None:
+                handlers = load_handlers(template, database.endpoint_url, twilio_client)
+            else:
+                from common import dynamodb
+                dynamodb.endpoint_url = database.endpoint_url
+                dynamodb.reset()
+            messages_app = sys.modules['src.create_messages.app']
+            messages_app.owner_cache.clear()
+
+            rng = random.Random(args.seed)
+            ids = seed(messages_app, rng, size, args.owners, database)
+            token = seed_user(handlers['userService'])
+            item_ids = seed_items(sys.modules['src.items.app'], rng, size, database)
+            result = {'endpoints': {}, 'scanner': []}
+            for name, (handler, make_event) in endpoints(rng, ids, args.owners, token, item_ids).items():
+                if args.endpoint and name not in args.endpoint:
+                    continue
+                result['endpoints'][name] = measure(handlers[handler], make_event, args.requests,
+                                                    args.memory_samples, database)
+            result['scanner'] = scanner_runs(handlers['scan_messages_lambda'], messages_app, rng, args.scanner_runs,
+                                             args.due, args.owners, twilio_client, database)
+            results[str(size)] = result
+            report(size, result)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
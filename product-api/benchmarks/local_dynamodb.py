@@ -0,0 +1,685 @@
+import json
+import math
+import multiprocessing
+import threading
+import time
+import zlib
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import expressions
+
+# In-memory DynamoDB speaking the JSON wire protocol, so the functions run
+# unmodified through boto3 with DYNAMODB_ENDPOINT pointed at it. It keeps the
+# tables (with their GSIs) from template.yaml, evaluates condition, filter,
+# update and projection expressions, paginates like DynamoDB (Limit, 1 MB
+# pages, segments) and accounts read/write capacity units the way the service
+# bills them. GET /_metrics returns the capacity consumed per table and
+# operation, POST /_metrics/reset clears it. With enforce_capacity (or after
+# POST /_capacity/on), tables are held to their provisioned throughput plus
+# burst_seconds of burst capacity, and throw
+# ProvisionedThroughputExceededException past it.
+
+ERROR_PREFIX = 'com.amazonaws.dynamodb.v20120810#'
+PAGE_BYTES = 1024 * 1024
+
+
+class DynamoDBError(Exception):
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def validation(message: str):
+    return DynamoDBError('ValidationException', message)
+
+
+def value_size(value) -> int:
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (int, Decimal)):
+        digits = len(Decimal(value).as_tuple().digits)
+        return (digits + 1) // 2 + 1
+    if isinstance(value, dict):
+        return 3 + sum(len(k.encode('utf-8')) + value_size(v) + 1 for k, v in value.items())
+    if isinstance(value, list):
+        return 3 + sum(value_size(v) + 1 for v in value)
+    if isinstance(value, (set, frozenset)):
+        return sum(value_size(v) for v in value)
+    return len(expressions.comparable(value))
+
+
+def item_size(item: dict) -> int:
+    if not item:
+        return 0
+    return sum(len(name.encode('utf-8')) + value_size(value) for name, value in item.items())
+
+
+def read_units(size: int, consistent: bool) -> float:
+    units = max(1, math.ceil(size / 4096))
+    return float(units) if consistent else units / 2
+
+
+def write_units(size: int) -> float:
+    return float(max(1, math.ceil(size / 1024)))
+
+
+class Index:
+    def __init__(self, name: str, hash_key: str, range_key: str = None):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.partitions = {}  # hash key -> {table key: item}
+
+    def key_of(self, item: dict):
+        if self.hash_key not in item or (self.range_key and self.range_key not in item):
+            return None
+        return expressions.comparable(item[self.hash_key])
+
+    def add(self, table_key, item: dict) -> bool:
+        partition = self.key_of(item)
+        if partition is None:
+            return False
+        self.partitions.setdefault(partition, {})[table_key] = item
+        return True
+
+    def remove(self, table_key, item: dict) -> bool:
+        partition = self.key_of(item)
+        if partition is None:
+            return False
+        items = self.partitions.get(partition, {})
+        items.pop(table_key, None)
+        if not items:
+            self.partitions.pop(partition, None)
+        return True
+
+
+class Throughput:
+    """Provisioned units per second, with up to burst_seconds of unused capacity banked."""
+
+    def __init__(self, rate: float, burst_seconds: float, clock):
+        self.rate = rate
+        self.capacity = rate * max(burst_seconds, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def exhausted(self) -> bool:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens <= 0
+
+    def spend(self, units: float):
+        self.tokens -= units
+
+
+class Table:
+    def __init__(self, name: str, hash_key: str, range_key: str = None, indexes: dict = None,
+                 read_capacity: float = None, write_capacity: float = None):
+        self.name = name
+        self.read_capacity = read_capacity
+        self.write_capacity = write_capacity
+        self.primary = Index(None, hash_key, range_key)
+        self.indexes = {n: Index(n, h, r) for n, (h, r) in (indexes or {}).items()}
+        self.items = {}
+        self.version = 0
+        self.scan_order = None
+
+    @property
+    def key_names(self) -> list:
+        return [k for k in (self.primary.hash_key, self.primary.range_key) if k]
+
+    def key_of(self, item: dict):
+        missing = [k for k in self.key_names if k not in item]
+        if missing:
+            raise validation(f'One of the required keys was not given a value: {missing[0]}')
+        return tuple(expressions.comparable(item[k]) for k in self.key_names)
+
+    def key_attributes(self, item: dict, index: Index = None) -> dict:
+        names = self.key_names + ([index.hash_key, index.range_key] if index is not None else [])
+        return {n: item[n] for n in names if n and n in item}
+
+    def index(self, name: str = None) -> Index:
+        if name is None:
+            return self.primary
+        if name not in self.indexes:
+            raise validation(f'The table does not have the specified index: {name}')
+        return self.indexes[name]
+
+    def get(self, key: dict):
+        return self.items.get(self.key_of(key))
+
+    def put(self, item: dict) -> dict:
+        """Store item and return the GSI names it was written to or removed from."""
+        table_key = self.key_of(item)
+        old = self.items.get(table_key)
+        touched = set()
+        for index in [self.primary] + list(self.indexes.values()):
+            removed = index.remove(table_key, old) if old else False
+            added = index.add(table_key, item)
+            if index.name and (removed or added):
+                touched.add(index.name)
+        self.items[table_key] = item
+        self.version += 1
+        return touched
+
+    def delete(self, key: dict) -> tuple:
+        table_key = self.key_of(key)
+        old = self.items.pop(table_key, None)
+        touched = set()
+        if old is not None:
+            for index in [self.primary] + list(self.indexes.values()):
+                if index.remove(table_key, old) and index.name:
+                    touched.add(index.name)
+            self.version += 1
+        return old, touched
+
+    def segments(self, total: int) -> list:
+        if self.scan_order is None or self.scan_order[0] != (self.version, total):
+            segments = [[] for _ in range(total)]
+            for table_key in sorted(self.items):
+                segment = zlib.crc32(repr(table_key[0]).encode()) % total
+                segments[segment].append(table_key)
+            self.scan_order = ((self.version, total), segments)
+        return self.scan_order[1]
+
+
+class Capacity:
+    """Capacity consumed by one request, split by table and index."""
+
+    def __init__(self, table: str):
+        self.table_name = table
+        self.read = 0.0
+        self.write = 0.0
+        self.table = 0.0
+        self.indexes = {}
+
+    def add(self, units: float, write: bool, index: str = None):
+        if write:
+            self.write += units
+        else:
+            self.read += units
+        if index:
+            self.indexes[index] = self.indexes.get(index, 0.0) + units
+        else:
+            self.table += units
+
+    def response(self, mode: str) -> dict:
+        consumed = {'TableName': self.table_name, 'CapacityUnits': self.read + self.write}
+        if self.read:
+            consumed['ReadCapacityUnits'] = self.read
+        if self.write:
+            consumed['WriteCapacityUnits'] = self.write
+        if mode == 'INDEXES':
+            consumed['Table'] = {'CapacityUnits': self.table}
+            if self.indexes:
+                consumed['GlobalSecondaryIndexes'] = {n: {'CapacityUnits': u} for n, u in self.indexes.items()}
+        return consumed
+
+
+class Database:
+    def __init__(self, tables: list, enforce_capacity: bool = False, burst_seconds: float = 300, clock=None):
+        from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+        self.tables = {t.name: t for t in tables}
+        self.lock = threading.RLock()
+        self.serializer = TypeSerializer()
+        self.deserializer = TypeDeserializer()
+        self.metrics = {}
+        self.burst_seconds = burst_seconds
+        self.clock = clock or time.monotonic
+        self.throughput = {}
+        self.enforce_capacity(enforce_capacity)
+
+    def enforce_capacity(self, enabled: bool):
+        """Start (with full burst buckets) or stop holding tables to their provisioned throughput."""
+        with self.lock:
+            self.throughput = {}
+            for table in self.tables.values() if enabled else []:
+                for kind, rate in (('read', table.read_capacity), ('write', table.write_capacity)):
+                    if rate:
+                        self.throughput[(table.name, kind)] = Throughput(rate, self.burst_seconds, self.clock)
+
+    # wire format
+
+    def load(self, wire: dict) -> dict:
+        return {k: self.deserializer.deserialize(v) for k, v in (wire or {}).items()}
+
+    def dump(self, item: dict) -> dict:
+        return {k: self.serializer.serialize(v) for k, v in item.items()}
+
+    def table(self, name: str) -> Table:
+        if name not in self.tables:
+            raise DynamoDBError('ResourceNotFoundException', f'Requested resource not found: Table: {name} not found')
+        return self.tables[name]
+
+    def record(self, operation: str, capacity: Capacity, items: int = 0):
+        for kind, units in (('read', capacity.read), ('write', capacity.write)):
+            throughput = self.throughput.get((capacity.table_name, kind))
+            if throughput is not None:
+                throughput.spend(units)
+        with self.lock:
+            entry = self.metrics.setdefault(capacity.table_name, {}).setdefault(
+                operation, {'calls': 0, 'items': 0, 'read_units': 0.0, 'write_units': 0.0})
+            entry['calls'] += 1
+            entry['items'] += items
+            entry['read_units'] += capacity.read
+            entry['write_units'] += capacity.write
+
+    def snapshot_metrics(self) -> dict:
+        with self.lock:
+            return json.loads(json.dumps(self.metrics))
+
+    def reset_metrics(self):
+        with self.lock:
+            self.metrics = {}
+
+    def handle(self, operation: str, request: dict) -> dict:
+        handler = getattr(self, f'op_{operation}', None)
+        if handler is None:
+            raise DynamoDBError('UnknownOperationException', f'Unsupported operation: {operation}')
+        with self.lock:
+            self.check_throughput(operation, request)
+            return handler(request)
+
+    def check_throughput(self, operation: str, request: dict):
+        kind = 'read' if operation in ('GetItem', 'Query', 'Scan', 'BatchGetItem') else 'write'
+        for table_name in [request['TableName']] if 'TableName' in request else list(request.get('RequestItems') or {}):
+            throughput = self.throughput.get((table_name, kind))
+            if throughput is not None and throughput.exhausted():
+                raise DynamoDBError('ProvisionedThroughputExceededException',
+                                    'The level of configured provisioned throughput for the table was exceeded')
+
+    # helpers
+
+    def with_capacity(self, response: dict, request: dict, capacity: Capacity) -> dict:
+        mode = request.get('ReturnConsumedCapacity', 'NONE')
+        if mode in ('TOTAL', 'INDEXES'):
+            response['ConsumedCapacity'] = capacity.response(mode)
+        return response
+
+    def check_condition(self, request: dict, item: dict):
+        expression = request.get('ConditionExpression')
+        if not expression:
+            return
+        condition = expressions.parse_condition(
+            expression, request.get('ExpressionAttributeNames'), self.load(request.get('ExpressionAttributeValues')))
+        if not expressions.evaluate(condition, item or {}):
+            raise DynamoDBError('ConditionalCheckFailedException', 'The conditional request failed')
+
+    def charge_write(self, capacity: Capacity, old: dict, new: dict, touched: set):
+        size = max(item_size(old), item_size(new))
+        capacity.add(write_units(size), write=True)
+        for index in touched:
+            capacity.add(write_units(size), write=True, index=index)
+
+    def projected(self, request: dict, item: dict) -> dict:
+        expression = request.get('ProjectionExpression')
+        if not expression:
+            return item
+        return expressions.project(item, expressions.parse_projection(expression, request.get('ExpressionAttributeNames')))
+
+    def returned(self, mode: str, old: dict, new: dict, touched_names: set = None) -> dict:
+        if mode in (None, 'NONE') or (old is None and mode.endswith('OLD')):
+            return {}
+        if mode == 'ALL_OLD':
+            return {'Attributes': self.dump(old)}
+        if mode == 'ALL_NEW':
+            return {'Attributes': self.dump(new)}
+        source = old if mode == 'UPDATED_OLD' else new
+        return {'Attributes': self.dump({k: v for k, v in (source or {}).items() if k in touched_names})}
+
+    # single item operations
+
+    def op_GetItem(self, request: dict) -> dict:
+        table = self.table(request['TableName'])
+        item = table.get(self.load(request['Key']))
+        capacity = Capacity(table.name)
+        capacity.add(read_units(item_size(item), request.get('ConsistentRead', False)), write=False)
+        self.record('GetItem', capacity, int(item is not None))
+        response = {'Item': self.dump(self.projected(request, item))} if item is not None else {}
+        return self.with_capacity(response, request, capacity)
+
+    def op_PutItem(self, request: dict) -> dict:
+        table = self.table(request['TableName'])
+        item = self.load(request['Item'])
+        old = table.get(item)
+        self.check_condition(request, old)
+        touched = table.put(item)
+        capacity = Capacity(table.name)
+        self.charge_write(capacity, old, item, touched)
+        self.record('PutItem', capacity, 1)
+        return self.with_capacity(self.returned(request.get('ReturnValues'), old, item), request, capacity)
+
+    def op_UpdateItem(self, request: dict) -> dict:
+        table = self.table(request['TableName'])
+        key = self.load(request['Key'])
+        old = table.get(key)
+        self.check_condition(request, old)
+        values = self.load(request.get('ExpressionAttributeValues'))
+        actions = expressions.parse_update(request.get('UpdateExpression', ''), request.get('ExpressionAttributeNames'), values)
+        new = expressions.apply_update(actions, old or key)
+        for name in table.key_names:
+            if expressions.comparable(new.get(name)) != expressions.comparable(key[name]):
+                raise validation(f'Cannot update attribute {name}. This attribute is part of the key')
+        touched = table.put(new)
+        capacity = Capacity(table.name)
+        self.charge_write(capacity, old, new, touched)
+        self.record('UpdateItem', capacity, 1)
+        changed = {action[1][1][0] for action in actions}
+        return self.with_capacity(self.returned(request.get('ReturnValues'), old, new, changed), request, capacity)
+
+    def op_DeleteItem(self, request: dict) -> dict:
+        table = self.table(request['TableName'])
+        key = self.load(request['Key'])
+        self.check_condition(request, table.get(key))
+        old, touched = table.delete(key)
+        capacity = Capacity(table.name)
+        self.charge_write(capacity, old, None, touched)
+        self.record('DeleteItem', capacity, int(old is not None))
+        return self.with_capacity(self.returned(request.get('ReturnValues'), old, None), request, capacity)
+
+    # batches
+
+    def op_BatchWriteItem(self, request: dict) -> dict:
+        consumed = []
+        for table_name, requests in request['RequestItems'].items():
+            table = self.table(table_name)
+            if len(requests) > 25:
+                raise validation('Too many items requested for the BatchWriteItem call')
+            capacity = Capacity(table.name)
+            for write in requests:
+                if 'PutRequest' in write:
+                    item = self.load(write['PutRequest']['Item'])
+                    old = table.get(item)
+                    touched = table.put(item)
+                    self.charge_write(capacity, old, item, touched)
+                else:
+                    old, touched = table.delete(self.load(write['DeleteRequest']['Key']))
+                    self.charge_write(capacity, old, None, touched)
+            self.record('BatchWriteItem', capacity, len(requests))
+            consumed.append(capacity)
+        return self.batch_capacity({'UnprocessedItems': {}}, request, consumed)
+
+    def op_BatchGetItem(self, request: dict) -> dict:
+        responses = {}
+        consumed = []
+        for table_name, keys_and_attributes in request['RequestItems'].items():
+            table = self.table(table_name)
+            capacity = Capacity(table.name)
+            found = []
+            consistent = keys_and_attributes.get('ConsistentRead', False)
+            for key in keys_and_attributes['Keys']:
+                item = table.get(self.load(key))
+                capacity.add(read_units(item_size(item), consistent), write=False)
+                if item is not None:
+                    found.append(self.dump(self.projected(keys_and_attributes, item)))
+            self.record('BatchGetItem', capacity, len(found))
+            responses[table_name] = found
+            consumed.append(capacity)
+        return self.batch_capacity({'Responses': responses, 'UnprocessedKeys': {}}, request, consumed)
+
+    def batch_capacity(self, response: dict, request: dict, consumed: list) -> dict:
+        mode = request.get('ReturnConsumedCapacity', 'NONE')
+        if mode in ('TOTAL', 'INDEXES'):
+            response['ConsumedCapacity'] = [c.response(mode) for c in consumed]
+        return response
+
+    # reads over many items
+
+    def read_page(self, request: dict, table: Table, index: Index, keys, operation: str) -> dict:
+        """Evaluate items in key order up to Limit or 1 MB, apply the filter and charge capacity."""
+        names = request.get('ExpressionAttributeNames')
+        values = self.load(request.get('ExpressionAttributeValues'))
+        condition = expressions.parse_condition(request['FilterExpression'], names, values) \
+            if request.get('FilterExpression') else None
+        limit = request.get('Limit')
+        items = []
+        scanned = 0
+        size = 0
+        last = None
+        for item in keys:
+            if (limit and scanned >= limit) or size >= PAGE_BYTES:
+                break
+            scanned += 1
+            size += item_size(item)
+            last = item
+            if condition is None or expressions.evaluate(condition, item):
+                items.append(item)
+        else:
+            last = None
+
+        capacity = Capacity(table.name)
+        capacity.add(read_units(size, request.get('ConsistentRead', False)), write=False, index=index.name)
+        self.record(operation, capacity, scanned)
+
+        response = {'Count': len(items), 'ScannedCount': scanned}
+        if request.get('Select') != 'COUNT':
+            response['Items'] = [self.dump(self.projected(request, item)) for item in items]
+        if last is not None:
+            response['LastEvaluatedKey'] = self.dump(table.key_attributes(last, index if index.name else None))
+        return self.with_capacity(response, request, capacity)
+
+    def op_Query(self, request: dict) -> dict:
+        table = self.table(request['TableName'])
+        index = table.index(request.get('IndexName'))
+        names = request.get('ExpressionAttributeNames')
+        values = self.load(request.get('ExpressionAttributeValues'))
+        key_condition = expressions.parse_condition(request['KeyConditionExpression'], names, values)
+        partition = self.partition_value(key_condition, index)
+        if partition is None:
+            raise validation(f'Query condition missed key schema element: {index.hash_key}')
+
+        candidates = index.partitions.get(partition, {})
+        ordered = sorted(
+            (item for item in candidates.values() if expressions.evaluate(key_condition, item)),
+            key=lambda item: (expressions.comparable(item[index.range_key]) if index.range_key else 0,
+                              table.key_of(item)),
+            reverse=not request.get('ScanIndexForward', True)
+        )
+        start = request.get('ExclusiveStartKey')
+        if start:
+            start_key = table.key_of(self.load(start))
+            for position, item in enumerate(ordered):
+                if table.key_of(item) == start_key:
+                    ordered = ordered[position + 1:]
+                    break
+        return self.read_page(request, table, index, ordered, 'Query')
+
+    def partition_value(self, node: tuple, index: Index):
+        if node[0] == 'and':
+            found = self.partition_value(node[1], index)
+            return found if found is not None else self.partition_value(node[2], index)
+        if node[0] == 'compare' and node[1] == '=':
+            for path, value in ((node[2], node[3]), (node[3], node[2])):
+                if path[0] == 'path' and path[1] == (index.hash_key,) and value[0] == 'value':
+                    return expressions.comparable(value[1])
+        if node[0] == 'and' or node[0] == 'compare':
+            return None
+        raise validation('Query key condition not supported')
+
+    def op_Scan(self, request: dict) -> dict:
+        table = self.table(request['TableName'])
+        index = table.index(request.get('IndexName'))
+        total = request.get('TotalSegments', 1)
+        segment = request.get('Segment', 0)
+        if not 0 <= segment < total:
+            raise validation('Segment must be less than TotalSegments')
+        keys = table.segments(total)[segment]
+        start = request.get('ExclusiveStartKey')
+        if start:
+            start_key = table.key_of(self.load(start))
+            keys = [k for k in keys if k > start_key]
+        items = (table.items[k] for k in keys)
+        if index.name:
+            items = (item for item in items if index.key_of(item) is not None)
+        return self.read_page(request, table, index, items, 'Scan')
+
+    # table metadata
+
+    def op_DescribeTable(self, request: dict) -> dict:
+        table = self.table(request['TableName'])
+        key_schema = [{'AttributeName': table.primary.hash_key, 'KeyType': 'HASH'}]
+        if table.primary.range_key:
+            key_schema.append({'AttributeName': table.primary.range_key, 'KeyType': 'RANGE'})
+        return {'Table': {
+            'TableName': table.name,
+            'TableStatus': 'ACTIVE',
+            'KeySchema': key_schema,
+            'ItemCount': len(table.items),
+            'TableSizeBytes': sum(item_size(item) for item in table.items.values()),
+        }}
+
+    def op_ListTables(self, request: dict) -> dict:
+        return {'TableNames': sorted(self.tables)}
+
+
+class LocalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def reply(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-amz-json-1.0')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/_metrics':
+            return self.reply(200, self.server.database.snapshot_metrics())
+        self.reply(404, {})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path == '/_metrics/reset':
+            self.server.database.reset_metrics()
+            return self.reply(200, {})
+        if self.path in ('/_capacity/on', '/_capacity/off'):
+            self.server.database.enforce_capacity(self.path.endswith('on'))
+            return self.reply(200, {})
+
+        operation = self.headers.get('X-Amz-Target', '').split('.')[-1]
+        try:
+            response = self.server.database.handle(operation, json.loads(body or b'{}'))
+        except DynamoDBError as e:
+            return self.reply(400, {'__type': ERROR_PREFIX + e.code, 'message': e.message})
+        except expressions.ExpressionError as e:
+            return self.reply(400, {'__type': ERROR_PREFIX + 'ValidationException', 'message': str(e)})
+        self.reply(200, response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def tables_from_template(template: dict) -> list:
+    """Table definitions (AWS::DynamoDB::Table and AWS::Serverless::SimpleTable) in a SAM template."""
+    tables = []
+    for logical_id, resource in template['Resources'].items():
+        properties = resource.get('Properties') or {}
+        name = properties.get('TableName') if isinstance(properties.get('TableName'), str) else logical_id
+        throughput = properties.get('ProvisionedThroughput') or {}
+        capacity = {'read_capacity': throughput.get('ReadCapacityUnits'),
+                    'write_capacity': throughput.get('WriteCapacityUnits')}
+        if resource.get('Type') == 'AWS::Serverless::SimpleTable':
+            primary = properties.get('PrimaryKey') or {'Name': 'id'}
+            tables.append(Table(name, primary['Name'], **capacity))
+        elif resource.get('Type') == 'AWS::DynamoDB::Table':
+            hash_key, range_key = key_schema(properties['KeySchema'])
+            indexes = {gsi['IndexName']: key_schema(gsi['KeySchema'])
+                       for gsi in properties.get('GlobalSecondaryIndexes') or []}
+            tables.append(Table(name, hash_key, range_key, indexes, **capacity))
+    return tables
+
+
+def key_schema(schema: list) -> tuple:
+    keys = {k['KeyType']: k['AttributeName'] for k in schema}
+    return keys['HASH'], keys.get('RANGE')
+
+
+def create_server(tables: list, host: str, port: int, options: dict) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), LocalHandler)
+    server.daemon_threads = True
+    server.database = Database(tables, **options)
+    return server
+
+
+def serve(tables: list, host: str, port: int, options: dict, ready):
+    server = create_server(tables, host, port, options)
+    ready.send(server.server_address[:2])
+    server.serve_forever()
+
+
+class LocalDynamoDB:
+    """Runs the in-memory DynamoDB in a child process (default) or a thread of this one.
+
+    A separate process keeps the server's CPU time and allocations out of the
+    measurements of the code under test.
+    """
+
+    def __init__(self, tables: list, host: str = '127.0.0.1', port: int = 0, process: bool = True,
+                 enforce_capacity: bool = False, burst_seconds: float = 300):
+        self.tables = tables
+        self.host = host
+        self.port = port
+        self.process = process
+        self.options = {'enforce_capacity': enforce_capacity, 'burst_seconds': burst_seconds}
+        self.address = None
+        self.runner = None
+        self.server = None
+
+    @property
+    def endpoint_url(self):
+        host, port = self.address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        if self.process:
+            receive, send = multiprocessing.Pipe(duplex=False)
+            self.runner = multiprocessing.get_context('fork').Process(
+                target=serve, args=(self.tables, self.host, self.port, self.options, send), daemon=True)
+            self.runner.start()
+            self.address = receive.recv()
+        else:
+            self.server = create_server(self.tables, self.host, self.port, self.options)
+            self.address = self.server.server_address[:2]
+            self.runner = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+            self.runner.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        elif self.runner is not None:
+            self.runner.terminate()
+            self.runner.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def metrics(self) -> dict:
+        from urllib.request import urlopen
+
+        with urlopen(f'{self.endpoint_url}/_metrics') as response:
+            return json.loads(response.read())
+
+    def reset_metrics(self):
+        self.post('/_metrics/reset')
+
+    def enforce_capacity(self, enabled: bool = True):
+        self.post('/_capacity/on' if enabled else '/_capacity/off')
+
+    def post(self, path: str):
+        from urllib.request import Request, urlopen
+
+        urlopen(Request(f'{self.endpoint_url}{path}', data=b'', method='POST')).close()
@@ -0,0 +1,67 @@
+"""Encode a 10k-item DynamoDB-style payload with the standard encoder and common.encoding.
+
+    product-api$ python -m benchmarks.serialization --items 10000 --repeat 20
+"""
+import argparse
+import json
+import time
+from decimal import Decimal
+
+import benchmarks  # noqa: F401  sets up sys.path
+from common import encoding
+
+
+def make_items(count: int) -> list:
+    return [
+        {
+            'id': f'{i:08d}-0000-0000-0000-000000000000',
+            'itemName': f'item {i}',
+            'description': 'a large brown pear ' * 3,
+            'price': Decimal(f'{i % 1000}.{i % 100:02d}'),
+            'stock': Decimal(i % 50),
+            'isActive': 'True',
+            'tags': {'fruit', 'produce'},
+            'dateAdded': str(1700000000 + i),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_default(value):
+    # the per-object fallback handlers would otherwise need around plain json.dumps
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(type(value).__name__)
+
+
+def measure(label: str, encode, items: list, repeat: int):
+    size = len(encode(items))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encode(items)
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f'{label:<32} {elapsed * 1000:8.2f}ms  {len(items) / elapsed:12,.0f} items/s  '
+          f'{size / elapsed / 1e6:8.1f} MB/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    backend = 'orjson' if encoding.orjson is not None else 'json'
+    measure('json.dumps + default', lambda v: json.dumps(v, default=legacy_default).encode(), items, args.repeat)
+    measure(f'encoding.dumps ({backend})', encoding.dumps_bytes, items, args.repeat)
+    measure(f'encoding.iter_dumps ({backend})', lambda v: b''.join(encoding.iter_dumps(v)), items, args.repeat)
+    if encoding.orjson is not None:
+        orjson, encoding.orjson = encoding.orjson, None
+        measure('encoding.dumps (json)', encoding.dumps_bytes, items, args.repeat)
+        encoding.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal DynamoDB JSON-protocol endpoint. It accepts every call and returns an
+# empty but well-formed reply, which is enough to measure what the client side
+# (session, signing, connection setup) costs per invocation.
+
+EMPTY_RESPONSES = {
+    'Query': {'Items': [], 'Count': 0, 'ScannedCount': 0},
+    'Scan': {'Items': [], 'Count': 0, 'ScannedCount': 0},
+    'BatchWriteItem': {'UnprocessedItems': {}},
+    'BatchGetItem': {'Responses': {}, 'UnprocessedKeys': {}},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        operation = self.headers.get('X-Amz-Target', '').split('.')[-1]
+        self.server.connections.add(self.client_address)
+
+        payload = json.dumps(EMPTY_RESPONSES.get(operation, {})).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-amz-json-1.0')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubDynamoDB:
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), StubHandler)
+        self.server.daemon_threads = True
+        self.server.connections = set()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def connections_opened(self):
+        return len(self.server.connections)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,67 @@
+import os
+from datetime import datetime, timezone
+
+import logging
+
+from common import export, logs
+
+archive_bucket = os.environ.get('ARCHIVE_BUCKET')
+archive_prefix = os.environ.get('ARCHIVE_PREFIX', 'messages')
+s3_endpoint = os.environ.get('S3_ENDPOINT')
+# DynamoDB's own deletes of expired items; the stream event's FilterCriteria keep only these
+TTL_PRINCIPAL = 'dynamodb.amazonaws.com'
+
+logger = logging.getLogger()
+logs.configure()
+
+# one S3 client per container
+_destination = None
+
+
+def destination():
+    global _destination
+    if _destination is None:
+        _destination = export.S3Destination(archive_bucket, archive_prefix, endpoint_url=s3_endpoint)
+    return _destination
+
+
+def is_expired(record: dict) -> bool:
+    identity = record.get('userIdentity') or {}
+    return record.get('eventName') == 'REMOVE' and identity.get('type') == 'Service' \
+        and identity.get('principalId') == TTL_PRINCIPAL
+
+
+def old_image(record: dict) -> dict:
+    from boto3.dynamodb.types import TypeDeserializer
+
+    deserializer = TypeDeserializer()
+    return {key: deserializer.deserialize(value) for key, value in record['dynamodb']['OldImage'].items()}
+
+
+def archive_name(records: list) -> str:
+    """<day>/<first sequence number>-<last>.ndjson.gz: a retried batch overwrites its own file."""
+    first, last = records[0]['dynamodb'], records[-1]['dynamodb']
+    day = datetime.fromtimestamp(first['ApproximateCreationDateTime'], timezone.utc).strftime('%Y/%m/%d')
+    return f'{day}/{first["SequenceNumber"]}-{last["SequenceNumber"]}.ndjson.gz'
+
+
+def archive(records: list, target) -> dict:
+    """Write the items TTL removed in records to one gzip NDJSON file under target."""
+    expired = [record for record in records if is_expired(record) and record['dynamodb'].get('OldImage')]
+    if not expired:
+        return {'archived': 0}
+    name = archive_name(expired)
+    items = [old_image(record) for record in expired]
+    size = export.write_part(target, name, items)
+    logger.info('Archived %d expired messages to %s/%s (%d bytes)', len(items), target, name, size)
+    return {'archived': len(items), 'file': name, 'bytes': size}
+
+
+def lambda_handler(event, context):
+    logs.start(event, context)
+    logger.debug('Event: %s', logs.payload(event))
+    records = event.get('Records') or []
+    # an exception fails the batch: the stream retries it (bisecting it) before anything is lost
+    result = archive(records, destination())
+    result['records'] = len(records)
+    return result
@@ -1,19 +1,32 @@
+import base64
 import http
+import math
 
-import boto3
 import os
-import json
-import uuid
 from datetime import datetime
 
 import logging
 
+from common import batch, dynamodb, encoding, logs, metrics, pagination, recurrence, responses, retention, schedule, throttle
+from common.cache import TTLCache
+from common.router import Router
+
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logs.configure()
 
 table_name = os.environ.get('TABLE', 'Messages')
 region = os.environ.get('REGION', 'us-west-2')
 messages_path = '/messages'
+batch_path = '/messages/batch'
+batch_max_messages = int(os.environ.get('BATCH_MAX_MESSAGES', 1000))
+THROTTLED_ERRORS = {'CapacityExceeded', 'Unprocessed'} | throttle.THROTTLE_CODES
+
+# GET /messages/{owner} pages, kept per container and dropped on local writes
+owner_cache = TTLCache(
+    ttl=float(os.environ.get('OWNER_CACHE_TTL_SECONDS', 10)),
+    max_entries=int(os.environ.get('OWNER_CACHE_MAX_ENTRIES', 256)),
+    max_bytes=int(os.environ.get('OWNER_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+)
 resource = '/messages/{owner}'
 
 
@@ -26,11 +39,18 @@ def build_response(status_code, body=None):
         }
     }
     if body is not None:
-        response['body'] = json.dumps(body)
+        response['body'] = encoding.dumps(body)
+    return response
+
+
+def throttled_response(e: Exception):
+    # capacity ran out before the deadline: tell the client to come back rather than fail
+    response = build_response(http.HTTPStatus.SERVICE_UNAVAILABLE, {'msg': 'Too many requests, retry later'})
+    response['headers']['Retry-After'] = str(math.ceil(getattr(e, 'retry_after', 1)))
     return response
 
 
-def parse_input(event: json) -> dict:
+def parse_input(event: dict) -> dict:
     operations = {
         'POST',
         'GET',
@@ -43,26 +63,33 @@ def parse_input(event: json) -> dict:
     http_method = event['httpMethod'] if event.get('httpMethod') else None
     path_params = event['pathParameters'] if event.get('pathParameters') else None  # {'owner': 'ivan'}
     resource = event['resource'] if event.get('resource') else None
+    query_params = event['queryStringParameters'] if event.get('queryStringParameters') else {}
 
     if http_method == None or http_method not in operations or path == None:
         msg = {'msg': f'Unsupported http method:{http_method} and/or path'}
         return build_response(http.HTTPStatus.BAD_REQUEST, msg)
 
     if body is not None:
-        body = json.loads(body)
+        if event.get('isBase64Encoded'):
+            # the API passes every media type through as binary, see BinaryMediaTypes
+            body = base64.b64decode(body)
+        body = encoding.loads(body)
 
     return {
         "body": body,
         'path': path,
         'http_method': http_method,
         'path_param': path_params,
-        'resource': resource
+        'resource': resource,
+        'query_params': query_params
     }
 
 
-def create_message(body: dict, table):
+def build_message_item(body: dict, message_id: str = None) -> dict:
+    import uuid
+
     params = {
-        'id': str(uuid.uuid4()),
+        'id': message_id or str(uuid.uuid4()),
         'message': body['message'],
         'owner': body['owner'],
         'display_name': body['display_name'],
@@ -73,33 +100,114 @@ def create_message(body: dict, table):
         'dateAdded': str(datetime.timestamp(datetime.now()))
     }
     params['send_year_month_day'] = get_send_year_month_day(body['send_time'])
+    params[schedule.PENDING_KEY] = schedule.pending_key(params['send_year_month_day'], params['id'])
+    if body.get('recurrence') is not None:
+        # one row per series: the scanner writes each next occurrence after sending this one
+        params['recurrence'] = recurrence.parse(body['recurrence'], body['send_time'])
+        params['series_id'] = params['id']
+        params['occurrence'] = 1
     params['send_time']+=('Z')
+    return params
+
+
+def create_message(body: dict, table):
+    try:
+        params = build_message_item(body)
+    except KeyError as e:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': f'Missing field: {e.args[0]}'})
+    except ValueError as e:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': str(e)})
 
     try:
         response = table.put_item(
             TableName=table_name,
             Item=params
         )
-        logger.info(f'AWS response:{response}')
+        logger.debug('PutItem response: %s', logs.payload(response))
     except Exception as e:
-        build_response(http.HTTPStatus.BAD_REQUEST, e)
+        logger.error(e)
+        if throttle.is_throttle(e):
+            return throttled_response(e)
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': 'Unable to create message'})
 
-    logger.info(f'Successfully posted new message to db:{table_name}: {params}')
+    logger.info('Posted message %s to %s', params['id'], table_name)
+    logger.debug('Message: %s', logs.payload(params))
+    invalidate_owner(params['owner'])
 
     return build_response(http.HTTPStatus.CREATED, body)
 
 
-def get_all_messages(table):
+def create_messages_batch(body, resource):
+    messages = body.get('messages') if isinstance(body, dict) else body
+    if not isinstance(messages, list) or not messages:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': 'Need a non-empty list of messages'})
+    if len(messages) > batch_max_messages:
+        msg = {'msg': f'Too many messages: {len(messages)}. Max is {batch_max_messages}'}
+        return build_response(http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE, msg)
+
+    results = []
+    items = []
+    for index, message in enumerate(messages):
+        try:
+            item = build_message_item(message)
+        except KeyError as e:
+            results.append({'index': index, 'status': 'rejected', 'error': f'Missing field: {e.args[0]}'})
+            continue
+        except (TypeError, ValueError) as e:
+            results.append({'index': index, 'status': 'rejected', 'error': str(e)})
+            continue
+        results.append({'index': index, 'id': item['id'], 'status': 'created'})
+        items.append(item)
+
+    failed = batch.write_items(resource, table_name, items)
+    failed_ids = {item['id']: error for item, error in failed}
+    for result in results:
+        if result.get('id') in failed_ids:
+            result['status'] = 'failed'
+            result['error'] = failed_ids[result['id']]
+
+    created = sum(1 for result in results if result['status'] == 'created')
+    logger.info('Batch posted %d/%d messages to %s', created, len(messages), table_name)
+    for owner in {item['owner'] for item in items if item['id'] not in failed_ids}:
+        invalidate_owner(owner)
+
+    if len(failed) == len(messages) and all(error in THROTTLED_ERRORS for _, error in failed):
+        return throttled_response(throttle.CapacityExceeded(table_name, 'write'))
+    status = http.HTTPStatus.CREATED if created == len(messages) else http.HTTPStatus.MULTI_STATUS
+    return build_response(status, {'created': created, 'results': results})
+
+
+def get_all_messages(input, table):
+    from boto3.dynamodb.conditions import Attr
+
+    query_params = input['query_params']
+    try:
+        params = {'Limit': pagination.parse_limit(query_params.get('limit'))}
+        # deleted messages wait for their TTL in the table; hidden unless asked for, as in build_owner_query
+        params['FilterExpression'] = Attr('isDeleted').eq(parse_flag('isDeleted', query_params.get('isDeleted', 'False')))
+        params.update(pagination.projection(pagination.parse_fields(query_params.get('fields'))))
+        start_key = pagination.decode_cursor(query_params.get('cursor'))
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+    except ValueError as e:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': str(e)})
+
     try:
-        # total table scan
-        response = table.scan()
+        # one bounded page of the table, the caller follows next_cursor
+        response = table.scan(**params)
     except Exception as e:
-        build_response(http.HTTPStatus.BAD_REQUEST, e)
+        logger.error(e)
+        if throttle.is_throttle(e):
+            return throttled_response(e)
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': 'Unable to read messages'})
 
-    return build_response(http.HTTPStatus.OK, response['Items'])
+    return build_response(http.HTTPStatus.OK, pagination.page(response))
 
 
 def put_message(input, table):
+    from boto3.dynamodb.conditions import Attr
+    from botocore.exceptions import ClientError
+
     body = input['body'] if input.get('body') else None
     message_id = input['body']['id'] if input.get('body').get('id') else None
     params = {
@@ -108,27 +216,54 @@ def put_message(input, table):
     try:
         if message_id:
             symd = get_send_year_month_day(body['send_time'])
-
-            response = table.update_item(
-                Key=params,
-                UpdateExpression="set message = :m, outgoing_phone = :o, send_time = :s, send_year_month_day = :symd, display_name= :n",
-                ExpressionAttributeValues={
-                    ":m": body['message'],
-                    ":o": body['outgoing_phone'],
-                    ":s": body['send_time']+'Z',
-                    ":symd": symd,
-                    ":n": body['display_name']
-                },
-                ReturnValues="UPDATED_NEW"
-            )
-
-            logger.info(f'Updated message: {input}')
+            update_expression = "set message = :m, outgoing_phone = :o, send_time = :s, send_year_month_day = :symd, display_name= :n"
+            values = {
+                ":m": body['message'],
+                ":o": body['outgoing_phone'],
+                ":s": body['send_time']+'Z',
+                ":symd": symd,
+                ":n": body['display_name']
+            }
+
+            try:
+                # still pending: move its pending index entry along with send_time
+                response = table.update_item(
+                    Key=params,
+                    UpdateExpression=update_expression + f", {schedule.PENDING_KEY} = :p",
+                    ConditionExpression=Attr(schedule.PENDING_KEY).exists() & Attr('claimed_at').not_exists(),
+                    ExpressionAttributeValues=dict(values, **{":p": schedule.pending_key(symd, message_id)}),
+                    ReturnValues="ALL_NEW"
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                # already sent, or being sent: edit it without putting it back in the pending index
+                response = table.update_item(
+                    Key=params,
+                    UpdateExpression=update_expression,
+                    # an unknown id is not found, as for DELETE, rather than created half-filled
+                    ConditionExpression=Attr('id').exists(),
+                    ExpressionAttributeValues=values,
+                    ReturnValues="ALL_NEW"
+                )
+
+            logger.info('Updated message %s', message_id)
+            logger.debug('Update: %s', logs.payload(body))
+            invalidate_owner(response.get('Attributes', {}).get('owner'))
             return build_response(http.HTTPStatus.OK, f'Message updated: {message_id}')
     except Exception as e:
-        build_response(http.HTTPStatus.BAD_REQUEST, "Bad Request")
+        if isinstance(e, ClientError) and e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return build_response(http.HTTPStatus.NOT_FOUND, {'msg': f'Message {message_id} not found'})
+        logger.error(e)
+        if throttle.is_throttle(e):
+            return throttled_response(e)
+        return build_response(http.HTTPStatus.BAD_REQUEST, "Bad Request")
 
 
 def delete_message(input, table):
+    from boto3.dynamodb.conditions import Attr
+    from botocore.exceptions import ClientError
+
     message_id = input['body']['id'] if input.get('body').get('id') else None
 
     params = {
@@ -136,30 +271,122 @@ def delete_message(input, table):
     }
 
     try:
-        response = table.delete_item(
-            Key=params
-        )
+        if retention.deleted_days is None:
+            # kept forever otherwise: deleting the item also drops it from the pending index
+            response = table.delete_item(
+                Key=params,
+                ConditionExpression=Attr('id').exists(),
+                ReturnValues='ALL_OLD'
+            )
+        else:
+            # soft delete: out of the pending index now, removed (and archived) by TTL later
+            ttl, names, values = retention.ttl_update(retention.deleted_days)
+            response = table.update_item(
+                Key=params,
+                UpdateExpression=f"set isDeleted = :d{ttl} remove {schedule.PENDING_KEY}",
+                ConditionExpression=Attr('id').exists(),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=dict(values, **{":d": "True"}),
+                ReturnValues='ALL_NEW'
+            )
+        invalidate_owner(response.get('Attributes', {}).get('owner'))
         return build_response(http.HTTPStatus.OK, f'Item deleted {message_id}')
-    except:
+    except Exception as e:
+        if isinstance(e, ClientError) and e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return build_response(http.HTTPStatus.NOT_FOUND, {'msg': f'Message {message_id} not found'})
         logger.error(
-            "Couldn't delete item %s in table %s.",
-            message_id, table_name)
+            "Couldn't delete item %s in table %s: %s",
+            message_id, table_name, e)
+        if throttle.is_throttle(e):
+            return throttled_response(e)
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': f'Unable to delete message {message_id}'})
+
+
+def parse_send_time(value: str) -> str:
+    try:
+        datetime_object = datetime.strptime(value.rstrip('Z'), '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        raise ValueError(f'Invalid send_time bound: {value}. Need YYYY-MM-DDTHH:MM:SS')
+    return datetime_object.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_flag(name: str, value: str) -> str:
+    flag = value.capitalize()
+    if flag not in ('True', 'False'):
+        raise ValueError(f'Invalid {name}: {value}. Need True or False')
+    return flag
+
+
+def build_owner_query(owner: str, query_params: dict) -> dict:
+    from boto3.dynamodb.conditions import Attr, Key
+
+    key_condition = Key('owner').eq(owner)
+    send_from = query_params.get('from')
+    send_to = query_params.get('to')
+    if send_from and send_to:
+        key_condition &= Key('send_time').between(parse_send_time(send_from), parse_send_time(send_to))
+    elif send_from:
+        key_condition &= Key('send_time').gte(parse_send_time(send_from))
+    elif send_to:
+        key_condition &= Key('send_time').lte(parse_send_time(send_to))
+
+    # deleted messages wait for their TTL in the table; hidden unless asked for
+    flags = dict({'isDeleted': 'False'}, **{flag: query_params[flag] for flag in ('sent', 'isDeleted')
+                                           if query_params.get(flag)})
+    filter_expression = None
+    for flag, value in flags.items():
+        condition = Attr(flag).eq(parse_flag(flag, value))
+        filter_expression = condition if filter_expression is None else filter_expression & condition
+
+    order = query_params.get('order', 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'Invalid order: {order}. Need asc or desc')
 
+    params = {
+        'IndexName': 'owner-send_time-index',
+        'KeyConditionExpression': key_condition,
+        'ScanIndexForward': order == 'asc',
+        'Limit': pagination.parse_limit(query_params.get('limit'))
+    }
+    if filter_expression is not None:
+        params['FilterExpression'] = filter_expression
+    params.update(pagination.projection(pagination.parse_fields(query_params.get('fields'))))
+    start_key = pagination.decode_cursor(query_params.get('cursor'))
+    if start_key:
+        params['ExclusiveStartKey'] = start_key
+    return params
 
-def get_messages_by_user(event, table):
-    owner = event['pathParameters']['owner']
+
+def invalidate_owner(owner: str):
+    if owner:
+        owner_cache.invalidate(lambda key: key[0] == owner)
+
+
+def get_messages_by_user(input, table):
+    owner = input['path_param'].get('owner') if input.get('path_param') else None
 
     if owner:
-        # query secondary index for all messages
         try:
-            response = table.query(
-                IndexName='owner-send_time-index',
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('owner').eq(owner)
-            )
-            logger.info(f'Updated message: {response["Items"]}')
-        except Exception as e:
-            logger.error(e)
-        return build_response(http.HTTPStatus.OK, response['Items'])
+            params = build_owner_query(owner, input['query_params'])
+        except ValueError as e:
+            return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': str(e)})
+
+        cache_key = (owner, tuple(sorted(input['query_params'].items())))
+        page = owner_cache.get(cache_key)
+        if page is None:
+            # query secondary index for the requested slice of the owner's messages
+            try:
+                response = table.query(**params)
+                logger.info('Found %d messages for %s', len(response['Items']), owner)
+            except Exception as e:
+                logger.error(e)
+                if throttle.is_throttle(e):
+                    return throttled_response(e)
+                return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': 'Unable to read messages'})
+            page = pagination.page(response)
+            owner_cache.set(cache_key, page)
+        logger.debug('Owner cache stats: %s', logs.lazy(owner_cache.stats))
+        return build_response(http.HTTPStatus.OK, page)
     else:
         return build_response(http.HTTPStatus.BAD_REQUEST, 'Missing owner')
 
@@ -167,39 +394,50 @@ def get_messages_by_user(event, table):
 def get_send_year_month_day(date: str) -> str:
     try:
         datetime_object = datetime.strptime(date, '%Y-%m-%dT%H:%M:%S')
-        send_year_month_day = datetime_object.strftime("%Y-%m-%d")
-        return send_year_month_day
-    except:
-        return build_response(http.HTTPStatus.BAD_REQUEST,
-                              "incorrectly formatted datetime. Need YYYY-MM-DDTHH:MM:SS")
+    except (TypeError, ValueError):
+        raise ValueError("incorrectly formatted datetime. Need YYYY-MM-DDTHH:MM:SS")
+    send_year_month_day = datetime_object.strftime("%Y-%m-%d")
+    return send_year_month_day
 
 
 def lambda_handler(event, context):
-    logger.info(event)
+    correlation_id = logs.start(event, context)
+    # DynamoDB waits and retries stop short of the function timeout
+    throttle.start(context)
+    route = f'{event.get("httpMethod")} {event.get("resource") or event.get("path")}'
+    logger.info('Request %s', route)
+    logger.debug('Event: %s', logs.payload(event))
+    # consumed capacity and latency of the DynamoDB calls, totalled for this request
+    with metrics.invocation(context, route=route, correlationId=correlation_id):
+        response = handle_request(event)
+    # ETag / 304 and gzip or br compression, based on the request headers
+    response = responses.negotiate(response, event)
+    response['headers'] = dict(response.get('headers') or {}, **{'X-Correlation-Id': correlation_id})
+    return response
+
+
+def messages_table():
+    return dynamodb.get_table(table_name, region)
+
+
+# routes are registered once per container and looked up by method + resource
+router = Router()
+router.add('POST', batch_path, lambda input: create_messages_batch(input['body'], dynamodb.get_resource(region)),
+           requires_body=True)
+router.add('POST', messages_path, lambda input: create_message(input['body'], messages_table()), requires_body=True)
+router.add('GET', resource, lambda input: get_messages_by_user(input, messages_table()))
+router.add('GET', messages_path, lambda input: get_all_messages(input, messages_table()))
+router.add('PUT', messages_path, lambda input: put_message(input, messages_table()), requires_body=True)
+router.add('DELETE', messages_path, lambda input: delete_message(input, messages_table()), requires_body=True)
+
+
+def handle_request(event):
     input = parse_input(event)
+    if 'statusCode' in input:
+        return input
 
-    messages_table = boto3.resource(
-        'dynamodb',
-        region_name=region
-    )
-
-    table = messages_table.Table(table_name)
-
-    # post
-    if input['body'] and input['path'] == messages_path and input['http_method'] == 'POST':
-        return create_message(input['body'], table)
-    # get by user
-    elif input['resource'] == resource and input['http_method'] == 'GET':
-        return get_messages_by_user(event, table)
-    # get all
-    elif input['path'] == messages_path and input['http_method'] == 'GET':
-        return get_all_messages(table)
-    # put
-    elif input['path'] == messages_path and input['http_method'] == 'PUT' and input['body']:
-        return put_message(input, table)
-    # delete
-    elif input['path'] == messages_path and input['http_method'] == 'DELETE':
-        return delete_message(input, table)
-    else:
-        msg = {'msg': f'Unsupported endpoint invocations: {json.dumps(event)}'}
+    response = router.dispatch(input)
+    if response is None:
+        msg = {'msg': f'Unsupported endpoint invocations: {encoding.dumps(event)}'}
         return build_response(http.HTTPStatus.BAD_REQUEST, msg)
+    return response
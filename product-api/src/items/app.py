@@ -0,0 +1,442 @@
+import base64
+import http
+import math
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+import logging
+
+from common import batch, dynamodb, encoding, logs, metrics, pagination, throttle
+from common.router import Router
+
+logger = logging.getLogger()
+logs.configure()
+
+# One function for the item catalog: reads by id list and bulk writes, on the
+# container's warm DynamoDB client. Every bulk endpoint answers per item, so a
+# catalog sync is a few calls of up to BATCH_MAX_ITEMS items.
+#
+# Catalog listings query the isActive/price index and never scan the table;
+# a full copy of the table is an admin job for tools/export_table.
+
+table_name = os.environ.get('TABLE', 'Items')
+region = os.environ.get('REGION', 'us-west-2')
+items_path = '/items'
+item_resource = '/items/{id}'
+catalog_index = 'isActive-price-index'
+batch_max_items = int(os.environ.get('BATCH_MAX_ITEMS', 1000))
+max_ids = int(os.environ.get('ITEMS_MAX_IDS', 100))
+update_workers = int(os.environ.get('ITEMS_UPDATE_WORKERS', 8))
+THROTTLED_ERRORS = {'CapacityExceeded', 'Unprocessed'} | throttle.THROTTLE_CODES
+ITEM_FIELDS = ('itemName', 'description', 'price', 'isActive')
+
+
+def build_response(status_code, body=None):
+    response = {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        }
+    }
+    if body is not None:
+        response['body'] = encoding.dumps(body)
+    return response
+
+
+def throttled_response(e: Exception):
+    response = build_response(http.HTTPStatus.SERVICE_UNAVAILABLE, {'msg': 'Too many requests, retry later'})
+    response['headers']['Retry-After'] = str(math.ceil(getattr(e, 'retry_after', 1)))
+    return response
+
+
+def error_response(e: Exception, msg: str):
+    logger.error(e)
+    if throttle.is_throttle(e):
+        return throttled_response(e)
+    return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': msg})
+
+
+def parse_input(event: dict) -> dict:
+    operations = {
+        'POST',
+        'GET',
+        'PUT',
+        'DELETE'
+    }
+
+    body = event["body"] if event.get("body") else None
+    path = event["path"] if event.get('path') else None
+    http_method = event['httpMethod'] if event.get('httpMethod') else None
+
+    if http_method == None or http_method not in operations or path == None:
+        msg = {'msg': f'Unsupported http method:{http_method} and/or path'}
+        return build_response(http.HTTPStatus.BAD_REQUEST, msg)
+
+    if body is not None:
+        if event.get('isBase64Encoded'):
+            # the API passes every media type through as binary, see BinaryMediaTypes
+            body = base64.b64decode(body)
+        body = encoding.loads(body)
+
+    return {
+        "body": body,
+        'path': path,
+        'http_method': http_method,
+        'resource': event.get('resource'),
+        'path_param': event.get('pathParameters') or {},
+        'query_params': event.get('queryStringParameters') or {}
+    }
+
+
+def item_fields(body: dict, partial: bool = False) -> dict:
+    """Validated item attributes from a request body; partial=True for updates."""
+    if not isinstance(body, dict):
+        raise TypeError('Need an item object')
+    fields = {}
+    for name in ITEM_FIELDS:
+        if name not in body:
+            if partial:
+                continue
+            raise KeyError(name)
+        fields[name] = body[name]
+    if not fields:
+        raise ValueError(f'Nothing to update: need one of {", ".join(ITEM_FIELDS)}')
+    for name in ('itemName', 'description'):
+        if name in fields and not isinstance(fields[name], str):
+            raise ValueError(f'{name} must be a string')
+    if 'price' in fields:
+        price = fields['price']
+        if isinstance(price, bool) or not isinstance(price, (int, Decimal)) or price < 0:
+            raise ValueError('price must be a number, 0 or more')
+    if 'isActive' in fields:
+        # stored as "True"/"False", like the messages' flags, so it can key an index
+        active = fields['isActive']
+        if active not in (True, False, 'True', 'False'):
+            raise ValueError('isActive must be true or false')
+        fields['isActive'] = str(active in (True, 'True'))
+    return fields
+
+
+def build_item(body: dict) -> dict:
+    import uuid
+
+    item = item_fields(body)
+    item['id'] = str(uuid.uuid4())
+    item['dateAdded'] = str(datetime.timestamp(datetime.now()))
+    return item
+
+
+def rejected(index: int, e: Exception) -> dict:
+    error = f'Missing field: {e.args[0]}' if isinstance(e, KeyError) else str(e)
+    return {'index': index, 'status': 'rejected', 'error': error}
+
+
+def bulk_list(body, key: str):
+    """The list in {key: [...]} (or a bare list), or an error response."""
+    values = body.get(key) if isinstance(body, dict) else body
+    if not isinstance(values, list) or not values:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': f'Need a non-empty list of {key}'})
+    if len(values) > batch_max_items:
+        msg = {'msg': f'Too many {key}: {len(values)}. Max is {batch_max_items}'}
+        return build_response(http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE, msg)
+    return values
+
+
+def bulk_response(results: list, done_status: str):
+    done = sum(1 for result in results if result['status'] == done_status)
+    errors = [result.get('error') for result in results if result['status'] != done_status]
+    if errors and len(errors) == len(results) and all(error in THROTTLED_ERRORS for error in errors):
+        return throttled_response(throttle.CapacityExceeded(table_name, 'write'))
+    success = http.HTTPStatus.CREATED if done_status == 'created' else http.HTTPStatus.OK
+    status = success if done == len(results) else http.HTTPStatus.MULTI_STATUS
+    return build_response(status, {done_status: done, 'results': results})
+
+
+def get_item(input, table):
+    item_id = input['path_param'].get('id')
+    try:
+        params = pagination.projection(pagination.parse_fields(input['query_params'].get('fields')))
+    except ValueError as e:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': str(e)})
+    try:
+        item = table.get_item(Key={'id': item_id}, **params).get('Item')
+    except Exception as e:
+        return error_response(e, f'Unable to read item {item_id}')
+    if item is None:
+        return build_response(http.HTTPStatus.NOT_FOUND, {'msg': f'Item {item_id} not found'})
+    return build_response(http.HTTPStatus.OK, item)
+
+
+def get_items(input, resource):
+    query_params = input['query_params']
+    ids = list(dict.fromkeys(i.strip() for i in (query_params.get('ids') or '').split(',') if i.strip()))
+    if not ids:
+        return query_items(input, resource.Table(table_name))
+    if len(ids) > max_ids:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': f'Too many ids: {len(ids)}. Max is {max_ids}'})
+    try:
+        fields = pagination.parse_fields(query_params.get('fields'))
+    except ValueError as e:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': str(e)})
+    # the id is needed to put the items back in request order
+    params = pagination.projection(fields + ['id'] if fields and 'id' not in fields else fields)
+
+    try:
+        found, unprocessed = batch.get_items(resource, table_name, [{'id': i} for i in ids], **params)
+    except Exception as e:
+        return error_response(e, 'Unable to read items')
+    by_id = {item['id']: item for item in found}
+    unprocessed_ids = [key['id'] for key in unprocessed]
+    body = {
+        'items': [by_id[i] for i in ids if i in by_id],
+        'missing': [i for i in ids if i not in by_id and i not in unprocessed_ids],
+        # not read before the deadline: ask for these again
+        'unprocessed': unprocessed_ids
+    }
+    return build_response(http.HTTPStatus.OK if not unprocessed_ids else http.HTTPStatus.MULTI_STATUS, body)
+
+
+def parse_price(name: str, value: str) -> Decimal:
+    from decimal import InvalidOperation
+
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'Invalid {name}: {value}')
+    if not price.is_finite() or price < 0:
+        raise ValueError(f'Invalid {name}: {value}')
+    return price
+
+
+def build_catalog_query(query_params: dict) -> dict:
+    """Query kwargs for one page of the catalog index: active items (or not) in a price range."""
+    from boto3.dynamodb.conditions import Key
+
+    active = query_params.get('active', 'true').lower()
+    if active not in ('true', 'false'):
+        raise ValueError(f'Invalid active: {active}. Need true or false')
+    key_condition = Key('isActive').eq(str(active == 'true'))
+    min_price = query_params.get('min_price')
+    max_price = query_params.get('max_price')
+    if min_price and max_price:
+        low, high = parse_price('min_price', min_price), parse_price('max_price', max_price)
+        if low > high:
+            raise ValueError('min_price is above max_price')
+        key_condition &= Key('price').between(low, high)
+    elif min_price:
+        key_condition &= Key('price').gte(parse_price('min_price', min_price))
+    elif max_price:
+        key_condition &= Key('price').lte(parse_price('max_price', max_price))
+
+    order = query_params.get('order', 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'Invalid order: {order}. Need asc or desc')
+
+    params = {
+        'IndexName': catalog_index,
+        'KeyConditionExpression': key_condition,
+        'ScanIndexForward': order == 'asc',
+        'Limit': pagination.parse_limit(query_params.get('limit'))
+    }
+    params.update(pagination.projection(pagination.parse_fields(query_params.get('fields'))))
+    start_key = pagination.decode_cursor(query_params.get('cursor'))
+    if start_key:
+        params['ExclusiveStartKey'] = start_key
+    return params
+
+
+def query_items(input, table):
+    try:
+        params = build_catalog_query(input['query_params'])
+    except ValueError as e:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': str(e)})
+    try:
+        # reads only the requested slice of the index, sorted by price; the caller follows next_cursor
+        response = table.query(**params)
+    except Exception as e:
+        return error_response(e, 'Unable to read items')
+    return build_response(http.HTTPStatus.OK, pagination.page(response))
+
+
+def create_items(body, resource):
+    values = body.get('items') if isinstance(body, dict) and 'items' in body else None
+    if values is None:
+        # a single item, as the old create_items function took it
+        try:
+            item = build_item(body)
+        except (KeyError, TypeError, ValueError) as e:
+            return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': rejected(0, e)['error']})
+        try:
+            resource.Table(table_name).put_item(Item=item)
+        except Exception as e:
+            return error_response(e, 'Unable to create item')
+        return build_response(http.HTTPStatus.CREATED, item)
+
+    values = bulk_list(body, 'items')
+    if isinstance(values, dict):
+        return values
+    results, items = [], []
+    for index, value in enumerate(values):
+        try:
+            item = build_item(value)
+        except (KeyError, TypeError, ValueError) as e:
+            results.append(rejected(index, e))
+            continue
+        results.append({'index': index, 'id': item['id'], 'status': 'created'})
+        items.append(item)
+
+    failed = dict((item['id'], error) for item, error in batch.write_items(resource, table_name, items))
+    for result in results:
+        if result.get('id') in failed:
+            result['status'] = 'failed'
+            result['error'] = failed[result['id']]
+    logger.info('Created %d/%d items', len(items) - len(failed), len(values))
+    return bulk_response(results, 'created')
+
+
+def update_one(table, item_id: str, fields: dict) -> dict:
+    from boto3.dynamodb.conditions import Attr
+
+    names = {f'#f{i}': name for i, name in enumerate(fields)}
+    values = {f':v{i}': value for i, value in enumerate(fields.values())}
+    response = table.update_item(
+        Key={'id': item_id},
+        UpdateExpression='set ' + ', '.join(f'#f{i} = :v{i}' for i in range(len(fields))),
+        ConditionExpression=Attr('id').exists(),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues='ALL_NEW'
+    )
+    return response['Attributes']
+
+
+def update_error(e: Exception) -> str:
+    if isinstance(e, throttle.CapacityExceeded):
+        return 'CapacityExceeded'
+    code = (getattr(e, 'response', None) or {}).get('Error', {}).get('Code')
+    if code == 'ConditionalCheckFailedException':
+        return 'Not found'
+    return code or type(e).__name__
+
+
+def update_item(input, table):
+    item_id = input['path_param'].get('id')
+    try:
+        fields = item_fields(input['body'], partial=True)
+    except (KeyError, TypeError, ValueError) as e:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': rejected(0, e)['error']})
+    try:
+        item = update_one(table, item_id, fields)
+    except Exception as e:
+        if update_error(e) == 'Not found':
+            return build_response(http.HTTPStatus.NOT_FOUND, {'msg': f'Item {item_id} not found'})
+        return error_response(e, f'Unable to update item {item_id}')
+    return build_response(http.HTTPStatus.OK, item)
+
+
+def update_items(body, table):
+    values = bulk_list(body, 'items')
+    if isinstance(values, dict):
+        return values
+    results, updates = [], []
+    for index, value in enumerate(values):
+        try:
+            item_id = value.get('id') if isinstance(value, dict) else None
+            if not isinstance(item_id, str) or not item_id:
+                raise KeyError('id')
+            updates.append((index, item_id, item_fields(value, partial=True)))
+        except (KeyError, TypeError, ValueError) as e:
+            results.append(rejected(index, e))
+
+    def update(update):
+        index, item_id, fields = update
+        try:
+            update_one(table, item_id, fields)
+        except Exception as e:
+            return {'index': index, 'id': item_id, 'status': 'failed', 'error': update_error(e)}
+        return {'index': index, 'id': item_id, 'status': 'updated'}
+
+    # UpdateItem has no batch form: run them side by side on the shared client's pool
+    if updates:
+        with ThreadPoolExecutor(max_workers=min(update_workers, len(updates))) as executor:
+            results.extend(executor.map(update, updates))
+    results.sort(key=lambda result: result['index'])
+    logger.info('Updated %d/%d items', sum(1 for r in results if r['status'] == 'updated'), len(values))
+    return bulk_response(results, 'updated')
+
+
+def delete_item(input, table):
+    item_id = input['path_param'].get('id')
+    try:
+        table.delete_item(Key={'id': item_id})
+    except Exception as e:
+        return error_response(e, f'Unable to delete item {item_id}')
+    return build_response(http.HTTPStatus.OK, {'msg': f'Deleted item {item_id}'})
+
+
+def delete_items(body, resource):
+    values = bulk_list(body, 'ids')
+    if isinstance(values, dict):
+        return values
+    results, ids = [], {}
+    for index, item_id in enumerate(values):
+        if not isinstance(item_id, str) or not item_id:
+            results.append({'index': index, 'status': 'rejected', 'error': 'Need an item id'})
+            continue
+        results.append({'index': index, 'id': item_id, 'status': 'deleted'})
+        # BatchWriteItem rejects a chunk that names the same key twice
+        ids[item_id] = None
+    keys = [{'id': item_id} for item_id in ids]
+
+    failed = {key['id']: error for key, error in batch.delete_keys(resource, table_name, keys)}
+    for result in results:
+        if result.get('id') in failed:
+            result['status'] = 'failed'
+            result['error'] = failed[result['id']]
+    logger.info('Deleted %d/%d items', len(keys) - len(failed), len(values))
+    return bulk_response(results, 'deleted')
+
+
+def items_table():
+    return dynamodb.get_table(table_name, region)
+
+
+router = Router()
+router.add('GET', items_path, lambda input: get_items(input, dynamodb.get_resource(region)))
+router.add('GET', item_resource, lambda input: get_item(input, items_table()))
+router.add('POST', items_path, lambda input: create_items(input['body'], dynamodb.get_resource(region)),
+           requires_body=True)
+router.add('PUT', items_path, lambda input: update_items(input['body'], items_table()), requires_body=True)
+router.add('PUT', item_resource, lambda input: update_item(input, items_table()), requires_body=True)
+router.add('DELETE', items_path, lambda input: delete_items(input['body'], dynamodb.get_resource(region)),
+           requires_body=True)
+router.add('DELETE', item_resource, lambda input: delete_item(input, items_table()))
+
+
+def handle_request(event):
+    input = parse_input(event)
+    if 'statusCode' in input:
+        return input
+
+    response = router.dispatch(input)
+    if response is None:
+        msg = {'msg': f'Unsupported endpoint invocations: {encoding.dumps(event)}'}
+        return build_response(http.HTTPStatus.BAD_REQUEST, msg)
+    return response
+
+
+def lambda_handler(event, context):
+    correlation_id = logs.start(event, context)
+    # DynamoDB waits and retries stop short of the function timeout
+    throttle.start(context)
+    route = f'{event.get("httpMethod")} {event.get("resource") or event.get("path")}'
+    logger.info('Request %s', route)
+    logger.debug('Event: %s', logs.payload(event))
+    with metrics.invocation(context, route=route, correlationId=correlation_id):
+        response = handle_request(event)
+    response['headers'] = dict(response.get('headers') or {}, **{'X-Correlation-Id': correlation_id})
+    return response
@@ -0,0 +1,131 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Password hashes and signed tokens for userService.
+#
+# Passwords are hashed with PBKDF2-HMAC-SHA256; the iteration count is the
+# tunable cost (PASSWORD_HASH_ITERATIONS) and is stored in every hash, so it
+# can be raised without invalidating existing users: needs_rehash() tells the
+# login path to upgrade a hash once the password is known. Hashing runs on a
+# small worker pool, so callers can bound it by the invocation deadline.
+#
+# Tokens are `<payload>.<signature>`, both base64url: a JSON payload
+# (sub, iat, exp, ver) signed with HMAC-SHA256 under TOKEN_SECRET. Any function
+# that has the secret verifies them locally, without reading the users table.
+
+HASH_ALGORITHM = 'pbkdf2_sha256'
+
+hash_iterations = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 210000))
+hash_workers = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+token_ttl = int(os.environ.get('TOKEN_TTL_SECONDS', 3600))
+# tokens are accepted this many seconds past exp, for clock skew between containers
+token_leeway = int(os.environ.get('TOKEN_LEEWAY_SECONDS', 30))
+
+_executor = None
+_lock = threading.Lock()
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def hash_password(password: str, iterations: int = None, salt: bytes = None) -> str:
+    iterations = iterations or hash_iterations
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return f'{HASH_ALGORITHM}${iterations}${_b64encode(salt)}${_b64encode(digest)}'
+
+
+def check_password(password: str, encoded: str) -> bool:
+    try:
+        algorithm, iterations, salt, expected = encoded.split('$')
+        iterations = int(iterations)
+    except (AttributeError, ValueError):
+        return False
+    if algorithm != HASH_ALGORITHM:
+        return False
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), _b64decode(salt), iterations)
+    return hmac.compare_digest(_b64encode(digest), expected)
+
+
+def needs_rehash(encoded: str) -> bool:
+    parts = encoded.split('$')
+    return len(parts) != 4 or parts[0] != HASH_ALGORITHM or parts[1] != str(hash_iterations)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix='password-hash')
+    return _executor
+
+
+def run(function, *args, timeout: float = None):
+    """Run a hash function on the worker pool; raises concurrent.futures.TimeoutError past timeout."""
+    return get_executor().submit(function, *args).result(timeout=timeout)
+
+
+def _secret() -> bytes:
+    secret = os.environ.get('TOKEN_SECRET')
+    if not secret:
+        raise RuntimeError('TOKEN_SECRET is not set')
+    return secret.encode('utf-8')
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret(), payload.encode('ascii'), hashlib.sha256).digest())
+
+
+def issue_token(subject: str, version: int = 1, ttl: int = None, now: float = None) -> dict:
+    now = int(time.time() if now is None else now)
+    claims = {'sub': subject, 'iat': now, 'exp': now + (token_ttl if ttl is None else ttl), 'ver': version}
+    payload = _b64encode(json.dumps(claims, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+    return {'token': f'{payload}.{_sign(payload)}', 'claims': claims}
+
+
+def verify_token(token: str, now: float = None) -> dict:
+    """Claims of a valid, unexpired token; raises InvalidToken otherwise."""
+    if not isinstance(token, str) or token.count('.') != 1:
+        raise InvalidToken('Malformed token')
+    payload, signature = token.split('.')
+    try:
+        valid = hmac.compare_digest(_sign(payload), signature)
+    except (TypeError, UnicodeEncodeError):
+        valid = False
+    if not valid:
+        raise InvalidToken('Bad signature')
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise InvalidToken('Malformed token')
+    now = time.time() if now is None else now
+    if not isinstance(claims, dict) or not isinstance(claims.get('exp'), int) or 'sub' not in claims:
+        raise InvalidToken('Malformed token')
+    if claims['exp'] + token_leeway < now:
+        raise InvalidToken('Token expired')
+    return claims
+
+
+def bearer_token(headers: dict) -> str:
+    for name, value in (headers or {}).items():
+        if name.lower() == 'authorization' and isinstance(value, str):
+            scheme, _, token = value.partition(' ')
+            if scheme.lower() == 'bearer' and token.strip():
+                return token.strip()
+    return None
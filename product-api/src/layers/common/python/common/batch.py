@@ -0,0 +1,126 @@
+import logging
+import random
+import time
+
+from common import throttle
+
+# BatchWriteItem and BatchGetItem helpers. DynamoDB takes at most 25 put/delete
+# requests or 100 keys per call and may hand some of them back as
+# UnprocessedItems/UnprocessedKeys when the table throttles, so those are
+# retried with jittered exponential backoff, within the invocation deadline
+# (see common.throttle).
+
+logger = logging.getLogger()
+
+BATCH_SIZE = 25
+GET_BATCH_SIZE = 100
+
+
+def chunks(items: list, size: int = BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def write_requests(resource, table_name: str, requests: list, max_attempts: int = 5,
+                   base_delay: float = 0.05, max_delay: float = 2.0) -> list:
+    """Write up to 25 requests, retrying unprocessed ones. Returns [(request, error)] for the failures."""
+    from botocore.exceptions import ClientError
+
+    pending = requests
+    for attempt in range(max_attempts):
+        try:
+            response = resource.batch_write_item(RequestItems={table_name: pending})
+        except throttle.CapacityExceeded:
+            return [(request, 'CapacityExceeded') for request in pending]
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code not in ('ProvisionedThroughputExceededException', 'ThrottlingException'):
+                logger.error('Batch write to %s failed: %s', table_name, e)
+                return [(request, code) for request in pending]
+            pending_after = pending
+        else:
+            pending_after = response.get('UnprocessedItems', {}).get(table_name, [])
+
+        if not pending_after:
+            return []
+        # unprocessed items are a throttle the client's retries never see
+        throttle.throttled(table_name, 'write')
+        pending = pending_after
+        if attempt + 1 < max_attempts:
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if delay > throttle.remaining():
+                break
+            time.sleep(delay)
+
+    logger.warning('%d requests to %s still unprocessed after %d attempts', len(pending), table_name, attempt + 1)
+    return [(request, 'Unprocessed') for request in pending]
+
+
+def write_items(resource, table_name: str, items: list, **retry) -> list:
+    """Put items in chunks of 25. Returns [(item, error)] for the items that were not written."""
+    failed = []
+    for chunk in chunks(items):
+        if throttle.capacity(table_name, 'write') <= 0:
+            # no write capacity left before the deadline, the caller can resubmit these
+            failed.extend((item, 'CapacityExceeded') for item in chunk)
+            continue
+        requests = [{'PutRequest': {'Item': item}} for item in chunk]
+        for request, error in write_requests(resource, table_name, requests, **retry):
+            failed.append((request['PutRequest']['Item'], error))
+    return failed
+
+
+def delete_keys(resource, table_name: str, keys: list, **retry) -> list:
+    """Delete items by key in chunks of 25. Returns [(key, error)] for the keys that were not deleted."""
+    failed = []
+    for chunk in chunks(keys):
+        if throttle.capacity(table_name, 'write') <= 0:
+            failed.extend((key, 'CapacityExceeded') for key in chunk)
+            continue
+        requests = [{'DeleteRequest': {'Key': key}} for key in chunk]
+        for request, error in write_requests(resource, table_name, requests, **retry):
+            failed.append((request['DeleteRequest']['Key'], error))
+    return failed
+
+
+def get_keys(resource, table_name: str, keys: list, max_attempts: int = 5, base_delay: float = 0.05,
+             max_delay: float = 2.0, **params) -> tuple:
+    """Get up to 100 keys, retrying unprocessed ones. Returns (items, keys still unprocessed).
+
+    params (ProjectionExpression, ConsistentRead...) go into the table's request.
+    Errors other than unprocessed keys are raised.
+    """
+    items = []
+    pending = keys
+    for attempt in range(max_attempts):
+        response = resource.batch_get_item(RequestItems={table_name: dict(params, Keys=pending)})
+        items.extend(response.get('Responses', {}).get(table_name, []))
+        pending = response.get('UnprocessedKeys', {}).get(table_name, {}).get('Keys', [])
+        if not pending:
+            return items, []
+        throttle.throttled(table_name, 'read')
+        if attempt + 1 < max_attempts:
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if delay > throttle.remaining():
+                break
+            time.sleep(delay)
+
+    logger.warning('%d keys of %s still unprocessed after %d attempts', len(pending), table_name, attempt + 1)
+    return items, pending
+
+
+def get_items(resource, table_name: str, keys: list, **options) -> tuple:
+    """Get items by key in chunks of 100, in no particular order. Returns (items, unprocessed keys).
+
+    Keys must be unique: BatchGetItem rejects a request that repeats one.
+    """
+    items, unprocessed = [], []
+    for chunk in chunks(keys, GET_BATCH_SIZE):
+        found, left = get_keys(resource, table_name, chunk, **options)
+        items.extend(found)
+        unprocessed.extend(left)
+    return items, unprocessed
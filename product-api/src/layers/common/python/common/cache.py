@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+# In-process read-through cache. It lives as long as the Lambda container, so it
+# only saves reads on warm invocations and writes can only invalidate entries
+# on the container that handled them; keep the TTL short.
+
+
+def approximate_size(value) -> int:
+    """Rough byte size of JSON-like data, without serializing it."""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(approximate_size(v) for v in value)
+    return 8
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 256, max_bytes: int = 8 * 1024 * 1024,
+                 sizeof=approximate_size, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (value, size, expires), least recently used first
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return default
+            if entry[2] <= self.clock():
+                self._remove(key)
+                self.counters['expirations'] += 1
+                self.counters['misses'] += 1
+                return default
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes or self.ttl <= 0:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, self.clock() + self.ttl)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.counters['evictions'] += 1
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, predicate):
+        """Drop every entry whose key matches predicate(key)."""
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                self._remove(key)
+                self.counters['invalidations'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(
+                self.counters,
+                entries=len(self.entries),
+                bytes=self.size,
+                hit_ratio=round(self.counters['hits'] / lookups, 3) if lookups else 0.0
+            )
@@ -0,0 +1,83 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Concurrent message dispatch: a bounded worker pool sends messages through a
+# pluggable Sender, paced by a token bucket that matches the provider's send
+# limit, and each message is marked sent as soon as its own send succeeds.
+
+logger = logging.getLogger()
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Sender:
+    """Delivers one message. Implementations raise on failure."""
+
+    def send(self, message: dict):
+        raise NotImplementedError
+
+
+class Dispatcher:
+    def __init__(self, sender: Sender, on_sent, max_workers: int = 8, limiter=None, precheck=None, release=None):
+        self.sender = sender
+        self.on_sent = on_sent
+        self.max_workers = max_workers
+        self.limiter = limiter
+        # precheck(message) returns the message to send, or None if it must not be sent any more;
+        # it may claim the message, and release(message) hands the claim back when the send fails
+        self.precheck = precheck
+        self.release = release
+
+    def _deliver(self, message: dict, deadline: float = None):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded()
+        if self.limiter is not None:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if not self.limiter.acquire(timeout=timeout):
+                raise DeadlineExceeded()
+        # after the limiter: nothing is claimed that the deadline then keeps from being sent
+        if self.precheck is not None:
+            message = self.precheck(message)
+            if message is None:
+                raise Cancelled()
+        try:
+            self.sender.send(message)
+        except Exception:
+            if self.release is not None:
+                self.release(message)
+            raise
+        self.on_sent(message)
+
+    def dispatch(self, messages: list, deadline: float = None) -> dict:
+        """Send messages until the time.monotonic() deadline.
+
+        Returns {'sent': [...], 'failed': [(message, error), ...], 'skipped': [...], 'cancelled': [...]};
+        skipped messages were not attempted because the deadline passed, cancelled ones were
+        turned down by the precheck.
+        """
+        results = {'sent': [], 'failed': [], 'skipped': [], 'cancelled': []}
+        if not messages:
+            return results
+
+        workers = max(1, min(self.max_workers, len(messages)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(message, executor.submit(self._deliver, message, deadline)) for message in messages]
+            for message, future in futures:
+                try:
+                    future.result()
+                    results['sent'].append(message)
+                except DeadlineExceeded:
+                    results['skipped'].append(message)
+                except Cancelled:
+                    results['cancelled'].append(message)
+                except Exception as e:
+                    logger.error('Failed to dispatch message %s: %s', message.get('id'), e)
+                    results['failed'].append((message, str(e)))
+        return results
@@ -0,0 +1,73 @@
+import os
+import threading
+
+from common import metrics, throttle
+
+# Shared DynamoDB resource/Table factory.
+#
+# Lambda keeps the container (and therefore module globals) alive between
+# warm invocations, so the session, credential resolution and the urllib3
+# connection pool are built once per container instead of once per request.
+# boto3 itself is imported on first use, so code paths that never touch
+# DynamoDB do not pay for it on a cold start.
+
+region = os.environ.get('REGION', 'us-west-2')
+endpoint_url = os.environ.get('DYNAMODB_ENDPOINT') or None
+
+_resources = {}
+_tables = {}
+_lock = threading.Lock()
+
+
+def build_config():
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=int(os.environ.get('DDB_MAX_POOL_CONNECTIONS', 10)),
+        connect_timeout=float(os.environ.get('DDB_CONNECT_TIMEOUT', 2)),
+        read_timeout=float(os.environ.get('DDB_READ_TIMEOUT', 5)),
+        tcp_keepalive=os.environ.get('DDB_TCP_KEEPALIVE', 'True') == 'True',
+        retries={
+            'mode': os.environ.get('DDB_RETRY_MODE', 'standard'),
+            'total_max_attempts': int(os.environ.get('DDB_MAX_ATTEMPTS', 3))
+        }
+    )
+
+
+def get_resource(region_name: str = None):
+    region_name = region_name or region
+    resource = _resources.get(region_name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(region_name)
+            if resource is None:
+                import boto3
+
+                # own session: boto3's default session is not thread safe
+                session = boto3.session.Session()
+                resource = session.resource(
+                    'dynamodb',
+                    region_name=region_name,
+                    endpoint_url=endpoint_url,
+                    config=build_config()
+                )
+                metrics.install(resource.meta.client)
+                throttle.install(resource.meta.client)
+                _resources[region_name] = resource
+    return resource
+
+
+def get_table(table_name: str, region_name: str = None):
+    key = (region_name or region, table_name)
+    table = _tables.get(key)
+    if table is None:
+        table = get_resource(key[0]).Table(table_name)
+        _tables[key] = table
+    return table
+
+
+def reset():
+    """Drop cached resources and tables, e.g. between tests or after a config change."""
+    with _lock:
+        _resources.clear()
+        _tables.clear()
@@ -0,0 +1,74 @@
+import base64
+import json
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the standard library encoder
+    orjson = None
+
+# JSON encoding for DynamoDB data. The resource API returns numbers as Decimal,
+# string/number sets as set and binary attributes as Binary, none of which the
+# standard encoder accepts.
+
+STREAM_CHUNK_SIZE = 1000
+
+
+def default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        # sorted so the same item always encodes (and ETags) the same way
+        try:
+            return sorted(value)
+        except TypeError:
+            return list(value)
+    if type(value).__name__ == 'Binary':
+        # boto3.dynamodb.types.Binary, checked by name to keep boto3 out of the import path
+        value = value.value
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps_bytes(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=default, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(value) -> str:
+    return dumps_bytes(value).decode('utf-8')
+
+
+def loads(data):
+    # Decimal, not float: the DynamoDB resource API rejects floats on write
+    return json.loads(data, parse_float=Decimal)
+
+
+def iter_dumps(items, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Encode an iterable of items as one JSON array, chunk by chunk, without holding it all in memory."""
+    yield b'['
+    first = True
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield (b'' if first else b',') + dumps_bytes(chunk)[1:-1]
+            first = False
+            chunk = []
+    if chunk:
+        yield (b'' if first else b',') + dumps_bytes(chunk)[1:-1]
+    yield b']'
+
+
+def iter_ndjson(items, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Encode an iterable of items as newline-delimited JSON, one chunk of lines at a time."""
+    chunk = []
+    for item in items:
+        chunk.append(dumps_bytes(item))
+        if len(chunk) == chunk_size:
+            yield b'\n'.join(chunk) + b'\n'
+            chunk = []
+    if chunk:
+        yield b'\n'.join(chunk) + b'\n'
@@ -0,0 +1,363 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import encoding, pagination
+
+# Parallel export of a table to gzip NDJSON.
+#
+# The table is read with a segmented scan: each of total_segments segments is
+# scanned page by page by one worker of a bounded pool, and each page is
+# written to the worker's open gzip NDJSON part file as soon as it arrives, so
+# no more than one page per worker is ever held in memory. A part is closed
+# after about part_items items. A part always ends on
+# a page boundary; once it is written, the segment's checkpoint records it and
+# the LastEvaluatedKey to continue from. An interrupted export run again with
+# the same destination picks every segment up after its last written part, so
+# no item is exported twice.
+#
+# Destinations are a local folder or an S3 (or S3-compatible) prefix, see
+# destination().
+
+logger = logging.getLogger()
+
+CHECKPOINT_FOLDER = '_checkpoints'
+MANIFEST = 'manifest.json'
+S3_PART_SIZE = 8 * 1024 * 1024
+
+
+class LocalDestination:
+    """Files under a local folder; each file appears complete or not at all."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __str__(self):
+        return self.path
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.path, *name.split('/'))
+
+    def open(self, name: str):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return _AtomicFile(path)
+
+    def read_text(self, name: str) -> str:
+        try:
+            with open(self._path(name), encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_text(self, name: str, text: str):
+        with self.open(name) as f:
+            f.write(text.encode('utf-8'))
+
+
+class _AtomicFile:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path + '.tmp', 'wb')
+
+    def write(self, data) -> int:
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            os.replace(self.path + '.tmp', self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.path + '.tmp')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class S3Destination:
+    """Objects under an S3 prefix, streamed with multipart uploads of part_size (5 MiB at least)."""
+
+    def __init__(self, bucket: str, prefix: str = '', client=None, endpoint_url: str = None,
+                 part_size: int = S3_PART_SIZE):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.part_size = part_size
+        if client is None:
+            import boto3
+
+            client = boto3.session.Session().client('s3', endpoint_url=endpoint_url)
+        self.client = client
+
+    def __str__(self):
+        return f's3://{self.bucket}/{self.prefix}'
+
+    def key(self, name: str) -> str:
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    def open(self, name: str):
+        return _S3Upload(self.client, self.bucket, self.key(name), self.part_size)
+
+    def read_text(self, name: str) -> str:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key(name))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response['Body'].read().decode('utf-8')
+
+    def write_text(self, name: str, text: str):
+        self.client.put_object(Bucket=self.bucket, Key=self.key(name), Body=text.encode('utf-8'))
+
+
+class _S3Upload:
+    """Writable stream to one S3 object: a single put if it stays small, a multipart upload if not."""
+
+    def __init__(self, client, bucket: str, key: str, part_size: int = S3_PART_SIZE):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.buffer += data
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=bytes(self.buffer))
+        self.parts.append({'PartNumber': number, 'ETag': response['ETag']})
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            return
+        if self.buffer:
+            self._upload_part()
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                              MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        self.closed = True
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def destination(url: str, endpoint_url: str = None):
+    """LocalDestination for a path, S3Destination for s3://bucket/prefix."""
+    if url.startswith('s3://'):
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        return S3Destination(bucket, prefix, endpoint_url=endpoint_url)
+    return LocalDestination(url)
+
+
+def part_name(segment: int, part: int) -> str:
+    return f'segment-{segment:05d}-part-{part:05d}.ndjson.gz'
+
+
+def checkpoint_name(segment: int) -> str:
+    return f'{CHECKPOINT_FOLDER}/segment-{segment:05d}.json'
+
+
+class PartWriter:
+    """One gzip NDJSON file under target, written a batch of items at a time."""
+
+    def __init__(self, target, name: str):
+        self.name = name
+        self.items = 0
+        self.raw = target.open(name)
+        self.counting = _Counting(self.raw)
+        # mtime=0: the same items always compress to the same bytes
+        self.file = gzip.GzipFile(fileobj=self.counting, mode='wb', compresslevel=6, mtime=0)
+
+    def write(self, items: list):
+        for chunk in encoding.iter_ndjson(items):
+            self.file.write(chunk)
+        self.items += len(items)
+
+    def close(self) -> int:
+        """Finish the file; returns its compressed size."""
+        self.file.close()
+        self.raw.close()
+        return self.counting.size
+
+    def abort(self):
+        self.raw.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_part(target, name: str, items: list) -> int:
+    """Write items to one gzip NDJSON file; returns its compressed size."""
+    part = PartWriter(target, name)
+    with part:
+        part.write(items)
+    return part.counting.size
+
+
+class _Counting:
+    def __init__(self, raw):
+        self.raw = raw
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.size += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+class Exporter:
+    def __init__(self, table, target, total_segments: int = 16, workers: int = 8, fields: list = None,
+                 part_items: int = 100000, page_size: int = None):
+        self.table = table
+        self.target = target
+        self.total_segments = total_segments
+        self.workers = workers
+        self.fields = list(fields or [])
+        self.part_items = part_items
+        self.page_size = page_size
+        self.lock = threading.Lock()
+        self.progress = {'items': 0, 'scanned': 0, 'parts': 0, 'bytes': 0}
+
+    def load_checkpoint(self, segment: int) -> dict:
+        text = self.target.read_text(checkpoint_name(segment))
+        if text is None:
+            return {'segment': segment, 'total_segments': self.total_segments, 'fields': self.fields,
+                    'next_key': None, 'done': False, 'items': 0, 'scanned': 0, 'parts': []}
+        checkpoint = json.loads(text)
+        if checkpoint['total_segments'] != self.total_segments or checkpoint['fields'] != self.fields:
+            raise ValueError(f'{self.target} holds an export with {checkpoint["total_segments"]} segments '
+                             f'and fields {checkpoint["fields"]}; resume it with the same options')
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint: dict):
+        self.target.write_text(checkpoint_name(checkpoint['segment']), json.dumps(checkpoint, sort_keys=True))
+
+    def pages(self, segment: int, start_key: dict = None):
+        params = {'Segment': segment, 'TotalSegments': self.total_segments}
+        params.update(pagination.projection(self.fields))
+        if self.page_size:
+            params['Limit'] = self.page_size
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        while True:
+            response = self.table.scan(**params)
+            yield response
+            if not response.get('LastEvaluatedKey'):
+                return
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def export_segment(self, segment: int) -> dict:
+        checkpoint = self.load_checkpoint(segment)
+        if checkpoint['done']:
+            return checkpoint
+        part, items, scanned = None, 0, 0
+        try:
+            for response in self.pages(segment, pagination.decode_cursor(checkpoint['next_key'])):
+                # each page goes straight into the open part: only one page is held at a time
+                if response['Items']:
+                    if part is None:
+                        part = PartWriter(self.target, part_name(segment, len(checkpoint['parts'])))
+                    part.write(response['Items'])
+                items += len(response['Items'])
+                scanned += response.get('ScannedCount', 0)
+                last_key = response.get('LastEvaluatedKey')
+                if items >= self.part_items or not last_key:
+                    self.finish_part(checkpoint, part, scanned, last_key)
+                    part, items, scanned = None, 0, 0
+        except BaseException:
+            # the checkpoint still points at the start of this part, so a rerun writes it again
+            if part is not None:
+                part.abort()
+            raise
+        return checkpoint
+
+    def finish_part(self, checkpoint: dict, part: PartWriter, scanned: int, last_key: dict):
+        items, size = 0, 0
+        if part is not None:
+            items, size = part.items, part.close()
+            checkpoint['parts'].append({'name': part.name, 'items': items, 'bytes': size})
+        checkpoint['items'] += items
+        checkpoint['scanned'] += scanned
+        checkpoint['next_key'] = pagination.encode_cursor(last_key)
+        checkpoint['done'] = last_key is None
+        self.save_checkpoint(checkpoint)
+        with self.lock:
+            self.progress['items'] += items
+            self.progress['scanned'] += scanned
+            self.progress['parts'] += int(part is not None)
+            self.progress['bytes'] += size
+            progress = dict(self.progress)
+        logger.info('Segment %d: %d items%s; export total %d items, %d parts, %d bytes',
+                    checkpoint['segment'], checkpoint['items'], ' (done)' if checkpoint['done'] else '',
+                    progress['items'], progress['parts'], progress['bytes'])
+
+    def run(self) -> dict:
+        """Export every segment not yet done; returns the manifest, also written to the destination."""
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(self.workers, self.total_segments)) as executor:
+            checkpoints = list(executor.map(self.export_segment, range(self.total_segments)))
+        manifest = {
+            'table': self.table.name,
+            'total_segments': self.total_segments,
+            'fields': self.fields,
+            'format': 'ndjson.gz',
+            'items': sum(c['items'] for c in checkpoints),
+            'scanned': sum(c['scanned'] for c in checkpoints),
+            'files': [part for c in checkpoints for part in c['parts']]
+        }
+        self.target.write_text(MANIFEST, json.dumps(manifest, indent=2))
+        logger.info('Exported %d items from %s to %s in %d files, %.1fs this run', manifest['items'],
+                    self.table.name, self.target, len(manifest['files']), time.monotonic() - started)
+        return manifest
+
+
+def export(table, target, **options) -> dict:
+    return Exporter(table, target, **options).run()
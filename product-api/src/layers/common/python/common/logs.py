@@ -0,0 +1,129 @@
+import logging
+import os
+import random
+import re
+import time
+import uuid
+
+from common import encoding
+
+# Request logging that stays cheap when it is turned down.
+#
+# - Payloads (events, items, responses) are logged at DEBUG through payload(),
+#   which only serializes and truncates them if the record is emitted.
+# - start() runs at the top of every invocation: it picks the correlation ID
+#   (X-Correlation-Id header, API Gateway request id or Lambda request id) that
+#   is stamped on every log line, and samples LOG_SAMPLE_RATE of the
+#   invocations to log at DEBUG. Only the application logs: the AWS SDK and
+#   urllib3 are held at WARNING, since their DEBUG output carries whole request
+#   and response bodies (passwords, tokens) past LOG_MAX_CHARS.
+
+level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+sample_rate = float(os.environ.get('LOG_SAMPLE_RATE', 0))
+max_chars = int(os.environ.get('LOG_MAX_CHARS', 2048))
+
+CORRELATION_HEADER = 'x-correlation-id'
+# the Lambda runtime's text format, plus the correlation ID
+FORMAT = '[%(levelname)s]\t%(asctime)s.%(msecs)03dZ\t%(aws_request_id)s\t%(correlation_id)s\t%(message)s'
+
+LIBRARY_LOGGERS = ('boto3', 'botocore', 's3transfer', 'urllib3')
+
+_valid_id = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+# a container handles one invocation at a time, and the scanner's worker
+# threads belong to that invocation, so a module global is enough
+correlation_id = None
+sampled = False
+
+
+def truncate(text: str, limit: int = None) -> str:
+    limit = max_chars if limit is None else limit
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f'{text[:limit]}...[{len(text) - limit} more chars]'
+
+
+class Payload:
+    """Log argument serialized to JSON and truncated only when the record is emitted."""
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit: int = None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            try:
+                text = encoding.dumps(self.value)
+            except TypeError:
+                text = repr(self.value)
+        return truncate(text, self.limit)
+
+
+class Lazy:
+    """Log argument computed only when the record is emitted."""
+    __slots__ = ('function',)
+
+    def __init__(self, function):
+        self.function = function
+
+    def __str__(self):
+        return str(self.function())
+
+
+def payload(value, limit: int = None) -> Payload:
+    return Payload(value, limit)
+
+
+def lazy(function) -> Lazy:
+    return Lazy(function)
+
+
+class CorrelationFilter(logging.Filter):
+    def filter(self, record):
+        record.correlation_id = correlation_id or '-'
+        if not hasattr(record, 'aws_request_id'):
+            record.aws_request_id = '-'
+        return True
+
+
+def configure() -> logging.Logger:
+    """Set the root level and stamp the correlation ID on the handlers Lambda installed."""
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name in LIBRARY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    for handler in root.handlers:
+        if any(isinstance(f, CorrelationFilter) for f in handler.filters):
+            continue
+        handler.addFilter(CorrelationFilter())
+        if os.environ.get('AWS_LAMBDA_LOG_FORMAT') != 'JSON':
+            # the JSON format already logs extra record attributes such as correlation_id
+            formatter = logging.Formatter(FORMAT, '%Y-%m-%dT%H:%M:%S')
+            formatter.converter = time.gmtime
+            handler.setFormatter(formatter)
+    return root
+
+
+def find_correlation_id(event, context=None) -> str:
+    if isinstance(event, dict):
+        headers = event.get('headers') or {}
+        for name, value in headers.items():
+            if name.lower() == CORRELATION_HEADER and isinstance(value, str) and _valid_id.match(value):
+                return value
+        request_id = (event.get('requestContext') or {}).get('requestId')
+        if request_id:
+            return request_id
+    request_id = getattr(context, 'aws_request_id', None)
+    return request_id or uuid.uuid4().hex
+
+
+def start(event, context=None) -> str:
+    """Begin an invocation: pick its correlation ID and whether it is sampled at DEBUG."""
+    global correlation_id, sampled
+    correlation_id = find_correlation_id(event, context)
+    sampled = sample_rate > 0 and random.random() < sample_rate
+    logging.getLogger().setLevel(logging.DEBUG if sampled else level)
+    return correlation_id
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Capacity and latency metrics for every DynamoDB call.
+#
+# install() hooks the shared client's event system: each call asks for
+# ReturnConsumedCapacity=INDEXES and, once it returns, one JSON line with the
+# operation, table, index, items, bytes, consumed units and latency is logged.
+# Calls are also totalled per invocation; invocation() wraps a handler and
+# logs the totals in CloudWatch Embedded Metric Format, which CloudWatch turns
+# into metrics without any API call. A routed handler adds its request's
+# latency and error (see common.router) to the same document.
+#
+# DDB_METRICS: 'summary' (invocation totals, the default), 'calls' (a line
+# per call as well) or 'off'. The template turns 'calls' on for the functions.
+
+namespace = os.environ.get('METRICS_NAMESPACE', 'Texter')
+mode = os.environ.get('DDB_METRICS', 'summary')
+
+CAPACITY_OPERATIONS = {
+    'GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan',
+    'BatchGetItem', 'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems'
+}
+READ_OPERATIONS = {'GetItem', 'Query', 'Scan', 'BatchGetItem', 'TransactGetItems'}
+
+# raw JSON lines on stdout, as Embedded Metric Format requires
+output = logging.getLogger('texter.metrics')
+output.propagate = False
+output.setLevel(logging.INFO)
+if not output.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    output.addHandler(_handler)
+
+
+class Recorder:
+    """Totals of the DynamoDB calls made during one invocation, by operation, table and index."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.request = None
+
+    def reset(self):
+        with self.lock:
+            self.totals = {}
+            self.request = None
+
+    def record_request(self, route: str, latency_ms: float, error: bool, totals: dict = None):
+        """The routed request of this invocation; totals are its route's counters in this container."""
+        with self.lock:
+            self.request = {'route': route, 'latency_ms': round(latency_ms, 3), 'error': error, 'totals': totals}
+
+    def record(self, call: dict):
+        key = (call['operation'], call['table'], call['index'])
+        with self.lock:
+            total = self.totals.get(key)
+            if total is None:
+                total = self.totals[key] = {
+                    'calls': 0, 'errors': 0, 'retries': 0, 'items': 0, 'bytes': 0,
+                    'rcu': 0.0, 'wcu': 0.0, 'latency_ms': 0.0, 'max_latency_ms': 0.0
+                }
+            total['calls'] += 1
+            total['errors'] += int(call['error'] is not None)
+            total['retries'] += call['retries']
+            total['items'] += call['items']
+            total['bytes'] += call['request_bytes'] + call['response_bytes']
+            total['rcu'] += call['rcu']
+            total['wcu'] += call['wcu']
+            total['latency_ms'] += call['latency_ms']
+            total['max_latency_ms'] = max(total['max_latency_ms'], call['latency_ms'])
+
+    def summary(self) -> dict:
+        with self.lock:
+            breakdown = [dict(total, operation=operation, table=table, index=index)
+                         for (operation, table, index), total in self.totals.items()]
+        return {
+            'calls': sum(t['calls'] for t in breakdown),
+            'errors': sum(t['errors'] for t in breakdown),
+            'rcu': sum(t['rcu'] for t in breakdown),
+            'wcu': sum(t['wcu'] for t in breakdown),
+            'latency_ms': round(sum(t['latency_ms'] for t in breakdown), 3),
+            'breakdown': breakdown
+        }
+
+
+recorder = Recorder()
+
+
+def consumed_units(operation: str, consumed) -> tuple:
+    """(rcu, wcu) from a ConsumedCapacity entry or list of entries."""
+    entries = consumed if isinstance(consumed, list) else [consumed] if consumed else []
+    rcu = wcu = 0.0
+    for entry in entries:
+        units = float(entry.get('CapacityUnits', 0))
+        if 'ReadCapacityUnits' in entry or 'WriteCapacityUnits' in entry:
+            rcu += float(entry.get('ReadCapacityUnits', 0))
+            wcu += float(entry.get('WriteCapacityUnits', 0))
+        elif operation in READ_OPERATIONS:
+            rcu += units
+        else:
+            wcu += units
+    return rcu, wcu
+
+
+def indexes_used(consumed) -> dict:
+    entries = consumed if isinstance(consumed, list) else [consumed] if consumed else []
+    return {name: float(units.get('CapacityUnits', 0))
+            for entry in entries for name, units in (entry.get('GlobalSecondaryIndexes') or {}).items()}
+
+
+def item_count(operation: str, params: dict, parsed: dict) -> int:
+    if operation in ('Query', 'Scan'):
+        return parsed.get('Count', 0)
+    if operation == 'GetItem':
+        return int('Item' in parsed)
+    if operation == 'BatchGetItem':
+        return sum(len(items) for items in (parsed.get('Responses') or {}).values())
+    if operation == 'BatchWriteItem':
+        requested = sum(len(requests) for requests in (params.get('RequestItems') or {}).values())
+        return requested - sum(len(requests) for requests in (parsed.get('UnprocessedItems') or {}).values())
+    if operation in ('TransactGetItems', 'TransactWriteItems'):
+        return len(params.get('TransactItems') or [])
+    return 1
+
+
+def table_of(params: dict) -> str:
+    if 'TableName' in params:
+        return params['TableName']
+    tables = sorted(params.get('RequestItems') or {})
+    return ','.join(tables) if tables else None
+
+
+def provide_params(params, model, context, **kwargs):
+    if model.name in CAPACITY_OPERATIONS:
+        params.setdefault('ReturnConsumedCapacity', 'INDEXES')
+    context['ddb_metrics'] = {
+        'operation': model.name,
+        'table': table_of(params),
+        'index': params.get('IndexName'),
+        'params': params,
+        'start': time.perf_counter()
+    }
+
+
+def before_call(params, context, **kwargs):
+    call = context.get('ddb_metrics')
+    if call is not None:
+        body = params.get('body') or b''
+        call['request_bytes'] = len(body)
+
+
+def after_call(http_response, parsed, model, context, **kwargs):
+    call = context.pop('ddb_metrics', None)
+    if call is None:
+        return
+    consumed = parsed.get('ConsumedCapacity')
+    rcu, wcu = consumed_units(model.name, consumed)
+    finish(call, {
+        'items': item_count(model.name, call.pop('params'), parsed),
+        'scanned': parsed.get('ScannedCount'),
+        'response_bytes': len(http_response.content or b''),
+        'rcu': rcu,
+        'wcu': wcu,
+        'indexes': indexes_used(consumed),
+        'retries': parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+        'status': http_response.status_code,
+        'error': parsed.get('Error', {}).get('Code') if http_response.status_code >= 300 else None
+    })
+
+
+def after_call_error(exception, context, **kwargs):
+    call = context.pop('ddb_metrics', None)
+    if call is None:
+        return
+    call.pop('params', None)
+    finish(call, {'items': 0, 'scanned': None, 'response_bytes': 0, 'rcu': 0.0, 'wcu': 0.0,
+                  'indexes': {}, 'retries': 0, 'status': None, 'error': type(exception).__name__})
+
+
+def finish(call: dict, result: dict):
+    call.update(result)
+    call['latency_ms'] = round((time.perf_counter() - call.pop('start')) * 1000, 3)
+    call.setdefault('request_bytes', 0)
+    recorder.record(call)
+    if mode == 'calls':
+        output.info(json.dumps(dict(call, metric='dynamodb.call'), separators=(',', ':')))
+
+
+def install(client):
+    """Instrument a DynamoDB client (resource.meta.client); safe to call more than once."""
+    if mode == 'off':
+        return
+    events = client.meta.events
+    events.register('provide-client-params.dynamodb.*', provide_params, unique_id='texter-metrics-params')
+    events.register('before-call.dynamodb.*', before_call, unique_id='texter-metrics-before')
+    events.register('after-call.dynamodb.*', after_call, unique_id='texter-metrics-after')
+    events.register('after-call-error.dynamodb.*', after_call_error, unique_id='texter-metrics-error')
+
+
+def embedded_metrics(summary: dict, dimensions: dict, request: dict = None) -> dict:
+    """Invocation totals (and the routed request, if any) as a CloudWatch Embedded Metric Format document."""
+    document = dict(
+        dimensions,
+        _aws={
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': [
+                    {'Name': 'DynamoDBCalls', 'Unit': 'Count'},
+                    {'Name': 'DynamoDBErrors', 'Unit': 'Count'},
+                    {'Name': 'ConsumedRCU', 'Unit': 'Count'},
+                    {'Name': 'ConsumedWCU', 'Unit': 'Count'},
+                    {'Name': 'DynamoDBLatency', 'Unit': 'Milliseconds'}
+                ]
+            }]
+        },
+        DynamoDBCalls=summary['calls'],
+        DynamoDBErrors=summary['errors'],
+        ConsumedRCU=summary['rcu'],
+        ConsumedWCU=summary['wcu'],
+        DynamoDBLatency=summary['latency_ms'],
+        breakdown=summary['breakdown']
+    )
+    if request is not None:
+        document['_aws']['CloudWatchMetrics'][0]['Metrics'] += [
+            {'Name': 'RequestLatency', 'Unit': 'Milliseconds'},
+            {'Name': 'RequestErrors', 'Unit': 'Count'}
+        ]
+        document.update(RequestLatency=request['latency_ms'], RequestErrors=int(request['error']),
+                        routeStats=dict(request['totals'] or {}, route=request['route']))
+    return document
+
+
+@contextmanager
+def invocation(context=None, **properties):
+    """Total the DynamoDB calls made inside the block and log them when it ends.
+
+    properties (e.g. route=...) are logged alongside the totals; the function
+    name is the only metric dimension, to keep CloudWatch cardinality low.
+    """
+    recorder.reset()
+    try:
+        yield recorder
+    finally:
+        summary = recorder.summary()
+        if mode != 'off' and (summary['calls'] or recorder.request):
+            function = getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+            document = embedded_metrics(summary, {'Function': function}, recorder.request)
+            document.update(properties, requestId=getattr(context, 'aws_request_id', None))
+            output.info(json.dumps(document, separators=(',', ':'), default=str))
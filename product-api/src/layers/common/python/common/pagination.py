@@ -0,0 +1,80 @@
+import base64
+import json
+import re
+
+# Opaque cursors and projection helpers shared by the list endpoints.
+#
+# A cursor is the LastEvaluatedKey of the previous page in DynamoDB wire format
+# (so numeric keys survive the round trip), JSON encoded and base64url'd.
+
+_field_name = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def encode_cursor(last_evaluated_key: dict) -> str:
+    if not last_evaluated_key:
+        return None
+    from boto3.dynamodb.types import TypeSerializer
+
+    serializer = TypeSerializer()
+    wire = {k: serializer.serialize(v) for k, v in last_evaluated_key.items()}
+    raw = json.dumps(wire, separators=(',', ':'), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    if not cursor:
+        return None
+    from boto3.dynamodb.types import TypeDeserializer
+
+    deserializer = TypeDeserializer()
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        wire = json.loads(raw)
+        return {k: deserializer.deserialize(v) for k, v in wire.items()}
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def parse_limit(value, default: int = 100, maximum: int = 1000) -> int:
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid limit: {value}')
+    if limit < 1:
+        raise ValueError(f'Invalid limit: {value}')
+    return min(limit, maximum)
+
+
+def parse_fields(value) -> list:
+    if not value:
+        return []
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    for field in fields:
+        if not _field_name.match(field):
+            raise ValueError(f'Invalid field: {field}')
+    return list(dict.fromkeys(fields))
+
+
+def projection(fields: list, names: dict = None) -> dict:
+    """Build ProjectionExpression kwargs, aliasing every name (owner, message... are reserved words)."""
+    if not fields:
+        return {}
+    names = dict(names or {})
+    aliases = []
+    for i, field in enumerate(fields):
+        alias = f'#p{i}'
+        names[alias] = field
+        aliases.append(alias)
+    return {
+        'ProjectionExpression': ', '.join(aliases),
+        'ExpressionAttributeNames': names
+    }
+
+
+def page(response: dict) -> dict:
+    return {
+        'items': response.get('Items', []),
+        'next_cursor': encode_cursor(response.get('LastEvaluatedKey'))
+    }
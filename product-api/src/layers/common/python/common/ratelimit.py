@@ -0,0 +1,126 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError(f'rate must be positive: {rate}')
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens if available. Returns 0 on success, otherwise the seconds to wait."""
+        with self.lock:
+            self._refill(self.clock())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """Block until tokens are available. Returns False if that would take longer than timeout."""
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            self.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """Capacity-unit limiter that learns the sustainable rate from throttle signals (AIMD).
+
+    It lets everything through until the first throttle. Then the rate drops to
+    `beta` times what was being consumed, and grows back by `increase` units per
+    second for every second without a throttle. Units are debited after the
+    fact, from the consumed capacity DynamoDB reports, so the bucket can go
+    negative and the next caller waits it out.
+    """
+
+    def __init__(self, min_rate: float = 0.5, beta: float = 0.5, increase: float = 1.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.min_rate = min_rate
+        self.beta = beta
+        self.increase = increase
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.rate = None  # units per second, None until the first throttle
+        self.tokens = 0.0
+        self.updated = clock()
+        self.measured = 0.0  # recent consumption, units per second
+        self.window_start = self.updated
+        self.window_units = 0.0
+        self.throttles = 0
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            elapsed = now - self.updated
+            self.rate += self.increase * elapsed
+            self.tokens = min(self.rate, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def _measure(self, now: float, units: float):
+        self.window_units += units
+        elapsed = now - self.window_start
+        if elapsed >= 1.0:
+            self.measured = 0.5 * self.measured + 0.5 * self.window_units / elapsed
+            self.window_start = now
+            self.window_units = 0.0
+
+    def wait_time(self) -> float:
+        """Seconds until the next call may go out."""
+        with self.lock:
+            self._refill(self.clock())
+            if self.rate is None or self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, deadline: float = None) -> bool:
+        """Block until a call may go out. Returns False if that would be after deadline (monotonic)."""
+        while True:
+            wait = self.wait_time()
+            if wait == 0:
+                return True
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            self.sleep(wait)
+
+    def consumed(self, units: float):
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            self._measure(now, units)
+            if self.rate is not None:
+                self.tokens -= units
+
+    def throttled(self):
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            current = self.rate if self.rate is not None else max(self.measured, self.window_units)
+            self.rate = max(self.min_rate, current * self.beta)
+            self.tokens = min(self.tokens, 0.0)
+            self.throttles += 1
+
+    def available(self, seconds: float = 0.0) -> float:
+        """Units that can be spent within `seconds` from now; infinite while unthrottled."""
+        with self.lock:
+            self._refill(self.clock())
+            if self.rate is None:
+                return float('inf')
+            return max(0.0, self.tokens + self.rate * seconds)
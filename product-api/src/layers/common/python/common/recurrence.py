@@ -0,0 +1,131 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from common import schedule
+
+# Recurring messages.
+#
+# A series is stored as one pending message carrying its rule in `recurrence`:
+#
+#     {"frequency": "weekly", "interval": 1, "weekdays": ["MO", "TH"],
+#      "until": "2027-06-30T00:00:00", "count": 20}
+#
+# Only the next occurrence ever exists: when the scanner sends one, it writes
+# the following occurrence as a new pending message (same owner, text and rule,
+# `occurrence` + 1) and marks the sent one as usual. The table and the pending
+# index hold one row per active series, and both the owner and the day queries
+# see occurrences as ordinary messages. Deleting the pending occurrence ends
+# the series. Times are UTC, like send_time.
+
+FREQUENCIES = ('daily', 'weekly')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+MAX_INTERVAL = 366
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# copied from one occurrence to the next; the rest is scheduling state
+CARRIED = ('message', 'owner', 'display_name', 'outgoing_phone', 'recurrence', 'series_id')
+
+
+def parse_time(value: str) -> datetime:
+    return datetime.strptime(value.rstrip('Z'), '%Y-%m-%dT%H:%M:%S')
+
+
+def parse(rule, start: str) -> dict:
+    """Validate a recurrence rule from a request; returns it as stored, anchored at the first send_time."""
+    if not isinstance(rule, dict):
+        raise ValueError('Invalid recurrence: need an object')
+    unknown = set(rule) - {'frequency', 'interval', 'weekdays', 'until', 'count'}
+    if unknown:
+        raise ValueError(f'Invalid recurrence field: {sorted(unknown)[0]}')
+    frequency = str(rule.get('frequency', '')).lower()
+    if frequency not in FREQUENCIES:
+        raise ValueError(f'Invalid recurrence frequency: {rule.get("frequency")}. Need one of {", ".join(FREQUENCIES)}')
+    stored = {'frequency': frequency, 'interval': _positive(rule.get('interval', 1), 'interval', MAX_INTERVAL),
+              'start': parse_time(start).strftime(TIME_FORMAT)}
+
+    if rule.get('weekdays') is not None:
+        weekdays = rule['weekdays']
+        if not isinstance(weekdays, list) or not weekdays or \
+                any(not isinstance(day, str) or day.upper() not in WEEKDAYS for day in weekdays):
+            raise ValueError(f'Invalid recurrence weekdays: {weekdays}. Need a list of {", ".join(WEEKDAYS)}')
+        stored['weekdays'] = sorted({day.upper() for day in weekdays}, key=WEEKDAYS.index)
+    if rule.get('until') is not None:
+        try:
+            until = parse_time(str(rule['until']))
+        except ValueError:
+            raise ValueError(f'Invalid recurrence until: {rule["until"]}. Need YYYY-MM-DDTHH:MM:SS')
+        if until < parse_time(start):
+            raise ValueError('Invalid recurrence until: before send_time')
+        stored['until'] = until.strftime(TIME_FORMAT)
+    if rule.get('count') is not None:
+        stored['count'] = _positive(rule['count'], 'count')
+    return stored
+
+
+def _positive(value, name: str, maximum: int = None) -> int:
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1 or (maximum and value > maximum):
+        limit = f' up to {maximum}' if maximum else ''
+        raise ValueError(f'Invalid recurrence {name}: {value}. Need a whole number from 1{limit}')
+    return value
+
+
+def _on_grid(rule: dict, start: datetime, day: datetime) -> bool:
+    interval = int(rule['interval'])
+    weekdays = [WEEKDAYS.index(code) for code in rule.get('weekdays', [])]
+    if rule['frequency'] == 'daily':
+        return (day.date() - start.date()).days % interval == 0 and (not weekdays or day.weekday() in weekdays)
+    # weekly: every interval-th week counted from the first one, on weekdays (default: the first's)
+    weeks = ((day.date() - timedelta(days=day.weekday())) - (start.date() - timedelta(days=start.weekday()))).days // 7
+    return weeks % interval == 0 and day.weekday() in (weekdays or [start.weekday()])
+
+
+def next_time(rule: dict, after: datetime) -> datetime:
+    """The first occurrence of rule after `after`, at after's time of day, ignoring until and count."""
+    start = parse_time(rule['start'])
+    # within 7 * interval days every weekday of an active week comes round
+    for days in range(1, 7 * int(rule['interval']) + 1):
+        candidate = after + timedelta(days=days)
+        if _on_grid(rule, start, candidate):
+            return candidate
+    return None
+
+
+def occurrence_id(series_id: str, occurrence: int) -> str:
+    # deterministic: a scanner run retried after writing the next occurrence writes the same item
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f'texter-series:{series_id}:{occurrence}'))
+
+
+def next_occurrence(message: dict, now: datetime = None) -> dict:
+    """The pending message that follows `message` in its series, or None when the series ends.
+
+    Occurrences already in the past (the scanner was behind) are skipped rather
+    than sent in a burst; they still count towards the rule's count.
+    """
+    rule = message.get('recurrence')
+    if not rule:
+        return None
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    occurrence = int(message.get('occurrence', 1))
+    send_at = parse_time(message['send_time'])
+    until = parse_time(rule['until']) if rule.get('until') else None
+    while True:
+        send_at = next_time(rule, send_at)
+        occurrence += 1
+        if send_at is None or (rule.get('count') and occurrence > int(rule['count'])) or (until and send_at > until):
+            return None
+        if send_at > now:
+            break
+
+    series_id = message.get('series_id', message['id'])
+    item = {key: message[key] for key in CARRIED if key in message}
+    item.update({
+        'id': occurrence_id(series_id, occurrence),
+        'series_id': series_id,
+        'occurrence': occurrence,
+        'send_time': send_at.strftime(TIME_FORMAT),
+        'send_year_month_day': send_at.strftime('%Y-%m-%d'),
+        'sent': 'False',
+        'isDeleted': 'False',
+        'dateAdded': str(datetime.timestamp(datetime.now()))
+    })
+    item[schedule.PENDING_KEY] = schedule.pending_key(item['send_year_month_day'], item['id'])
+    return item
@@ -0,0 +1,103 @@
+import base64
+import gzip
+import hashlib
+import http
+import os
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+# Conditional GET and compression for API Gateway proxy responses.
+#
+# negotiate() runs on the response a handler built: it adds a strong ETag to
+# successful GETs, answers 304 when If-None-Match matches, and compresses large
+# bodies (base64 encoded, as API Gateway expects binary payloads) when the
+# client's Accept-Encoding allows it.
+
+compress_min_bytes = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+compress_level = int(os.environ.get('COMPRESS_LEVEL', 5))
+
+
+def request_headers(event: dict) -> dict:
+    return {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+
+
+def accepted_encodings(accept_encoding: str) -> dict:
+    """Parse Accept-Encoding into {encoding: q}."""
+    encodings = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(accept_encoding: str, size: int) -> str:
+    if size < compress_min_bytes:
+        return None
+    encodings = accepted_encodings(accept_encoding)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    candidates = [e for e in candidates if encodings.get(e, encodings.get('*', 0)) > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda e: encodings.get(e, encodings.get('*', 0)))
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=compress_level)
+    # mtime=0 keeps the output, and so the ETag, stable
+    return gzip.compress(data, compresslevel=compress_level, mtime=0)
+
+
+def etag_for(data: bytes, encoding: str = None) -> str:
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    # each encoding is a different representation and needs its own strong validator
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(','))
+
+
+def negotiate(response: dict, event: dict) -> dict:
+    body = response.get('body')
+    if body is None or response.get('isBase64Encoded'):
+        return response
+
+    headers = request_headers(event)
+    data = body.encode('utf-8')
+    encoding = choose_encoding(headers.get('accept-encoding'), len(data))
+    response_headers = dict(response.get('headers') or {})
+    response_headers['Vary'] = 'Accept-Encoding'
+
+    if event.get('httpMethod') == 'GET' and response.get('statusCode') == http.HTTPStatus.OK:
+        etag = etag_for(data, encoding)
+        response_headers['ETag'] = etag
+        if etag_matches(headers.get('if-none-match'), etag):
+            return {'statusCode': http.HTTPStatus.NOT_MODIFIED, 'headers': response_headers}
+
+    if encoding is None:
+        return dict(response, headers=response_headers)
+
+    response_headers['Content-Encoding'] = encoding
+    return dict(
+        response,
+        headers=response_headers,
+        body=base64.b64encode(compress(data, encoding)).decode('ascii'),
+        isBase64Encoded=True
+    )
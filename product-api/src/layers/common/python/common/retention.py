@@ -0,0 +1,42 @@
+import os
+import time
+
+# Retention of finished messages.
+#
+# A message that was sent or deleted gets a TTL attribute, TTL_ATTRIBUTE, in
+# epoch seconds: SENT_RETENTION_DAYS or DELETED_RETENTION_DAYS later. DynamoDB
+# deletes expired items in the background (typically within a few days of
+# expiry), which drops them from every index; the table's stream hands the
+# deleted items to the archiver. 'off' (or empty) keeps those messages forever.
+
+TTL_ATTRIBUTE = 'expires_at'
+DAY = 86400
+
+
+def parse_days(value):
+    if value is None or value.strip().lower() in ('', 'off', 'none'):
+        return None
+    days = float(value)
+    if days < 0:
+        raise ValueError(f'Retention must be 0 days or more: {value}')
+    return days
+
+
+sent_days = parse_days(os.environ.get('SENT_RETENTION_DAYS', '90'))
+deleted_days = parse_days(os.environ.get('DELETED_RETENTION_DAYS', '30'))
+
+
+def expires_at(days, since: float = None) -> int:
+    """Epoch seconds `days` after `since` (default now), or None when retention is off."""
+    if days is None:
+        return None
+    since = time.time() if since is None else since
+    return int(since + days * DAY)
+
+
+def ttl_update(days, since: float = None) -> tuple:
+    """(', #ttl = :ttl', names, values) to add to an UpdateExpression's set clause, or empty parts."""
+    expires = expires_at(days, since)
+    if expires is None:
+        return '', {}, {}
+    return ', #ttl = :ttl', {'#ttl': TTL_ATTRIBUTE}, {':ttl': expires}
@@ -0,0 +1,109 @@
+import re
+import threading
+import time
+
+from common import metrics
+
+# Table-driven request routing for API Gateway proxy events.
+#
+# Routes are registered once at import time under (method, resource template).
+# API Gateway already tells us the matched resource ('/messages/{owner}') and
+# its path parameters, so most requests resolve with one dict lookup; events
+# without a resource (local tooling) fall back to templates precompiled to regexes.
+# Each dispatch is timed: the route keeps running counters for the container
+# (stats()) and reports the request to common.metrics for the invocation summary.
+
+_parameter = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)\+?\}')
+
+
+def compile_template(template: str):
+    pattern = ''
+    position = 0
+    for match in _parameter.finditer(template):
+        pattern += re.escape(template[position:match.start()])
+        greedy = match.group(0).endswith('+}')
+        pattern += f'(?P<{match.group(1)}>{".+" if greedy else "[^/]+"})'
+        position = match.end()
+    pattern += re.escape(template[position:])
+    return re.compile(f'^{pattern}/?$')
+
+
+class Route:
+    def __init__(self, method: str, template: str, handler, requires_body: bool = False):
+        self.method = method
+        self.template = template
+        self.handler = handler
+        self.requires_body = requires_body
+        self.pattern = compile_template(template)
+        self.static = not _parameter.search(template)
+        self.counters = {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+
+class Router:
+    def __init__(self):
+        self.routes = {}  # (method, template) -> Route
+        self.static_paths = {}  # (method, path) -> Route, for templates without parameters
+        self.dynamic = []  # routes with parameters, matched by regex when there is no resource
+        self.lock = threading.Lock()
+
+    def add(self, method: str, template: str, handler, requires_body: bool = False):
+        route = Route(method.upper(), template, handler, requires_body)
+        self.routes[(route.method, template)] = route
+        if route.static:
+            self.static_paths[(route.method, template)] = route
+        else:
+            self.dynamic.append(route)
+        return route
+
+    def match(self, method: str, resource: str = None, path: str = None):
+        """Returns (route, path parameters) or (None, None)."""
+        route = self.routes.get((method, resource)) if resource else None
+        if route is not None:
+            return route, None
+        if path is None:
+            return None, None
+        route = self.static_paths.get((method, path.rstrip('/') or '/'))
+        if route is not None:
+            return route, {}
+        for route in self.dynamic:
+            if route.method == method:
+                found = route.pattern.match(path)
+                if found:
+                    return route, found.groupdict()
+        return None, None
+
+    def dispatch(self, input: dict):
+        """Run the handler for a parsed request. Returns None when no route matches."""
+        route, path_params = self.match(input.get('http_method'), input.get('resource'), input.get('path'))
+        if route is None or (route.requires_body and not input.get('body')):
+            return None
+        if path_params:
+            input = dict(input, path_param=dict(input.get('path_param') or {}, **path_params))
+
+        start = time.perf_counter()
+        error = False
+        try:
+            response = route.handler(input)
+            error = response is None or int(response.get('statusCode', 500)) >= 500
+            return response
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self.lock:
+                route.counters['count'] += 1
+                route.counters['errors'] += int(error)
+                route.counters['total_ms'] += elapsed
+                route.counters['max_ms'] = max(route.counters['max_ms'], elapsed)
+                totals = self._totals(route)
+            metrics.recorder.record_request(f'{route.method} {route.template}', elapsed, error, totals)
+
+    @staticmethod
+    def _totals(route: Route) -> dict:
+        counters = route.counters
+        return dict(counters, avg_ms=round(counters['total_ms'] / counters['count'], 3) if counters['count'] else 0.0)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {f'{route.method} {route.template}': self._totals(route) for route in self.routes.values()}
@@ -0,0 +1,30 @@
+import os
+import zlib
+
+# Scheduling attributes and indexes of the Messages table, shared by the API and the scanner.
+
+# Sparse index of the work still to do: the key attribute is only present while
+# a message is unsent and not deleted, so the scanner never reads sent items.
+PENDING_INDEX = 'pending_send_day-send_time-index'
+PENDING_KEY = 'pending_send_day'
+# the scanner moves a message it is sending to this partition of the pending index
+# (with claimed_at), so claims a crashed run left behind can be found and re-queued
+CLAIMED = 'claimed'
+
+# Each send day is spread over SEND_DAY_SHARDS partitions ('2026-10-18#07') so a
+# busy day does not turn into one hot partition for writes or scanner reads.
+send_day_shards = int(os.environ.get('SEND_DAY_SHARDS', 4))
+
+
+def shard_for(message_id: str, shards: int = None) -> int:
+    # crc32 rather than hash(): it has to be stable across processes
+    return zlib.crc32(message_id.encode()) % (shards or send_day_shards)
+
+
+def pending_key(send_year_month_day: str, message_id: str, shards: int = None) -> str:
+    return f'{send_year_month_day}#{shard_for(message_id, shards):02d}'
+
+
+def pending_keys(send_year_month_day: str, shards: int = None) -> list:
+    """Every shard of one send day, for readers that have to query all of them."""
+    return [f'{send_year_month_day}#{shard:02d}' for shard in range(shards or send_day_shards)]
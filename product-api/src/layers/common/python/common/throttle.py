@@ -0,0 +1,173 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from common.ratelimit import AdaptiveLimiter
+
+# Client-side adaptive throttling for the provisioned-capacity tables.
+#
+# install() takes over the shared client's retries: every call first waits
+# for its table's AdaptiveLimiter, throttles and transient errors are retried
+# with jittered exponential backoff, and no wait or retry is allowed to run
+# past the invocation's deadline (start()). When the capacity cannot be had in
+# time the call raises CapacityExceeded instead of timing the function out.
+# capacity() tells batch and scanner code how much headroom a table has left.
+
+logger = logging.getLogger()
+
+mode = os.environ.get('DDB_THROTTLE', 'adaptive')
+max_attempts = int(os.environ.get('DDB_MAX_ATTEMPTS', 3))
+throttle_max_attempts = int(os.environ.get('DDB_THROTTLE_MAX_ATTEMPTS', 8))
+base_delay = float(os.environ.get('DDB_BACKOFF_BASE_SECONDS', 0.05))
+max_delay = float(os.environ.get('DDB_BACKOFF_MAX_SECONDS', 5))
+min_rate = float(os.environ.get('DDB_THROTTLE_MIN_RATE', 0.5))
+deadline_margin = float(os.environ.get('DEADLINE_MARGIN_SECONDS', 1))
+
+THROTTLE_CODES = {
+    'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded', 'Throttling'
+}
+TRANSIENT_CODES = {'InternalServerError', 'ServiceUnavailable', 'TransactionInProgressException'}
+READ_OPERATIONS = {'GetItem', 'Query', 'Scan', 'BatchGetItem', 'TransactGetItems'}
+
+_limiters = {}
+_lock = threading.Lock()
+# one invocation at a time per container; its worker threads share the deadline
+deadline = None
+
+
+class CapacityExceeded(Exception):
+    """The table's capacity could not be had before the invocation deadline."""
+
+    def __init__(self, table: str, kind: str, retry_after: float = 1.0):
+        super().__init__(f'Not enough {kind} capacity on {table} before the deadline')
+        self.table = table
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+def start(context=None, margin: float = None) -> float:
+    """Set the deadline for this invocation from the Lambda context; returns it (monotonic)."""
+    if context is None:
+        return set_deadline(None)
+    margin = deadline_margin if margin is None else margin
+    remaining = context.get_remaining_time_in_millis() / 1000
+    return set_deadline(time.monotonic() + max(0.0, remaining - margin))
+
+
+def set_deadline(value: float = None) -> float:
+    global deadline
+    deadline = value
+    return value
+
+
+def remaining() -> float:
+    return float('inf') if deadline is None else deadline - time.monotonic()
+
+
+def get_limiter(table: str, kind: str) -> AdaptiveLimiter:
+    key = (table, kind)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _lock:
+            limiter = _limiters.setdefault(key, AdaptiveLimiter(min_rate=min_rate))
+    return limiter
+
+
+def capacity(table: str, kind: str = 'write', seconds: float = None) -> float:
+    """Units of `kind` capacity the table can take until the deadline (or `seconds`); inf if never throttled."""
+    seconds = remaining() if seconds is None else seconds
+    if seconds == float('inf'):
+        seconds = 1.0
+    return get_limiter(table, kind).available(max(0.0, seconds))
+
+
+def throttled(table: str, kind: str = 'write'):
+    """Report a throttle signal that did not come back as an error, e.g. UnprocessedItems."""
+    get_limiter(table, kind).throttled()
+
+
+def reset():
+    with _lock:
+        _limiters.clear()
+    set_deadline(None)
+
+
+def is_throttle(error: Exception) -> bool:
+    if isinstance(error, CapacityExceeded):
+        return True
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code') in THROTTLE_CODES
+
+
+def backoff_delay(attempt: int) -> float:
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def kind_of(operation: str) -> str:
+    return 'read' if operation in READ_OPERATIONS else 'write'
+
+
+def provide_params(params, model, context, **kwargs):
+    table = params.get('TableName') or ','.join(sorted(params.get('RequestItems') or {})) or None
+    kind = kind_of(model.name)
+    context['ddb_throttle'] = (table, kind)
+    if table is None:
+        return
+    if not get_limiter(table, kind).acquire(deadline):
+        raise CapacityExceeded(table, kind, retry_after=max(1.0, get_limiter(table, kind).wait_time()))
+
+
+def after_call(http_response, parsed, model, context, **kwargs):
+    table, kind = context.get('ddb_throttle', (None, None))
+    if table is None or http_response.status_code >= 300:
+        return
+    consumed = parsed.get('ConsumedCapacity')
+    entries = consumed if isinstance(consumed, list) else [consumed] if consumed else []
+    units = sum(float(entry.get('CapacityUnits', 0)) for entry in entries)
+    get_limiter(table, kind).consumed(units or 1.0)
+
+
+def needs_retry(response, attempts, caught_exception, request_dict, operation, **kwargs):
+    """Returns the seconds to sleep before the next attempt, or None to give up."""
+    table, kind = (request_dict.get('context') or {}).get('ddb_throttle', (None, None))
+    if caught_exception is not None:
+        code = type(caught_exception).__name__
+        retryable = 'Connection' in code or 'Timeout' in code
+        throttle = False
+    elif response is not None:
+        http_response, parsed = response
+        code = parsed.get('Error', {}).get('Code')
+        throttle = code in THROTTLE_CODES
+        retryable = throttle or code in TRANSIENT_CODES or http_response.status_code >= 500
+    else:
+        return None
+    if not retryable:
+        return None
+
+    limiter = get_limiter(table, kind) if table else None
+    if throttle and limiter is not None:
+        limiter.throttled()
+    if attempts >= (throttle_max_attempts if throttle else max_attempts):
+        return None
+    delay = backoff_delay(attempts)
+    if limiter is not None:
+        delay = max(delay, limiter.wait_time())
+    if delay > remaining():
+        logger.warning('Giving up on %s %s after %d attempts: %s, %.2fs left',
+                       operation.name, table, attempts, code, remaining())
+        return None
+    return delay
+
+
+def install(client):
+    """Put a DynamoDB client's calls and retries under the adaptive limiter; safe to call more than once."""
+    if mode == 'off':
+        return
+    events = client.meta.events
+    # this handler decides every retry, so botocore's own must not run as well
+    events.unregister('needs-retry.dynamodb', unique_id='retry-config-dynamodb')
+    events.register('provide-client-params.dynamodb.*', provide_params, unique_id='texter-throttle-params')
+    events.register('after-call.dynamodb.*', after_call, unique_id='texter-throttle-after')
+    events.register('needs-retry.dynamodb', needs_retry, unique_id='texter-throttle-retry')
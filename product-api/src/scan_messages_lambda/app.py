@@ -1,24 +1,42 @@
-import json
-
-import boto3
+import heapq
 import os
-from boto3.dynamodb.conditions import Key, Attr
+import time
 
-from datetime import datetime, timezone
-from twilio.rest import Client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import logging
 
+from common import dynamodb, encoding, logs, metrics, recurrence, retention, schedule, throttle
+from common.dispatch import Dispatcher, Sender
+from common.ratelimit import TokenBucket
+
 account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
 auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
 twilio_number = os.environ.get('TWILIO_NUMBER')
 table_name = os.environ.get('TABLE', 'Messages')
 region = os.environ.get('REGION', 'us-west-2')
+sms_rate_per_second = float(os.environ.get('SMS_RATE_PER_SECOND', 10))
+sms_burst = float(os.environ.get('SMS_BURST', 10))
+sms_max_workers = int(os.environ.get('SMS_MAX_WORKERS', 8))
+scan_lookback_days = int(os.environ.get('SCAN_LOOKBACK_DAYS', 1))
+scan_time_budget = float(os.environ.get('SCAN_TIME_BUDGET_SECONDS', 25))
+scan_time_margin = float(os.environ.get('SCAN_TIME_MARGIN_SECONDS', 3))
+scan_max_query_workers = int(os.environ.get('SCAN_MAX_QUERY_WORKERS', 16))
+# > 0 prefetches messages due in the next N seconds and sends each one at its send_time
+scan_lookahead_seconds = int(os.environ.get('SCAN_LOOKAHEAD_SECONDS', 0))
+# a claim older than this was left by a run that died; longer than any run can last
+scan_claim_timeout = int(os.environ.get('SCAN_CLAIM_TIMEOUT_SECONDS', 900))
+# write units sending one message takes: claiming it (the item, and moving its pending
+# index entry to the claimed partition) and marking it sent (the item and that entry)
+MARK_SENT_UNITS = 5
+# and writing the next occurrence of a recurring one: the item, its owner and pending index entries
+NEXT_OCCURRENCE_UNITS = 3
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logs.configure()
 
 
-def invoke_twilio_api(message: dict, client: Client):
+def invoke_twilio_api(message: dict, client):
     message = client.messages \
         .create(
         body=f'{message.get("message")} -{message.get("display_name")}',
@@ -28,35 +46,304 @@ def invoke_twilio_api(message: dict, client: Client):
     # logger.info(message)
 
 
-def get_messages_to_send(table):
-    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-    send_ymd = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+class TwilioSender(Sender):
+    def __init__(self, client):
+        self.client = client
+
+    def send(self, message: dict):
+        invoke_twilio_api(message, self.client)
+
+
+def mark_sent(table, message: dict, keep_claim: bool = False):
+    params = {
+        'id': message['id']
+    }
+    # sent messages expire after SENT_RETENTION_DAYS, see common.retention
+    ttl, names, values = retention.ttl_update(retention.sent_days)
+    # a kept claim stays in the claimed partition for sweep_claims to finish
+    remove = '' if keep_claim else f" remove {schedule.PENDING_KEY}, claimed_at"
+    response = table.update_item(
+        Key=params,
+        UpdateExpression=f"set sent = :s{ttl}{remove}",
+        ExpressionAttributeValues=dict(values, **{
+            ":s": "True"
+        }),
+        ReturnValues="UPDATED_NEW",
+        **({'ExpressionAttributeNames': names} if names else {})
+    )
+    logger.debug('Marked %s sent: %s', message['id'], logs.payload(response))
+
+
+def schedule_next(table, message: dict):
+    from boto3.dynamodb.conditions import Attr
+    from botocore.exceptions import ClientError
+
+    item = recurrence.next_occurrence(message)
+    if item is None:
+        if message.get('recurrence'):
+            logger.info('Series %s ended with %s', message.get('series_id'), message['id'])
+        return
+    try:
+        # the id is derived from the series, so writing it again (a retried run, or
+        # sweep_claims after a failure) does not add a second next occurrence
+        table.put_item(Item=item, ConditionExpression=Attr('id').not_exists())
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    logger.debug('Scheduled %s of series %s at %s', item['id'], item['series_id'], item['send_time'])
+
+
+def on_sent(table, message: dict):
+    # the SMS went out: it is marked sent even when its next occurrence cannot be
+    # written, and then keeps its claim so sweep_claims writes that occurrence later
+    try:
+        schedule_next(table, message)
+    except Exception:
+        mark_sent(table, message, keep_claim=True)
+        raise
+    mark_sent(table, message)
+
+
+def claim(table, message: dict):
+    """Move message to the claimed partition before sending it; None if another run got it first.
+
+    Scanner runs overlap (lookahead runs last longer than the schedule interval), so a
+    plain read could hand the same message to two of them. Only the run whose
+    conditional update moves the pending key sends it; edits and deletions made
+    after the query are honored because the update returns the current item.
+    """
+    from boto3.dynamodb.conditions import Attr
+    from botocore.exceptions import ClientError
+
+    now = utc_now_iso()
+    try:
+        response = table.update_item(
+            Key={'id': message['id']},
+            UpdateExpression=f"set claimed_at = :now, {schedule.PENDING_KEY} = :c",
+            # not if it was claimed, sent, deleted or rescheduled to later since the query
+            ConditionExpression=Attr(schedule.PENDING_KEY).exists() & Attr(schedule.PENDING_KEY).ne(schedule.CLAIMED)
+            & Attr('send_time').lte(now),
+            ExpressionAttributeValues={':now': now, ':c': schedule.CLAIMED},
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+    return dict(response['Attributes'], claimed_at=now)
+
+
+def release(table, message: dict):
+    """Put a claimed message whose send failed back in the pending index for the next run."""
+    from boto3.dynamodb.conditions import Attr
+
     try:
-        response = table.query(
-            IndexName='send_year_month_day-send_time-index',
-            KeyConditionExpression=Key('send_year_month_day').eq(send_ymd) & Key('send_time').lte(now),
-            FilterExpression=Attr('sent').eq("False")
+        table.update_item(
+            Key={'id': message['id']},
+            UpdateExpression=f"set {schedule.PENDING_KEY} = :p remove claimed_at",
+            ConditionExpression=Attr('claimed_at').eq(message['claimed_at']),
+            ExpressionAttributeValues={':p': message[schedule.PENDING_KEY]}
         )
-        logger.info(response['Items'])
-
-        if len(response['Items']) > 0:
-            client = Client(account_sid, auth_token)
-            for message in response['Items']:
-                invoke_twilio_api(message, client)
-
-            for message in response['Items']:
-                params = {
-                    'id': message['id']
-                }
-                response = table.update_item(
-                    Key=params,
-                    UpdateExpression="set sent = :s",
-                    ExpressionAttributeValues={
-                        ":s": "True"
-                    },
-                    ReturnValues="UPDATED_NEW"
+    except Exception as e:
+        logger.error('Could not release %s for a retry: %s', message['id'], e)
+
+
+def sweep_claims(table, now: datetime) -> dict:
+    """Finish or re-queue the claims runs left behind when they died or failed after sending.
+
+    A claimed message that was marked sent only misses its next occurrence, which
+    is written now. One that was not marked sent goes back to its pending
+    partition: the run may have died before or after the SMS went out, and
+    sending it twice is better than never.
+    """
+    from boto3.dynamodb.conditions import Attr, Key
+    from botocore.exceptions import ClientError
+
+    cutoff = (now - timedelta(seconds=scan_claim_timeout)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    params = {
+        'IndexName': schedule.PENDING_INDEX,
+        'KeyConditionExpression': Key(schedule.PENDING_KEY).eq(schedule.CLAIMED),
+        'FilterExpression': Attr('claimed_at').lt(cutoff)
+    }
+    counts = {'finished': 0, 'requeued': 0}
+    while True:
+        response = table.query(**params)
+        for message in response['Items']:
+            if message.get('sent') == 'True':
+                schedule_next(table, message)
+                update, values, outcome = f"remove {schedule.PENDING_KEY}, claimed_at", {}, 'finished'
+            else:
+                update, outcome = f"set {schedule.PENDING_KEY} = :p remove claimed_at", 'requeued'
+                values = {':p': schedule.pending_key(message['send_year_month_day'], message['id'])}
+            try:
+                table.update_item(
+                    Key={'id': message['id']},
+                    UpdateExpression=update,
+                    ConditionExpression=Attr('claimed_at').eq(message['claimed_at']),
+                    **({'ExpressionAttributeValues': values} if values else {})
                 )
-                logger.info(response)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                continue
+            logger.warning('Claim on %s from %s %s', message['id'], message['claimed_at'], outcome)
+            counts[outcome] += 1
+        if not response.get('LastEvaluatedKey'):
+            return counts
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def build_dispatcher(table, sender: Sender = None) -> Dispatcher:
+    if sender is None:
+        # only runs when something is due, so idle runs never import twilio
+        from twilio.rest import Client
+
+        sender = TwilioSender(Client(account_sid, auth_token))
+    return Dispatcher(
+        sender,
+        on_sent=lambda message: on_sent(table, message),
+        max_workers=sms_max_workers,
+        limiter=TokenBucket(sms_rate_per_second, sms_burst),
+        precheck=lambda message: claim(table, message),
+        release=lambda message: release(table, message)
+    )
+
+
+def utc_now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def seconds_until(send_time: str) -> float:
+    send_at = datetime.strptime(send_time, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    return (send_at - datetime.now(timezone.utc)).total_seconds()
+
+
+def due_partitions(now: datetime, lookback_days: int, until: datetime = None) -> list:
+    # oldest first, so a late run catches up on yesterday before today
+    days = [(now - timedelta(days=days)).strftime("%Y-%m-%d") for days in range(lookback_days, -1, -1)]
+    if until is not None and until.strftime("%Y-%m-%d") not in days:
+        days.append(until.strftime("%Y-%m-%d"))
+    return days
+
+
+def query_partition(table, partition: str, now: str, deadline: float):
+    from boto3.dynamodb.conditions import Key
+
+    # the pending index only holds unsent, not deleted messages, so no filter is needed
+    params = {
+        'IndexName': schedule.PENDING_INDEX,
+        'KeyConditionExpression': Key(schedule.PENDING_KEY).eq(partition) & Key('send_time').lte(now)
+    }
+    items = []
+    while True:
+        response = table.query(**params)
+        items.extend(response['Items'])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return items, True
+        if time.monotonic() >= deadline:
+            return items, False
+        params['ExclusiveStartKey'] = last_key
+
+
+def query_due_messages(table, now: datetime, deadline: float, until: datetime = None):
+    until = until or now
+    until_iso = until.strftime("%Y-%m-%dT%H:%M:%SZ")
+    days = due_partitions(now, scan_lookback_days, until)
+    partitions = [key for day in days for key in schedule.pending_keys(day)]
+    with ThreadPoolExecutor(max_workers=min(len(partitions), scan_max_query_workers)) as executor:
+        results = list(executor.map(lambda partition: query_partition(table, partition, until_iso, deadline), partitions))
+
+    # every shard comes back in send_time order, so a k-way merge is enough
+    messages = list(heapq.merge(*(items for items, _ in results), key=lambda item: item['send_time']))
+    complete = all(done for _, done in results)
+    return messages, complete
+
+
+def get_deadline(context) -> float:
+    remaining = context.get_remaining_time_in_millis() / 1000 if context else scan_time_budget
+    return time.monotonic() + max(0.0, remaining - scan_time_margin)
+
+
+def dispatch_lookahead(dispatcher: Dispatcher, messages: list, deadline: float) -> dict:
+    # min-heap on send_time; the ISO strings sort chronologically
+    heap = [(message['send_time'], message['id'], message) for message in messages]
+    heapq.heapify(heap)
+    results = {'sent': [], 'failed': [], 'skipped': [], 'cancelled': []}
+    while heap:
+        wait = seconds_until(heap[0][0])
+        if wait > 0:
+            if time.monotonic() + wait >= deadline:
+                break
+            time.sleep(wait)
+
+        now_iso = utc_now_iso()
+        due = []
+        while heap and heap[0][0] <= now_iso:
+            due.append(heapq.heappop(heap)[2])
+        for outcome, outcome_messages in dispatcher.dispatch(due, deadline).items():
+            results[outcome].extend(outcome_messages)
+
+    # still pending in the table, the next run's query finds them again
+    results['skipped'].extend(message for _, _, message in heap)
+    return results
+
+
+def within_write_capacity(messages: list, deadline: float) -> tuple:
+    """Split off the messages that could not be marked sent before the deadline.
+
+    A message sent but never marked stays claimed until sweep_claims re-queues it,
+    and is then sent again, so when the table is throttling only as many are sent
+    as there is capacity to mark.
+    """
+    budget = throttle.capacity(table_name, 'write', deadline - time.monotonic())
+    if budget == float('inf'):
+        return messages, []
+    limit = 0
+    for message in messages:
+        budget -= MARK_SENT_UNITS + (NEXT_OCCURRENCE_UNITS if message.get('recurrence') else 0)
+        if budget < 0:
+            break
+        limit += 1
+    return messages[:limit], messages[limit:]
+
+
+def get_messages_to_send(table, sender: Sender = None, deadline: float = None):
+    now = datetime.now(timezone.utc)
+    if deadline is None:
+        deadline = get_deadline(None)
+    throttle.set_deadline(deadline)
+    try:
+        try:
+            sweep_claims(table, now)
+        except Exception as e:
+            # the claims wait for the next run; this one still sends what is due
+            logger.error('Could not sweep stale claims: %s', e)
+
+        if scan_lookahead_seconds > 0:
+            until = now + timedelta(seconds=scan_lookahead_seconds)
+            messages, complete = query_due_messages(table, now, deadline, until)
+        else:
+            messages, complete = query_due_messages(table, now, deadline)
+        logger.info('%d messages due (%s)', len(messages), 'complete' if complete else 'partial')
+        logger.debug('Due: %s', logs.payload(messages))
+
+        messages, deferred = within_write_capacity(messages, deadline)
+        if deferred:
+            logger.warning('Write capacity is throttled: deferring %d messages to the next run', len(deferred))
+
+        results = {'sent': [], 'failed': [], 'skipped': [], 'cancelled': []}
+        if len(messages) > 0 and scan_lookahead_seconds > 0:
+            results = dispatch_lookahead(build_dispatcher(table, sender), messages, deadline)
+        elif len(messages) > 0:
+            # every message is claimed, sent and marked sent by its own worker
+            results = build_dispatcher(table, sender).dispatch(messages, deadline)
+
+        # anything not sent stays sent=False inside the lookback window and is picked up next run
+        results['skipped'] = results['skipped'] + deferred
+        if not complete or results['skipped']:
+            logger.warning('Time budget exhausted: %d messages and %s unread pages left for the next run',
+                           len(results['skipped']), 'no' if complete else 'some')
         return {
             'statusCode': 200,
             'headers': {
@@ -64,14 +351,20 @@ def get_messages_to_send(table):
                 'Access-Control-Allow-Origin': '*'
             },
             'body': {
-                'Message': 'SUCCESS'
+                'Message': 'SUCCESS',
+                'sent': len(results['sent']),
+                'failed': len(results['failed']),
+                'skipped': len(results['skipped']),
+                'cancelled': len(results['cancelled']),
+                'complete': complete and not results['skipped']
             }
         }
     except Exception as e:
+        logger.error(e)
         return {
             'statusCode': 400,
             'headers': {},
-            'body': json.dumps('Error in sending message')
+            'body': encoding.dumps('Error in sending message')
         }
 
 
@@ -80,17 +373,12 @@ def get_current_time():
 
 
 def lambda_handler(event, context):
-    logger.info(event)
-    logger.info(account_sid)
-    logger.info(auth_token)
-    logger.info(twilio_number)
-
-    messages_table = boto3.resource(
-        'dynamodb',
-        region_name=region
-    )
+    # never log the Twilio credentials
+    correlation_id = logs.start(event, context)
+    logger.debug('Event: %s', logs.payload(event))
 
-    table = messages_table.Table(table_name)
+    table = dynamodb.get_table(table_name, region)
 
-    # check the GSI 'send_year_month_day
-    return get_messages_to_send(table)
+    # check the sparse pending GSI
+    with metrics.invocation(context, route='scan', correlationId=correlation_id):
+        return get_messages_to_send(table, deadline=get_deadline(context))
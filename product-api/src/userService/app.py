@@ -1,21 +1,39 @@
+import base64
 import http
+import math
+import re
 
-import boto3
 import os
-import json
-import uuid
+from concurrent.futures import TimeoutError as HashTimeout
 from datetime import datetime
 
 import logging
 
+from common import auth, dynamodb, encoding, logs, metrics, throttle
+from common.cache import TTLCache
+from common.router import Router
+
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logs.configure()
 
-table_name = os.environ.get('TABLE', 'Messages')
+table_name = os.environ.get('TABLE', 'MessagesUsers')
 region = os.environ.get('REGION', 'us-west-2')
 register_path = '/register'
 login_path ='/login'
 verify_path='/verify'
+password_min_length = int(os.environ.get('PASSWORD_MIN_LENGTH', 8))
+PASSWORD_MAX_LENGTH = 1024
+_username = re.compile(r'^[A-Za-z0-9_.@-]{3,64}$')
+
+# user records read by /login and /verify?include=user, kept per container.
+# Misses are not cached, so a user registered on another container can log in right away.
+user_cache = TTLCache(
+    ttl=float(os.environ.get('USER_CACHE_TTL_SECONDS', 60)),
+    max_entries=int(os.environ.get('USER_CACHE_MAX_ENTRIES', 1024)),
+    max_bytes=int(os.environ.get('USER_CACHE_MAX_BYTES', 1024 * 1024))
+)
+# checked against unknown usernames, so they take as long to refuse as wrong passwords
+_dummy_hash = None
 
 
 def build_response(status_code, body=None):
@@ -27,11 +45,23 @@ def build_response(status_code, body=None):
         }
     }
     if body is not None:
-        response['body'] = json.dumps(body)
+        response['body'] = encoding.dumps(body)
+    return response
+
+
+def unauthorized(msg: str):
+    response = build_response(http.HTTPStatus.UNAUTHORIZED, {'msg': msg})
+    response['headers']['WWW-Authenticate'] = 'Bearer'
     return response
 
 
-def parse_input(event: json) -> dict:
+def throttled_response(e: Exception):
+    response = build_response(http.HTTPStatus.SERVICE_UNAVAILABLE, {'msg': 'Too many requests, retry later'})
+    response['headers']['Retry-After'] = str(math.ceil(getattr(e, 'retry_after', 1)))
+    return response
+
+
+def parse_input(event: dict) -> dict:
     operations = {
         'POST',
         'GET'
@@ -46,42 +76,205 @@ def parse_input(event: json) -> dict:
         return build_response(http.HTTPStatus.BAD_REQUEST, msg)
 
     if body is not None:
-        body = json.loads(body)
+        if event.get('isBase64Encoded'):
+            # the API passes every media type through as binary, see BinaryMediaTypes
+            body = base64.b64decode(body)
+        body = encoding.loads(body)
 
     return {
         "body": body,
         'path': path,
-        'http_method': http_method
+        'http_method': http_method,
+        'resource': event.get('resource'),
+        'path_param': event.get('pathParameters'),
+        'query_params': event.get('queryStringParameters') or {},
+        'headers': event.get('headers') or {}
     }
 
 
+def hash_timeout() -> float:
+    # leave the rest of the invocation to the DynamoDB call that follows
+    remaining = throttle.remaining()
+    return None if remaining == float('inf') else max(0.0, remaining)
 
-def lambda_handler(event, context):
-    logger.info(event)
+
+def dummy_hash() -> str:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = auth.hash_password(os.urandom(16).hex())
+    return _dummy_hash
+
+
+def credentials(body) -> tuple:
+    if not isinstance(body, dict):
+        raise ValueError('Need a username and a password')
+    username, password = body.get('username'), body.get('password')
+    if not isinstance(username, str) or not _username.match(username):
+        raise ValueError('Invalid username: 3 to 64 letters, digits or ._@-')
+    if not isinstance(password, str) or not password:
+        raise ValueError('Missing field: password')
+    if len(password) > PASSWORD_MAX_LENGTH:
+        raise ValueError(f'Password longer than {PASSWORD_MAX_LENGTH} characters')
+    return username, password
+
+
+def public_user(user: dict) -> dict:
+    return {key: value for key, value in user.items() if key != 'password_hash'}
+
+
+def get_user(table, username: str) -> dict:
+    user = user_cache.get(username)
+    if user is None:
+        user = table.get_item(Key={'username': username}).get('Item')
+        if user is not None:
+            user_cache.set(username, user)
+    return user
+
+
+def register(body, table):
+    from boto3.dynamodb.conditions import Attr
+    from botocore.exceptions import ClientError
+
+    try:
+        username, password = credentials(body)
+        if len(password) < password_min_length:
+            raise ValueError(f'Password shorter than {password_min_length} characters')
+    except ValueError as e:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': str(e)})
+
+    try:
+        password_hash = auth.run(auth.hash_password, password, timeout=hash_timeout())
+    except HashTimeout as e:
+        return throttled_response(e)
+    user = {
+        'username': username,
+        'password_hash': password_hash,
+        'token_version': 1,
+        'dateAdded': str(datetime.timestamp(datetime.now()))
+    }
+    try:
+        table.put_item(Item=user, ConditionExpression=Attr('username').not_exists())
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return build_response(http.HTTPStatus.CONFLICT, {'msg': f'Username {username} is taken'})
+        logger.error(e)
+        if throttle.is_throttle(e):
+            return throttled_response(e)
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': 'Unable to register'})
+    except throttle.CapacityExceeded as e:
+        logger.error(e)
+        return throttled_response(e)
+
+    user_cache.set(username, user)
+    logger.info('Registered user %s', username)
+    return build_response(http.HTTPStatus.CREATED, {'username': username})
+
+
+def upgrade_hash(table, user: dict, password: str):
+    """Rehash with the current PASSWORD_HASH_ITERATIONS; best effort, the login goes ahead either way."""
+    try:
+        password_hash = auth.run(auth.hash_password, password, timeout=hash_timeout())
+        table.update_item(Key={'username': user['username']}, UpdateExpression='set password_hash = :h',
+                          ExpressionAttributeValues={':h': password_hash})
+    except Exception as e:
+        logger.warning('Could not upgrade the password hash of %s: %s', user['username'], e)
+        return
+    user_cache.set(user['username'], dict(user, password_hash=password_hash))
+
+
+def login(body, table):
+    try:
+        username, password = credentials(body)
+    except ValueError as e:
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': str(e)})
+
+    try:
+        user = get_user(table, username)
+    except Exception as e:
+        logger.error(e)
+        if throttle.is_throttle(e):
+            return throttled_response(e)
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': 'Unable to log in'})
+
+    encoded = user['password_hash'] if user else dummy_hash()
+    try:
+        valid = auth.run(auth.check_password, password, encoded, timeout=hash_timeout())
+    except HashTimeout as e:
+        return throttled_response(e)
+    if user is None or not valid:
+        logger.info('Failed login for %s', username)
+        return unauthorized('Invalid username or password')
+
+    if auth.needs_rehash(encoded):
+        upgrade_hash(table, user, password)
+    issued = auth.issue_token(username, int(user.get('token_version', 1)))
+    logger.info('Logged in %s', username)
+    return build_response(http.HTTPStatus.OK, {
+        'username': username,
+        'token': issued['token'],
+        'token_type': 'Bearer',
+        'expires_in': issued['claims']['exp'] - issued['claims']['iat']
+    })
+
+
+def verify(input, table):
+    token = auth.bearer_token(input['headers'])
+    if token is None:
+        return unauthorized('Missing bearer token')
+    try:
+        claims = auth.verify_token(token)
+    except auth.InvalidToken as e:
+        return unauthorized(str(e))
+
+    body = {'username': claims['sub'], 'expires': claims['exp']}
+    if input['query_params'].get('include') != 'user':
+        # signature and expiry only: no read of the users table
+        return build_response(http.HTTPStatus.OK, body)
+
+    try:
+        user = get_user(table, claims['sub'])
+    except Exception as e:
+        logger.error(e)
+        if throttle.is_throttle(e):
+            return throttled_response(e)
+        return build_response(http.HTTPStatus.BAD_REQUEST, {'msg': 'Unable to read user'})
+    # a bumped token_version revokes the tokens issued before it
+    if user is None or int(user.get('token_version', 1)) != claims.get('ver'):
+        return unauthorized('Token revoked')
+    body['user'] = public_user(user)
+    return build_response(http.HTTPStatus.OK, body)
+
+
+def users_table():
+    return dynamodb.get_table(table_name, region)
+
+
+router = Router()
+router.add('POST', register_path, lambda input: register(input['body'], users_table()), requires_body=True)
+router.add('POST', login_path, lambda input: login(input['body'], users_table()), requires_body=True)
+router.add('GET', verify_path, lambda input: verify(input, users_table()))
+
+
+def handle_request(event):
     input = parse_input(event)
+    if 'statusCode' in input:
+        return input
 
-    messages_table = boto3.resource(
-        'dynamodb',
-        region_name=region
-    )
-
-    table = messages_table.Table(table_name)
-
-    # post
-    if input['body'] and input['path'] == messages_path and input['http_method'] == 'POST':
-        return create_message(input['body'], table)
-    # get by user
-    elif input['resource'] == resource and input['http_method'] == 'GET':
-        return get_messages_by_user(event, table)
-    # get all
-    elif input['path'] == messages_path and input['http_method'] == 'GET':
-        return get_all_messages(table)
-    # put
-    elif input['path'] == messages_path and input['http_method'] == 'PUT' and input['body']:
-        return put_message(input, table)
-    # delete
-    elif input['path'] == messages_path and input['http_method'] == 'DELETE':
-        return delete_message(input, table)
-    else:
-        msg = {'msg': f'Unsupported endpoint invocations: {json.dumps(event)}'}
+    response = router.dispatch(input)
+    if response is None:
+        msg = {'msg': f'Unsupported endpoint invocations: {encoding.dumps(event)}'}
         return build_response(http.HTTPStatus.BAD_REQUEST, msg)
+    return response
+
+
+def lambda_handler(event, context):
+    correlation_id = logs.start(event, context)
+    # DynamoDB waits and password hashing stop short of the function timeout
+    throttle.start(context)
+    route = f'{event.get("httpMethod")} {event.get("resource") or event.get("path")}'
+    logger.info('Request %s', route)
+    # no payload logging: bodies carry passwords and headers carry tokens
+    with metrics.invocation(context, route=route, correlationId=correlation_id):
+        response = handle_request(event)
+    response['headers'] = dict(response.get('headers') or {}, **{'X-Correlation-Id': correlation_id})
+    return response
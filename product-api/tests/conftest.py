@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+# Make the function code and the common layer importable the same way Lambda
+# sees them: `src.<function>.app` and `common.<module>`.
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+layer_path = os.path.join(project_root, 'src', 'layers', 'common', 'python')
+
+for path in (project_root, layer_path):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+
+
+@pytest.fixture(autouse=True)
+def reset_throttle():
+    # the adaptive limiters live for the whole container, i.e. the whole test session
+    from common import throttle
+
+    throttle.reset()
+    yield
+    throttle.reset()
+
+
+@pytest.fixture
+def local_table(monkeypatch):
+    """Factory: local_table(*tables, **options) serves tables from an in-memory DynamoDB.
+
+    common.dynamodb is pointed at it for the rest of the test, and the boto3 Table of
+    the first one is returned; the server itself (metrics, capacity) is local_table.database.
+    """
+    from benchmarks.local_dynamodb import LocalDynamoDB
+    from common import dynamodb
+
+    started = []
+
+    def start(*tables, **options):
+        database = LocalDynamoDB(list(tables), process=False, **options)
+        database.start()
+        started.append(database)
+        monkeypatch.setattr(dynamodb, 'endpoint_url', database.endpoint_url)
+        dynamodb.reset()
+        start.database = database
+        return dynamodb.get_table(tables[0].name)
+
+    yield start
+    dynamodb.reset()
+    for database in started:
+        database.stop()
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from common import batch
+from src.create_messages import app
+
+
+class FlakyResource:
+    """Hands back the last `unprocessed` requests of every call for the first `throttled_calls` calls."""
+
+    def __init__(self, throttled_calls=0, unprocessed=1):
+        self.throttled_calls = throttled_calls
+        self.unprocessed = unprocessed
+        self.calls = []
+        self.written = []
+
+    def batch_write_item(self, RequestItems):
+        (table_name, requests), = RequestItems.items()
+        assert len(requests) <= 25
+        self.calls.append(len(requests))
+        if len(self.calls) <= self.throttled_calls:
+            done, left = requests[:-self.unprocessed], requests[-self.unprocessed:]
+            self.written.extend(done)
+            return {'UnprocessedItems': {table_name: left}}
+        self.written.extend(requests)
+        return {'UnprocessedItems': {}}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(batch.time, 'sleep', lambda seconds: None)
+
+
+def message(i, send_time='2030-01-01T12:00:00'):
+    return {
+        'message': f'hello {i}',
+        'owner': 'ivan',
+        'display_name': 'Ivan',
+        'outgoing_phone': '+15555550100',
+        'send_time': send_time
+    }
+
+
+def test_write_items_chunks_by_25_and_retries_unprocessed():
+    resource = FlakyResource(throttled_calls=2)
+    items = [{'id': str(i)} for i in range(60)]
+
+    failed = batch.write_items(resource, 'Messages', items)
+
+    assert failed == []
+    assert resource.calls[:2] == [25, 1]
+    assert len(resource.written) == 60
+
+
+def test_write_items_reports_items_left_after_max_attempts():
+    resource = FlakyResource(throttled_calls=100)
+
+    failed = batch.write_items(resource, 'Messages', [{'id': '1'}, {'id': '2'}], max_attempts=3)
+
+    assert failed == [({'id': '2'}, 'Unprocessed')]
+    assert len(resource.calls) == 3
+
+
+def test_write_items_fails_chunk_on_validation_error():
+    class BrokenResource:
+        def batch_write_item(self, RequestItems):
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad'}}, 'BatchWriteItem')
+
+    failed = batch.write_items(BrokenResource(), 'Messages', [{'id': '1'}])
+
+    assert failed == [({'id': '1'}, 'ValidationException')]
+
+
+def test_create_messages_batch_returns_per_item_results():
+    resource = FlakyResource()
+    body = {'messages': [message(0), {'owner': 'ivan'}, message(2, send_time='tomorrow')]}
+
+    response = app.create_messages_batch(body, resource)
+    result = json.loads(response['body'])
+
+    assert response['statusCode'] == 207
+    assert result['created'] == 1
+    assert [r['status'] for r in result['results']] == ['created', 'rejected', 'rejected']
+    item = resource.written[0]['PutRequest']['Item']
+    assert item['send_year_month_day'] == '2030-01-01'
+    assert item['send_time'] == '2030-01-01T12:00:00Z'
+    assert item['id'] == result['results'][0]['id']
+
+
+def test_create_messages_batch_enforces_max_size(monkeypatch):
+    monkeypatch.setattr(app, 'batch_max_messages', 2)
+
+    response = app.create_messages_batch([message(i) for i in range(3)], FlakyResource())
+
+    assert response['statusCode'] == 413
+
+
+def test_get_items_chunks_by_100_and_retries_unprocessed_keys():
+    class FlakyReads:
+        def __init__(self):
+            self.calls = []
+
+        def batch_get_item(self, RequestItems):
+            (table_name, request), = RequestItems.items()
+            keys = request['Keys']
+            assert len(keys) <= 100
+            self.calls.append(len(keys))
+            if len(self.calls) == 1:
+                return {'Responses': {table_name: keys[:-10]},
+                        'UnprocessedKeys': {table_name: dict(request, Keys=keys[-10:])}}
+            return {'Responses': {table_name: keys}, 'UnprocessedKeys': {}}
+
+    resource = FlakyReads()
+    keys = [{'id': str(i)} for i in range(150)]
+
+    items, unprocessed = batch.get_items(resource, 'Items', keys)
+
+    assert unprocessed == []
+    assert sorted(items, key=lambda item: int(item['id'])) == keys
+    assert resource.calls == [100, 10, 50]
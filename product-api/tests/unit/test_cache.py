@@ -0,0 +1,58 @@
+from common.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set('a', [1])
+
+    clock.now = 9.9
+    assert cache.get('a') == [1]
+    clock.now = 10
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = TTLCache(ttl=10, max_entries=2)
+    cache.set('a', 'a')
+    cache.set('b', 'b')
+    cache.get('a')
+    cache.set('c', 'c')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'a'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_memory_budget_is_enforced():
+    cache = TTLCache(ttl=10, max_bytes=100)
+    cache.set('a', 'x' * 60)
+    cache.set('b', 'y' * 60)
+    cache.set('huge', 'z' * 101)
+
+    assert cache.get('a') is None
+    assert cache.get('b') == 'y' * 60
+    assert cache.get('huge') is None
+    assert cache.stats()['bytes'] == 60
+
+
+def test_invalidate_and_counters():
+    cache = TTLCache(ttl=10)
+    cache.set(('ivan', ()), 'page')
+    cache.set(('bob', ()), 'page')
+    cache.invalidate(lambda key: key[0] == 'ivan')
+
+    assert cache.get(('ivan', ())) is None
+    assert cache.get(('bob', ())) == 'page'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['invalidations']) == (1, 1, 1)
+    assert stats['hit_ratio'] == 0.5
@@ -0,0 +1,183 @@
+import json
+
+import pytest
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from common import pagination, schedule
+from src.create_messages import app
+
+
+class RecordingTable:
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def scan(self, **kwargs):
+        self.calls.append(('scan', kwargs))
+        return self.response
+
+    def query(self, **kwargs):
+        self.calls.append(('query', kwargs))
+        return self.response
+
+
+@pytest.fixture(autouse=True)
+def empty_owner_cache():
+    app.owner_cache.clear()
+
+
+def get_event(path='/messages', resource='/messages', query=None, owner=None):
+    return {
+        'path': path,
+        'resource': resource,
+        'httpMethod': 'GET',
+        'pathParameters': {'owner': owner} if owner else None,
+        'queryStringParameters': query
+    }
+
+
+def test_cursor_round_trip():
+    key = {'id': 'abc', 'owner': 'ivan', 'send_time': '2026-10-18T10:00:00Z'}
+
+    assert pagination.decode_cursor(pagination.encode_cursor(key)) == key
+    assert pagination.encode_cursor(None) is None
+
+
+def test_get_all_messages_returns_one_page_and_cursor():
+    table = RecordingTable({'Items': [{'id': '1'}], 'LastEvaluatedKey': {'id': '1'}})
+    cursor = pagination.encode_cursor({'id': '0'})
+    input = app.parse_input(get_event(query={'limit': '5', 'cursor': cursor, 'fields': 'id,message'}))
+
+    response = app.get_all_messages(input, table)
+    body = json.loads(response['body'])
+
+    assert response['statusCode'] == 200
+    assert body['items'] == [{'id': '1'}]
+    assert pagination.decode_cursor(body['next_cursor']) == {'id': '1'}
+    _, kwargs = table.calls[0]
+    assert kwargs['Limit'] == 5
+    assert kwargs['ExclusiveStartKey'] == {'id': '0'}
+    assert kwargs['ProjectionExpression'] == '#p0, #p1'
+    assert kwargs['ExpressionAttributeNames'] == {'#p0': 'id', '#p1': 'message'}
+
+
+def test_get_all_messages_last_page_has_no_cursor():
+    table = RecordingTable({'Items': []})
+    input = app.parse_input(get_event())
+
+    body = json.loads(app.get_all_messages(input, table)['body'])
+
+    assert body == {'items': [], 'next_cursor': None}
+    assert table.calls[0][1] == {'Limit': 100, 'FilterExpression': Attr('isDeleted').eq('False')}
+
+
+@pytest.mark.parametrize('query', [{'limit': '0'}, {'limit': 'ten'}, {'cursor': '!!'}, {'fields': 'id;drop'}])
+def test_get_all_messages_rejects_bad_parameters(query):
+    table = RecordingTable({'Items': []})
+    input = app.parse_input(get_event(query=query))
+
+    assert app.get_all_messages(input, table)['statusCode'] == 400
+    assert table.calls == []
+
+
+def test_get_messages_by_user_pushes_range_and_filters_into_query():
+    table = RecordingTable({'Items': [{'id': '1'}], 'LastEvaluatedKey': {'id': '1', 'owner': 'ivan'}})
+    query = {
+        'from': '2026-10-01T00:00:00',
+        'to': '2026-10-31T23:59:59Z',
+        'sent': 'false',
+        'isDeleted': 'False',
+        'order': 'desc',
+        'limit': '20',
+        'fields': 'id,send_time'
+    }
+    event = get_event(path='/messages/ivan', resource='/messages/{owner}', query=query, owner='ivan')
+
+    response = app.get_messages_by_user(app.parse_input(event), table)
+    body = json.loads(response['body'])
+
+    assert response['statusCode'] == 200
+    assert body['next_cursor']
+    _, kwargs = table.calls[0]
+    key_condition = kwargs['KeyConditionExpression']
+    assert key_condition.get_expression()['operator'] == 'AND'
+    range_condition = key_condition.get_expression()['values'][1]
+    assert range_condition.get_expression()['operator'] == 'BETWEEN'
+    assert range_condition.get_expression()['values'][1:] == ('2026-10-01T00:00:00Z', '2026-10-31T23:59:59Z')
+    assert kwargs['FilterExpression'].get_expression()['operator'] == 'AND'
+    assert kwargs['ScanIndexForward'] is False
+    assert kwargs['Limit'] == 20
+
+
+@pytest.mark.parametrize('query', [{'from': 'yesterday'}, {'sent': 'maybe'}, {'order': 'up'}])
+def test_get_messages_by_user_rejects_bad_parameters(query):
+    table = RecordingTable({'Items': []})
+    event = get_event(path='/messages/ivan', resource='/messages/{owner}', query=query, owner='ivan')
+
+    assert app.get_messages_by_user(app.parse_input(event), table)['statusCode'] == 400
+    assert table.calls == []
+
+
+class UpdateTable:
+    def __init__(self, pending):
+        self.pending = pending
+        self.updates = []
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+        # only the update that moves the pending key requires the message to be pending
+        if schedule.PENDING_KEY in kwargs['UpdateExpression'] and not self.pending:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': ''}}, 'UpdateItem')
+        return {'Attributes': {}}
+
+
+def put_input(send_time='2030-01-02T08:00:00'):
+    body = {'id': 'm1', 'message': 'hi', 'outgoing_phone': '+1555', 'send_time': send_time, 'display_name': 'Ivan'}
+    return {'body': body}
+
+
+def test_new_messages_enter_the_pending_index():
+    item = app.build_message_item({
+        'message': 'hi', 'owner': 'ivan', 'display_name': 'Ivan',
+        'outgoing_phone': '+1555', 'send_time': '2030-01-02T08:00:00'
+    })
+
+    assert item[schedule.PENDING_KEY] == schedule.pending_key('2030-01-02', item['id'])
+    assert item[schedule.PENDING_KEY] in schedule.pending_keys('2030-01-02')
+
+
+def test_put_message_moves_pending_entry_of_unsent_message():
+    table = UpdateTable(pending=True)
+
+    assert app.put_message(put_input(), table)['statusCode'] == 200
+    assert len(table.updates) == 1
+    assert f'{schedule.PENDING_KEY} = :p' in table.updates[0]['UpdateExpression']
+    assert table.updates[0]['ExpressionAttributeValues'][':p'] == schedule.pending_key('2030-01-02', 'm1')
+
+
+def test_put_message_keeps_sent_message_out_of_pending_index():
+    table = UpdateTable(pending=False)
+
+    assert app.put_message(put_input(), table)['statusCode'] == 200
+    assert len(table.updates) == 2
+    assert schedule.PENDING_KEY not in table.updates[1]['UpdateExpression']
+
+
+def test_owner_pages_are_cached_until_the_owner_writes():
+    table = RecordingTable({'Items': [{'id': '1', 'owner': 'ivan'}]})
+    event = get_event(path='/messages/ivan', resource='/messages/{owner}', query={'limit': '5'}, owner='ivan')
+
+    first = app.get_messages_by_user(app.parse_input(event), table)
+    second = app.get_messages_by_user(app.parse_input(event), table)
+
+    assert first['body'] == second['body']
+    assert len(table.calls) == 1
+
+    app.invalidate_owner('someone-else')
+    app.get_messages_by_user(app.parse_input(event), table)
+    assert len(table.calls) == 1
+
+    app.invalidate_owner('ivan')
+    app.get_messages_by_user(app.parse_input(event), table)
+    assert len(table.calls) == 2
@@ -0,0 +1,109 @@
+import threading
+import time
+
+from common.dispatch import Dispatcher, Sender
+from common.ratelimit import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RecordingSender(Sender):
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        if message['id'] in self.fail_ids:
+            raise RuntimeError('provider rejected message')
+        with self.lock:
+            self.sent.append(message['id'])
+
+
+def test_token_bucket_allows_burst_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+
+    for _ in range(3):
+        assert bucket.acquire()
+    assert clock.now == 0
+
+    assert bucket.acquire()
+    assert clock.now == 0.5
+
+
+def test_token_bucket_gives_up_after_timeout():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=1, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+
+    assert bucket.acquire(timeout=0.5) is False
+    assert bucket.try_acquire() == 1.0
+
+
+def test_dispatcher_marks_each_message_after_its_own_send():
+    sender = RecordingSender(fail_ids={'2'})
+    marked = []
+    dispatcher = Dispatcher(sender, on_sent=lambda m: marked.append(m['id']), max_workers=4)
+
+    results = dispatcher.dispatch([{'id': str(i)} for i in range(5)])
+
+    assert sorted(marked) == ['0', '1', '3', '4']
+    assert sorted(m['id'] for m in results['sent']) == ['0', '1', '3', '4']
+    assert [(m['id'], error) for m, error in results['failed']] == [('2', 'provider rejected message')]
+
+
+def test_dispatcher_takes_a_token_per_message():
+    class CountingLimiter:
+        acquired = 0
+
+        def acquire(self, timeout=None):
+            CountingLimiter.acquired += 1
+            return True
+
+    dispatcher = Dispatcher(RecordingSender(), on_sent=lambda m: None, limiter=CountingLimiter())
+
+    dispatcher.dispatch([{'id': str(i)} for i in range(7)])
+
+    assert CountingLimiter.acquired == 7
+
+
+def test_dispatcher_skips_messages_once_the_deadline_passed():
+    sender = RecordingSender()
+    dispatcher = Dispatcher(sender, on_sent=lambda m: None)
+
+    results = dispatcher.dispatch([{'id': '1'}, {'id': '2'}], deadline=time.monotonic() - 1)
+
+    assert sender.sent == []
+    assert [m['id'] for m in results['skipped']] == ['1', '2']
+
+
+def test_dispatcher_skips_messages_the_limiter_cannot_fit_before_the_deadline():
+    sender = RecordingSender()
+    limiter = TokenBucket(rate=0.1, capacity=1)
+    dispatcher = Dispatcher(sender, on_sent=lambda m: None, max_workers=1, limiter=limiter)
+
+    results = dispatcher.dispatch([{'id': '1'}, {'id': '2'}], deadline=time.monotonic() + 1)
+
+    assert sender.sent == ['1']
+    assert [m['id'] for m in results['skipped']] == ['2']
+
+
+def test_dispatcher_cancels_messages_the_precheck_turns_down():
+    sender = RecordingSender()
+    fresh = {'1': {'id': '1', 'message': 'edited'}}
+    dispatcher = Dispatcher(sender, on_sent=lambda m: None, precheck=lambda m: fresh.get(m['id']))
+
+    results = dispatcher.dispatch([{'id': '1', 'message': 'old'}, {'id': '2'}])
+
+    assert sender.sent == ['1']
+    assert [m['id'] for m in results['cancelled']] == ['2']
@@ -0,0 +1,42 @@
+import pytest
+
+from common import dynamodb
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    dynamodb.reset()
+    yield
+    dynamodb.reset()
+
+
+def test_table_is_built_once_per_container():
+    first = dynamodb.get_table('Messages', 'us-west-2')
+    second = dynamodb.get_table('Messages', 'us-west-2')
+
+    assert first is second
+    assert first.meta.client is dynamodb.get_resource('us-west-2').meta.client
+
+
+def test_tables_share_one_resource_per_region():
+    messages = dynamodb.get_table('Messages', 'us-west-2')
+    users = dynamodb.get_table('MessagesUsers', 'us-west-2')
+    other_region = dynamodb.get_table('Messages', 'us-east-1')
+
+    assert messages.meta.client is users.meta.client
+    assert messages.meta.client is not other_region.meta.client
+
+
+def test_config_is_read_from_environment(monkeypatch):
+    monkeypatch.setenv('DDB_MAX_POOL_CONNECTIONS', '25')
+    monkeypatch.setenv('DDB_CONNECT_TIMEOUT', '0.5')
+    monkeypatch.setenv('DDB_RETRY_MODE', 'adaptive')
+    monkeypatch.setenv('DDB_MAX_ATTEMPTS', '5')
+    monkeypatch.setenv('DDB_TCP_KEEPALIVE', 'False')
+
+    config = dynamodb.get_resource().meta.client.meta.config
+
+    assert config.max_pool_connections == 25
+    assert config.connect_timeout == 0.5
+    assert config.retries == {'mode': 'adaptive', 'total_max_attempts': 5}
+    assert config.tcp_keepalive is False
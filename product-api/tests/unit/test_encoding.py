@@ -0,0 +1,53 @@
+import json
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.types import Binary
+
+from common import encoding
+
+ITEM = {
+    'id': '1',
+    'price': Decimal('19.99'),
+    'quantity': Decimal('3'),
+    'tags': {'b', 'a'},
+    'blob': Binary(b'\x00\x01'),
+}
+EXPECTED = {'id': '1', 'price': 19.99, 'quantity': 3, 'tags': ['a', 'b'], 'blob': 'AAE='}
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(encoding, 'orjson', None)
+    elif encoding.orjson is None:
+        pytest.skip('orjson not installed')
+    return request.param
+
+
+def test_dynamodb_types_are_encoded_natively(backend):
+    assert json.loads(encoding.dumps(ITEM)) == EXPECTED
+
+
+def test_unknown_types_still_fail(backend):
+    with pytest.raises(TypeError):
+        encoding.dumps({'value': object()})
+
+
+@pytest.mark.parametrize('count', [0, 1, 7, 10])
+def test_iter_dumps_matches_dumps(backend, count):
+    items = [dict(ITEM, id=str(i)) for i in range(count)]
+
+    streamed = b''.join(encoding.iter_dumps(iter(items), chunk_size=3))
+
+    assert json.loads(streamed) == json.loads(encoding.dumps(items))
+
+
+def test_iter_ndjson_writes_one_item_per_line(backend):
+    lines = b''.join(encoding.iter_ndjson([ITEM, ITEM], chunk_size=1)).splitlines()
+
+    assert [json.loads(line) for line in lines] == [EXPECTED, EXPECTED]
+
+
+def test_loads_keeps_numbers_writable_to_dynamodb():
+    assert encoding.loads('{"price": 1.10, "count": 2}') == {'price': Decimal('1.10'), 'count': 2}
@@ -0,0 +1,133 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from benchmarks.local_dynamodb import Table
+from common import export
+
+
+@pytest.fixture
+def table(local_table):
+    table = local_table(Table('Messages', 'id'))
+    with table.batch_writer() as writer:
+        for i in range(120):
+            writer.put_item(Item={'id': f'{i:04d}', 'owner': f'owner{i % 3}', 'message': 'x' * 50, 'n': i})
+    return table
+
+
+def read_export(path: str) -> list:
+    manifest = json.load(open(os.path.join(path, export.MANIFEST)))
+    items = []
+    for part in manifest['files']:
+        with gzip.open(os.path.join(path, part['name'])) as f:
+            items.extend(json.loads(line) for line in f)
+    return items
+
+
+def test_exports_every_item_once_with_the_projection(table, tmp_path):
+    manifest = export.export(table, export.LocalDestination(str(tmp_path)), total_segments=4, workers=2,
+                             fields=['id', 'n'], part_items=10, page_size=10)
+
+    items = read_export(str(tmp_path))
+    assert manifest['items'] == 120
+    assert sorted(item['id'] for item in items) == [f'{i:04d}' for i in range(120)]
+    assert all(set(item) == {'id', 'n'} for item in items)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_pages_are_written_as_they_arrive(table, tmp_path, monkeypatch):
+    events = []
+    original_scan, original_write = table.scan, export.PartWriter.write
+    table.scan = lambda **params: events.append('scan') or original_scan(**params)
+    monkeypatch.setattr(export.PartWriter, 'write',
+                        lambda part, items: events.append(len(items)) or original_write(part, items))
+
+    manifest = export.export(table, export.LocalDestination(str(tmp_path)), total_segments=1, workers=1,
+                             part_items=50, page_size=10)
+
+    # every page is handed to the open part before the next one is read
+    assert events[:4] == ['scan', 10, 'scan', 10]
+    assert all(isinstance(event, str) or event <= 10 for event in events)
+    assert all(a == 'scan' or b == 'scan' for a, b in zip(events, events[1:]))
+    assert [part['items'] for part in manifest['files']] == [50, 50, 20]
+
+
+class FailingDestination(export.LocalDestination):
+    def __init__(self, path, fail_after):
+        super().__init__(path)
+        self.writes = 0
+        self.fail_after = fail_after
+
+    def open(self, name):
+        self.writes += name.endswith('.ndjson.gz')
+        if self.writes > self.fail_after:
+            raise OSError('disk full')
+        return super().open(name)
+
+
+def test_an_interrupted_export_resumes_after_its_last_part(table, tmp_path):
+    options = dict(total_segments=2, workers=1, part_items=10, page_size=10)
+    with pytest.raises(OSError):
+        export.export(table, FailingDestination(str(tmp_path), fail_after=5), **options)
+    written = [name for name in os.listdir(tmp_path) if name.endswith('.ndjson.gz')]
+    assert len(written) == 5
+
+    scans = []
+    original = table.scan
+    table.scan = lambda **params: scans.append(params) or original(**params)
+    export.export(table, export.LocalDestination(str(tmp_path)), **options)
+
+    assert sorted(item['id'] for item in read_export(str(tmp_path))) == [f'{i:04d}' for i in range(120)]
+    assert scans[0].get('ExclusiveStartKey')  # segment 0 carried on from its checkpoint
+    with pytest.raises(ValueError):
+        export.export(table, export.LocalDestination(str(tmp_path)), total_segments=3)
+
+
+class FakeS3:
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.multipart = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey()
+        body = self.objects[Key]
+        return {'Body': type('Body', (), {'read': lambda self: body})()}
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.multipart.append(Key)
+        self.uploads[Key] = []
+        return {'UploadId': Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[Key].append(Body)
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        assert [p['PartNumber'] for p in MultipartUpload['Parts']] == list(range(1, len(self.uploads[Key]) + 1))
+        self.objects[Key] = b''.join(self.uploads.pop(Key))
+
+
+def test_large_files_stream_to_s3_as_multipart_uploads():
+    s3 = FakeS3()
+    target = export.S3Destination('bucket', 'exports/messages/', client=s3, part_size=64 * 1024)
+    items = [{'id': str(i), 'payload': os.urandom(64).hex()} for i in range(2000)]
+
+    export.write_part(target, 'big.ndjson.gz', items)
+    target.write_text('small.json', '{}')
+
+    body = s3.objects['exports/messages/big.ndjson.gz']
+    assert s3.multipart == ['exports/messages/big.ndjson.gz'] and not s3.uploads
+    assert [json.loads(line)['id'] for line in gzip.decompress(body).splitlines()] == [str(i) for i in range(2000)]
+    assert target.read_text('small.json') == '{}'
+    assert target.read_text('missing.json') is None
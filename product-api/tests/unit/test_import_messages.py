@@ -0,0 +1,112 @@
+import csv
+import json
+
+import pytest
+
+from benchmarks.local_dynamodb import Table
+from common import dynamodb, schedule
+from tools import import_messages
+
+FIELDS = ['message', 'owner', 'display_name', 'outgoing_phone', 'send_time']
+
+
+@pytest.fixture
+def local(local_table):
+    local_table(Table('Messages', 'id', indexes={'owner-send_time-index': ('owner', 'send_time'),
+                                                 'pending_send_day-send_time-index': (schedule.PENDING_KEY, 'send_time')}))
+    return dynamodb.get_resource()
+
+
+def row(i):
+    return {'message': f'hello {i}', 'owner': f'owner{i % 5}', 'display_name': 'Campaign',
+            'outgoing_phone': '+15555550100', 'send_time': f'2030-01-{1 + i % 28:02d}T10:00:00'}
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def scan_all(resource):
+    table = resource.Table('Messages')
+    items, params = [], {}
+    while True:
+        response = table.scan(**params)
+        items.extend(response['Items'])
+        if not response.get('LastEvaluatedKey'):
+            return items
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def test_imports_valid_rows_and_rejects_the_rest(local, tmp_path):
+    rows = [row(i) for i in range(60)]
+    rows[7]['send_time'] = 'tomorrow'
+    rows[30]['owner'] = ''
+    path = str(tmp_path / 'campaign.csv')
+    write_csv(path, rows)
+
+    stats = import_messages.import_file(path, local, 'Messages', workers=3, progress_seconds=0)
+
+    assert stats['written'] == 58 and stats['rejected'] == 2 and stats['next_row'] == 60
+    items = scan_all(local)
+    assert len(items) == 58
+    item = next(i for i in items if i['message'] == 'hello 3')
+    assert item['send_year_month_day'] == '2030-01-04' and item['send_time'] == '2030-01-04T10:00:00Z'
+    assert item[schedule.PENDING_KEY].startswith('2030-01-04#')
+    rejected = [json.loads(line) for line in open(path + '.rejected.ndjson')]
+    assert [(r['row'], r['error']) for r in rejected] == [
+        (7, 'incorrectly formatted datetime. Need YYYY-MM-DDTHH:MM:SS'), (30, 'Missing field: owner')]
+    assert json.load(open(path + '.import.json'))['next_row'] == 60
+
+
+def test_a_resumed_import_does_not_duplicate_rows(local, tmp_path):
+    path = str(tmp_path / 'campaign.ndjson')
+    with open(path, 'w') as f:
+        f.writelines(json.dumps(row(i)) + '\n' for i in range(40))
+        f.write('[1, 2]\n')
+
+    first = import_messages.import_file(path, local, 'Messages', workers=2)
+    # pretend the first run stopped with rows 20 and up unconfirmed
+    checkpoint = json.load(open(path + '.import.json'))
+    checkpoint['next_row'] = 20
+    open(path + '.import.json', 'w').write(json.dumps(checkpoint))
+    second = import_messages.import_file(path, local, 'Messages', resume=True, workers=2)
+
+    assert first['written'] == 40 and second['written'] == 0 and second['existing'] == 20
+    assert len(scan_all(local)) == 40
+    assert [json.loads(line)['row'] for line in open(path + '.rejected.ndjson')] == [40]
+
+
+def test_a_resumed_import_leaves_sent_messages_alone(local, tmp_path):
+    path = str(tmp_path / 'campaign.csv')
+    write_csv(path, [row(i) for i in range(30)])
+    import_messages.import_file(path, local, 'Messages', workers=2)
+    table = local.Table('Messages')
+    sent = next(item for item in scan_all(local) if item['message'] == 'hello 25')
+    # the scanner sends a row the interrupted run wrote
+    table.update_item(Key={'id': sent['id']}, UpdateExpression=f'set sent = :s remove {schedule.PENDING_KEY}',
+                      ExpressionAttributeValues={':s': 'True'})
+
+    resumed = import_messages.import_file(path, local, 'Messages', start_row=10, workers=2)
+
+    assert resumed['written'] == 0 and resumed['existing'] == 20
+    stored = table.get_item(Key={'id': sent['id']})['Item']
+    assert stored['sent'] == 'True' and schedule.PENDING_KEY not in stored
+
+
+def test_writes_are_paced_to_the_target_wcu(local, tmp_path):
+    clock = {'now': 0.0}
+    path = str(tmp_path / 'campaign.csv')
+    write_csv(path, [row(i) for i in range(100)])
+    importer = import_messages.Importer(local, 'Messages', 'test', rejected=open(str(tmp_path / 'rejected'), 'w'),
+                                        wcu=20, workers=1)
+    importer.limiter.clock = lambda: clock['now']
+    importer.limiter.sleep = lambda seconds: clock.update(now=clock['now'] + seconds)
+    importer.limiter.updated = importer.limiter.tokens = 0
+
+    stats = importer.run(import_messages.read_rows(path, 'csv'))
+
+    assert stats['written'] == 100
+    assert clock['now'] == pytest.approx(stats['wcu'] / 20, rel=0.05)
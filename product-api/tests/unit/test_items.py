@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+from benchmarks.local_dynamodb import Table
+from src.items import app
+
+
+@pytest.fixture(autouse=True)
+def local(local_table):
+    local_table(Table('Items', 'id', indexes={'isActive-price-index': ('isActive', 'price')}))
+    return local_table.database
+
+
+def call(method, path, body=None, query=None, item_id=None):
+    event = {'httpMethod': method, 'path': path, 'resource': '/items/{id}' if item_id else '/items',
+             'pathParameters': {'id': item_id} if item_id else None, 'queryStringParameters': query,
+             'body': json.dumps(body) if body is not None else None}
+    response = app.lambda_handler(event, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def item(i, **fields):
+    return dict({'itemName': f'item {i}', 'description': 'a thing', 'price': i, 'isActive': i % 2 == 0}, **fields)
+
+
+def create(count):
+    status, body = call('POST', '/items', {'items': [item(i) for i in range(count)]})
+    assert status == 201
+    return [result['id'] for result in body['results']]
+
+
+def test_bulk_create_reports_each_item():
+    status, body = call('POST', '/items', {'items': [item(0), item(1, price=-1), {'itemName': 'x'}, item(3)]})
+
+    assert status == 207 and body['created'] == 2
+    assert [r['status'] for r in body['results']] == ['created', 'rejected', 'rejected', 'created']
+    assert body['results'][2]['error'] == 'Missing field: description'
+    stored = call('GET', f'/items/{body["results"][0]["id"]}', item_id=body['results'][0]['id'])[1]
+    assert stored['isActive'] == 'True' and stored['price'] == 0
+
+
+def test_get_by_id_list_keeps_request_order_and_reports_missing():
+    ids = create(120)
+    wanted = ids[100:] + ['nope'] + ids[:5]
+
+    status, body = call('GET', '/items', query={'ids': ','.join(wanted), 'fields': 'itemName'})
+
+    assert status == 200
+    assert [i['id'] for i in body['items']] == ids[100:] + ids[:5]
+    assert set(body['items'][0]) == {'id', 'itemName'}
+    assert body['missing'] == ['nope'] and body['unprocessed'] == []
+    assert call('GET', '/items', query={'ids': ','.join(ids)})[0] == 400  # over ITEMS_MAX_IDS
+
+
+def test_bulk_update_and_delete():
+    ids = create(30)
+
+    status, body = call('PUT', '/items', {'items': [{'id': ids[0], 'price': 99, 'isActive': 'False'},
+                                                    {'id': 'nope', 'price': 1}, {'id': ids[1]}]})
+    assert status == 207 and body['updated'] == 1
+    assert [(r['status'], r.get('error')) for r in body['results']] == [
+        ('updated', None), ('failed', 'Not found'), ('rejected', 'Nothing to update: need one of '
+                                                                 'itemName, description, price, isActive')]
+    assert call('GET', f'/items/{ids[0]}', item_id=ids[0])[1]['price'] == 99
+
+    status, body = call('DELETE', '/items', {'ids': ids + [ids[0]]})
+    assert status == 200 and body['deleted'] == 31
+    assert call('GET', '/items', query={'ids': ','.join(ids[:3])})[1]['missing'] == ids[:3]
+
+
+def test_single_item_routes():
+    status, created = call('POST', '/items', item(1))
+    assert status == 201
+
+    assert call('PUT', f'/items/{created["id"]}', {'description': 'new'}, item_id=created['id'])[1]['description'] == 'new'
+    assert call('PUT', '/items/nope', {'description': 'new'}, item_id='nope')[0] == 404
+    assert call('DELETE', f'/items/{created["id"]}', item_id=created['id'])[0] == 200
+    assert call('GET', f'/items/{created["id"]}', item_id=created['id'])[0] == 404
+
+
+def test_catalog_queries_the_index_by_price_range_with_cursors(local):
+    create(40)  # even prices are active
+    local.reset_metrics()
+
+    query = {'min_price': '10', 'max_price': '30', 'order': 'desc', 'limit': '4', 'fields': 'itemName,price'}
+    prices, cursor = [], None
+    while True:
+        status, page = call('GET', '/items', query=dict(query, cursor=cursor) if cursor else query)
+        assert status == 200
+        prices += [item['price'] for item in page['items']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert prices == list(range(30, 9, -2))
+    assert all(set(item) <= {'itemName', 'price'} for item in page['items'])
+    operations = {name for table in local.metrics().values() for name in table}
+    assert operations == {'Query'}
+    assert [i['price'] for i in call('GET', '/items', query={'active': 'false', 'max_price': '5'})[1]['items']] == [1, 3, 5]
+
+
+@pytest.mark.parametrize('query', [{'active': 'maybe'}, {'min_price': 'cheap'}, {'min_price': '5', 'max_price': '1'},
+                                   {'order': 'up'}, {'cursor': 'garbage'}])
+def test_catalog_query_rejects_bad_parameters(query):
+    assert call('GET', '/items', query=query)[0] == 400
+
+
+def test_migrate_items_brings_old_rows_into_the_catalog():
+    from common import dynamodb
+    from tools import migrate_items
+
+    table = dynamodb.get_table('Items')
+    old = [{'id': 'a', 'itemName': 'a', 'price': 3, 'isActive': True},
+           {'id': 'b', 'itemName': 'b', 'price': '4.50', 'isActive': 'true'},
+           {'id': 'c', 'itemName': 'c', 'price': 5, 'isActive': False},
+           {'id': 'd', 'itemName': 'd', 'price': 6, 'isActive': 'yes'}]
+    for row in old:
+        table.put_item(Item=row)
+    assert call('GET', '/items')[1]['items'] == []
+
+    assert migrate_items.migrate(table, rate=100) == {'updated': 3, 'invalid': 1, 'skipped': 0}
+
+    assert [i['itemName'] for i in call('GET', '/items', query={'fields': 'itemName'})[1]['items']] == ['a', 'b']
+    assert [i['id'] for i in call('GET', '/items', query={'active': 'false'})[1]['items']] == ['c']
+    assert migrate_items.migrate(table, rate=100) == {'updated': 0, 'invalid': 1, 'skipped': 0}
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from benchmarks import expressions
+from benchmarks.local_dynamodb import Table
+
+
+@pytest.fixture
+def table(local_table):
+    return local_table(Table('Messages', 'id', indexes={'owner-send_time-index': ('owner', 'send_time')}))
+
+
+@pytest.fixture
+def local(table, local_table):
+    return local_table.database
+
+
+def test_conditions_follow_dynamodb_semantics():
+    item = {'id': '1', 'n': 5, 'tags': {'a', 'b'}, 'doc': {'name': 'x'}}
+
+    def check(expression, values=None):
+        return expressions.evaluate(expressions.parse_condition(expression, {'#n': 'n'}, values), item)
+
+    assert check('#n BETWEEN :a AND :b', {':a': 1, ':b': 5})
+    assert check('attribute_exists(doc.name) AND NOT attribute_exists(missing)')
+    assert check('contains(tags, :t) OR #n = :x', {':t': 'a', ':x': 0})
+    assert not check('#n = :s', {':s': '5'})
+    assert check('missing <> :s', {':s': '5'})
+
+
+def test_update_expressions_apply_set_remove_and_add():
+    actions = expressions.parse_update('SET n = n + :one, doc.name = :v REMOVE tags ADD c :one',
+                                       values={':one': 1, ':v': 'y'})
+
+    updated = expressions.apply_update(actions, {'id': '1', 'n': 5, 'tags': {'a'}, 'doc': {'name': 'x'}})
+
+    assert updated == {'id': '1', 'n': 6, 'doc': {'name': 'y'}, 'c': 1}
+
+
+def test_queries_use_the_index_and_paginate(table):
+    from boto3.dynamodb.conditions import Key
+
+    for i in range(5):
+        table.put_item(Item={'id': str(i), 'owner': 'ivan', 'send_time': f'2026-01-0{i + 1}T00:00:00Z'})
+    table.put_item(Item={'id': 'other', 'owner': 'olga', 'send_time': '2026-01-01T00:00:00Z'})
+
+    params = {'IndexName': 'owner-send_time-index', 'Limit': 2, 'ScanIndexForward': False,
+              'KeyConditionExpression': Key('owner').eq('ivan') & Key('send_time').gt('2026-01-01T00:00:00Z')}
+    first = table.query(**params)
+    second = table.query(ExclusiveStartKey=first['LastEvaluatedKey'], **params)
+
+    assert [item['id'] for item in first['Items'] + second['Items']] == ['4', '3', '2', '1']
+    assert 'LastEvaluatedKey' not in second
+
+
+def test_capacity_is_returned_and_recorded(local, table):
+    response = table.put_item(Item={'id': '1', 'owner': 'ivan', 'send_time': 'x', 'body': 'a' * 1500},
+                              ReturnConsumedCapacity='INDEXES')
+
+    assert response['ConsumedCapacity']['WriteCapacityUnits'] == 4.0
+    assert response['ConsumedCapacity']['GlobalSecondaryIndexes']['owner-send_time-index'] == {'CapacityUnits': 2.0}
+    assert local.metrics()['Messages']['PutItem']['write_units'] == 4.0
+
+    local.reset_metrics()
+    assert local.metrics() == {}
+
+
+def test_failed_conditions_raise_the_service_error(table):
+    from boto3.dynamodb.conditions import Attr
+
+    table.put_item(Item={'id': '1'})
+    with pytest.raises(table.meta.client.exceptions.ConditionalCheckFailedException):
+        table.put_item(Item={'id': '1'}, ConditionExpression=Attr('id').not_exists())
+
+
+def test_messages_handler_round_trip(table):
+    from src.create_messages import app
+
+    app.owner_cache.clear()
+    body = {'message': 'hi', 'owner': 'ivan', 'display_name': 'Ivan', 'outgoing_phone': '+15555550100',
+            'send_time': '2026-01-01T10:00:00'}
+    created = app.lambda_handler({'httpMethod': 'POST', 'path': '/messages', 'body': json.dumps(body)}, None)
+    listed = app.lambda_handler({'httpMethod': 'GET', 'path': '/messages/ivan', 'resource': '/messages/{owner}',
+                                 'pathParameters': {'owner': 'ivan'}}, None)
+
+    assert created['statusCode'] == 201
+    assert [item['message'] for item in json.loads(listed['body'])['items']] == ['hi']
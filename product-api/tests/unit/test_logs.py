@@ -0,0 +1,83 @@
+import logging
+
+import pytest
+
+from common import logs
+
+
+class Context:
+    aws_request_id = 'lambda-request'
+
+
+@pytest.fixture(autouse=True)
+def restore_level():
+    root = logging.getLogger()
+    level = root.level
+    yield
+    root.setLevel(level)
+
+
+def test_payloads_are_serialized_and_truncated_when_emitted():
+    text = str(logs.payload({'items': ['x' * 50]}, limit=20))
+
+    assert text.startswith('{"items":["xxxxxxxx')
+    assert text.endswith('...[44 more chars]')
+    assert str(logs.payload('short', limit=20)) == 'short'
+
+
+def test_turned_down_payloads_are_never_formatted(monkeypatch):
+    calls = []
+    monkeypatch.setattr(logs.Payload, '__str__', lambda self: calls.append(1) or '')
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    logger.debug('Event: %s', logs.payload({'big': 'x' * 100000}))
+    logger.debug('Stats: %s', logs.lazy(lambda: calls.append(2)))
+
+    assert calls == []
+
+
+@pytest.mark.parametrize('event, expected', [
+    ({'headers': {'X-Correlation-Id': 'client-1'}, 'requestContext': {'requestId': 'api'}}, 'client-1'),
+    ({'headers': {'X-Correlation-Id': 'bad id\n'}, 'requestContext': {'requestId': 'api'}}, 'api'),
+    ({'source': 'aws.events'}, 'lambda-request'),
+])
+def test_correlation_id_comes_from_header_api_or_lambda(event, expected):
+    assert logs.start(event, Context()) == expected
+    assert logs.correlation_id == expected
+
+
+def test_sampled_invocations_log_at_debug(monkeypatch):
+    monkeypatch.setattr(logs, 'sample_rate', 0.1)
+    monkeypatch.setattr(logs.random, 'random', lambda: 0.05)
+    logs.start({}, Context())
+    assert logging.getLogger().level == logging.DEBUG
+
+    monkeypatch.setattr(logs.random, 'random', lambda: 0.5)
+    logs.start({}, Context())
+    assert logging.getLogger().level == logging.getLevelName(logs.level)
+
+
+def test_sampled_invocations_keep_the_sdk_wire_logs_off(local_table, monkeypatch, caplog):
+    from benchmarks.local_dynamodb import Table
+
+    table = local_table(Table('Users', 'id'))
+    logs.configure()
+    monkeypatch.setattr(logs, 'sample_rate', 1)
+    logs.start({}, Context())
+
+    with caplog.at_level(logging.DEBUG):
+        table.put_item(Item={'id': 'ivan', 'password_hash': 'secret'})
+        logging.getLogger().debug('Stored %s', 'ivan')
+
+    assert [r.getMessage() for r in caplog.records if r.levelno == logging.DEBUG] == ['Stored ivan']
+    assert not [r for r in caplog.records if r.name.startswith(logs.LIBRARY_LOGGERS) and r.levelno < logging.WARNING]
+
+
+def test_records_carry_the_correlation_id():
+    logs.start({'headers': {'x-correlation-id': 'abc'}})
+    record = logging.LogRecord('root', logging.INFO, __file__, 1, 'hello', None, None)
+
+    logs.CorrelationFilter().filter(record)
+
+    assert (record.correlation_id, record.aws_request_id) == ('abc', '-')
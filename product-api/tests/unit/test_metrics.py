@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from benchmarks.local_dynamodb import Table
+from common import metrics
+
+
+@pytest.fixture
+def table(local_table):
+    return local_table(Table('Messages', 'id', indexes={'owner-send_time-index': ('owner', 'send_time')}))
+
+
+@pytest.fixture
+def lines(monkeypatch):
+    logged = []
+    monkeypatch.setattr(metrics, 'mode', 'calls')
+    monkeypatch.setattr(metrics.output, 'info', lambda line: logged.append(json.loads(line)))
+    return logged
+
+
+def test_every_call_requests_and_logs_consumed_capacity(table, lines):
+    from boto3.dynamodb.conditions import Key
+
+    table.put_item(Item={'id': '1', 'owner': 'ivan', 'send_time': 'a'})
+    table.query(IndexName='owner-send_time-index', KeyConditionExpression=Key('owner').eq('ivan'))
+
+    put, query = lines
+    assert (put['operation'], put['wcu'], put['items']) == ('PutItem', 2.0, 1)
+    assert put['indexes'] == {'owner-send_time-index': 1.0}
+    assert (query['operation'], query['index'], query['rcu'], query['items']) == \
+        ('Query', 'owner-send_time-index', 0.5, 1)
+    assert query['latency_ms'] > 0 and query['response_bytes'] > 0
+
+
+def test_invocation_totals_are_logged_as_embedded_metrics(table, lines):
+    class Context:
+        function_name = 'MessagesFunction'
+        aws_request_id = 'req-1'
+
+    with metrics.invocation(Context(), route='GET /messages'):
+        table.put_item(Item={'id': '1'})
+        table.get_item(Key={'id': '1'})
+        table.get_item(Key={'id': '2'})
+
+    summary = lines[-1]
+    assert summary['Function'] == 'MessagesFunction'
+    assert summary['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Function']]
+    assert (summary['DynamoDBCalls'], summary['ConsumedRCU'], summary['ConsumedWCU']) == (3, 1.0, 1.0)
+    assert {(b['operation'], b['calls']) for b in summary['breakdown']} == {('PutItem', 1), ('GetItem', 2)}
+    assert (summary['route'], summary['requestId']) == ('GET /messages', 'req-1')
+
+
+def test_failed_calls_are_counted_as_errors(table, lines):
+    from boto3.dynamodb.conditions import Attr
+
+    with metrics.invocation():
+        with pytest.raises(table.meta.client.exceptions.ConditionalCheckFailedException):
+            table.delete_item(Key={'id': '1'}, ConditionExpression=Attr('id').exists())
+
+    assert lines[0]['error'] == 'ConditionalCheckFailedException'
+    assert lines[-1]['DynamoDBErrors'] == 1
+
+
+def test_summary_mode_logs_only_the_totals(table, lines, monkeypatch):
+    monkeypatch.setattr(metrics, 'mode', 'summary')
+
+    with metrics.invocation():
+        table.put_item(Item={'id': '1'})
+
+    assert len(lines) == 1 and lines[0]['DynamoDBCalls'] == 1
+
+
+def test_consumed_units_without_read_write_split():
+    assert metrics.consumed_units('Query', {'CapacityUnits': 2.5}) == (2.5, 0.0)
+    assert metrics.consumed_units('BatchWriteItem', [{'CapacityUnits': 3}, {'CapacityUnits': 1}]) == (0.0, 4.0)
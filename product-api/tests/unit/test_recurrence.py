@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks.local_dynamodb import Table
+from common import recurrence, schedule
+from common.dispatch import Sender
+from src.create_messages import app
+from src.scan_messages_lambda import app as scanner
+
+
+class RecordingSender(Sender):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message['id'])
+
+
+def series(rule: dict, send_time='2026-10-19T08:30:00', **state) -> dict:
+    item = app.build_message_item({'message': 'stretch', 'owner': 'ivan', 'display_name': 'Ivan',
+                                   'outgoing_phone': '+1555', 'send_time': send_time, 'recurrence': rule})
+    item.update(state)
+    return item
+
+
+def send_times(message: dict, now: datetime) -> list:
+    times = []
+    while message is not None:
+        times.append(message['send_time'])
+        message = recurrence.next_occurrence(message, now=now)
+    return times
+
+
+@pytest.mark.parametrize('rule', [
+    {'frequency': 'hourly'},
+    {'frequency': 'daily', 'interval': 0},
+    {'frequency': 'weekly', 'weekdays': ['XX']},
+    {'frequency': 'daily', 'until': '2026-10-01T00:00:00'},
+    {'frequency': 'daily', 'count': '3'},
+    {'frequency': 'daily', 'every': 2},
+])
+def test_invalid_rules_are_refused(rule):
+    with pytest.raises(ValueError):
+        series(rule)
+
+
+def test_rules_expand_one_occurrence_at_a_time():
+    now = datetime(2026, 10, 1)
+    # Monday 2026-10-19; every other week on Monday and Thursday, four times
+    weekly = series({'frequency': 'weekly', 'interval': 2, 'weekdays': ['th', 'MO'], 'count': 4})
+    daily = series({'frequency': 'daily', 'interval': 3, 'until': '2026-10-28T08:30:00'})
+
+    assert send_times(weekly, now) == ['2026-10-19T08:30:00Z', '2026-10-22T08:30:00Z',
+                                       '2026-11-02T08:30:00Z', '2026-11-05T08:30:00Z']
+    assert send_times(daily, now) == ['2026-10-19T08:30:00Z', '2026-10-22T08:30:00Z',
+                                      '2026-10-25T08:30:00Z', '2026-10-28T08:30:00Z']
+    one_off = dict(weekly)
+    del one_off['recurrence']
+    assert recurrence.next_occurrence(one_off, now=now) is None
+
+
+def test_a_late_scanner_skips_missed_occurrences():
+    daily = series({'frequency': 'daily', 'count': 10})
+
+    following = recurrence.next_occurrence(daily, now=datetime(2026, 10, 22, 9))
+
+    assert following['send_time'] == '2026-10-23T08:30:00Z' and following['occurrence'] == 5
+    assert following['series_id'] == daily['id'] and following['recurrence'] == daily['recurrence']
+    assert following[schedule.PENDING_KEY].startswith('2026-10-23#')
+
+
+@pytest.fixture
+def table(local_table):
+    indexes = {schedule.PENDING_INDEX: (schedule.PENDING_KEY, 'send_time'), 'owner-send_time-index': ('owner', 'send_time')}
+    return local_table(Table('Messages', 'id', indexes=indexes))
+
+
+def test_scanner_keeps_one_pending_row_per_series(table):
+    due = (datetime.utcnow() - timedelta(minutes=1)).strftime('%Y-%m-%dT%H:%M:%S')
+    first = series({'frequency': 'daily', 'count': 30}, send_time=due)
+    table.put_item(Item=first)
+    sender = RecordingSender()
+
+    assert scanner.get_messages_to_send(table, sender)['body']['sent'] == 1
+    scanner.on_sent(table, first)  # a retried run sends it again but schedules nothing new
+
+    items = sorted(table.scan()['Items'], key=lambda item: item['send_time'])
+    assert sender.sent == [first['id']]
+    assert [(item['occurrence'], item['sent']) for item in items] == [(1, 'True'), (2, 'False')]
+    assert schedule.PENDING_KEY in items[1] and items[1]['send_time'] > due
+    assert scanner.get_messages_to_send(table, sender)['body']['sent'] == 0
@@ -0,0 +1,64 @@
+import base64
+import gzip
+import json
+
+from common import responses
+
+
+def ok_response(body):
+    return {'statusCode': 200, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body)}
+
+
+def get_event(**headers):
+    return {'httpMethod': 'GET', 'headers': headers}
+
+
+def test_large_bodies_are_gzipped_and_base64_encoded(monkeypatch):
+    monkeypatch.setattr(responses, 'brotli', None)
+    body = {'items': [{'id': str(i), 'message': 'hello'} for i in range(200)]}
+
+    response = responses.negotiate(ok_response(body), get_event(**{'Accept-Encoding': 'gzip, deflate'}))
+
+    assert response['isBase64Encoded'] is True
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(base64.b64decode(response['body']))) == body
+
+
+def test_small_bodies_and_identity_clients_are_not_compressed():
+    body = {'items': [{'id': str(i)} for i in range(200)]}
+
+    small = responses.negotiate(ok_response({'id': '1'}), get_event(**{'Accept-Encoding': 'gzip'}))
+    identity = responses.negotiate(ok_response(body), get_event(**{'Accept-Encoding': 'gzip;q=0'}))
+
+    assert 'Content-Encoding' not in small['headers']
+    assert 'Content-Encoding' not in identity['headers']
+    assert json.loads(identity['body']) == body
+
+
+def test_matching_if_none_match_returns_304_without_body():
+    first = responses.negotiate(ok_response({'id': '1'}), get_event())
+    etag = first['headers']['ETag']
+
+    second = responses.negotiate(ok_response({'id': '1'}), get_event(**{'If-None-Match': etag}))
+    changed = responses.negotiate(ok_response({'id': '2'}), get_event(**{'If-None-Match': etag}))
+
+    assert second['statusCode'] == 304
+    assert 'body' not in second
+    assert second['headers']['ETag'] == etag
+    assert changed['statusCode'] == 200
+
+
+def test_etag_differs_per_encoding(monkeypatch):
+    monkeypatch.setattr(responses, 'brotli', None)
+    body = {'items': ['x' * 50] * 50}
+
+    plain = responses.negotiate(ok_response(body), get_event())
+    gzipped = responses.negotiate(ok_response(body), get_event(**{'accept-encoding': 'gzip'}))
+
+    assert plain['headers']['ETag'] != gzipped['headers']['ETag']
+
+
+def test_only_successful_gets_get_an_etag():
+    post = responses.negotiate(ok_response({'id': '1'}), {'httpMethod': 'POST', 'headers': None})
+
+    assert 'ETag' not in post['headers']
@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from benchmarks.local_dynamodb import Table
+from common import export, retention, schedule
+from src.archive_messages import app as archiver
+from src.create_messages import app
+from src.scan_messages_lambda import app as scanner
+
+
+@pytest.fixture
+def table(local_table, monkeypatch):
+    monkeypatch.setattr(retention, 'sent_days', 90)
+    monkeypatch.setattr(retention, 'deleted_days', 30)
+    app.owner_cache.clear()
+    return local_table(Table('Messages', 'id', indexes={'owner-send_time-index': ('owner', 'send_time')}))
+
+
+def add_message(table, owner='ivan') -> dict:
+    item = app.build_message_item({'message': 'hi', 'owner': owner, 'display_name': 'Ivan',
+                                   'outgoing_phone': '+1555', 'send_time': '2030-01-02T08:00:00'})
+    table.put_item(Item=item)
+    return item
+
+
+def test_retention_days_parse_and_turn_off():
+    assert retention.parse_days('90') == 90
+    assert retention.parse_days('off') is None and retention.parse_days('') is None
+    assert retention.expires_at(2, since=1000) == 1000 + 2 * retention.DAY
+    assert retention.ttl_update(None) == ('', {}, {})
+    with pytest.raises(ValueError):
+        retention.parse_days('-1')
+
+
+def test_sent_and_deleted_messages_get_a_ttl(table):
+    sent, deleted = add_message(table), add_message(table)
+
+    scanner.mark_sent(table, sent)
+    delete = {'body': {'id': deleted['id']}}
+    assert app.delete_message(delete, table)['statusCode'] == 200
+    assert app.delete_message({'body': {'id': 'missing'}}, table)['statusCode'] == 404
+
+    stored = {item['id']: item for item in table.scan()['Items']}
+    assert schedule.PENDING_KEY not in stored[sent['id']] and schedule.PENDING_KEY not in stored[deleted['id']]
+    assert abs(stored[sent['id']]['expires_at'] - retention.expires_at(90)) < 60
+    assert stored[deleted['id']]['isDeleted'] == 'True'
+    assert stored[deleted['id']]['expires_at'] < stored[sent['id']]['expires_at']
+
+    event = {'path': '/messages/ivan', 'resource': '/messages/{owner}', 'httpMethod': 'GET',
+             'pathParameters': {'owner': 'ivan'}, 'queryStringParameters': None}
+    listed = json.loads(app.get_messages_by_user(app.parse_input(event), table)['body'])
+    assert [item['id'] for item in listed['items']] == [sent['id']]
+    listed = json.loads(app.get_all_messages({'query_params': {}}, table)['body'])
+    assert [item['id'] for item in listed['items']] == [sent['id']]
+    listed = json.loads(app.get_all_messages({'query_params': {'isDeleted': 'true'}}, table)['body'])
+    assert [item['id'] for item in listed['items']] == [deleted['id']]
+
+
+def test_deletes_are_hard_with_retention_off(table, monkeypatch):
+    monkeypatch.setattr(retention, 'deleted_days', None)
+    item = add_message(table)
+
+    assert app.delete_message({'body': {'id': item['id']}}, table)['statusCode'] == 200
+    assert app.delete_message({'body': {'id': item['id']}}, table)['statusCode'] == 404
+    put = {'id': item['id'], 'message': 'hi', 'outgoing_phone': '+1555', 'send_time': '2030-01-02T09:00:00',
+           'display_name': 'Ivan'}
+    assert app.put_message({'body': put}, table)['statusCode'] == 404
+    assert table.scan()['Items'] == []
+
+
+def stream_record(item: dict, sequence: int, principal='dynamodb.amazonaws.com') -> dict:
+    from boto3.dynamodb.types import TypeSerializer
+
+    serializer = TypeSerializer()
+    return {
+        'eventName': 'REMOVE',
+        'userIdentity': {'type': 'Service', 'principalId': principal},
+        'dynamodb': {'ApproximateCreationDateTime': 1792310400, 'SequenceNumber': f'{sequence:021d}',
+                     'OldImage': {key: serializer.serialize(value) for key, value in item.items()}}
+    }
+
+
+def test_archiver_writes_expired_items_once(tmp_path):
+    target = export.LocalDestination(str(tmp_path))
+    records = [stream_record({'id': str(i), 'owner': 'ivan', 'expires_at': 1792310000}, i) for i in range(1, 4)]
+    records.append(dict(stream_record({'id': 'user-deleted'}, 4), userIdentity=None))
+
+    result = archiver.archive(records, target)
+    assert archiver.archive(records, target) == result  # a retried batch rewrites the same file
+
+    assert result['archived'] == 3
+    assert os.listdir(tmp_path / '2026' / '10' / '18') == [os.path.basename(result['file'])]
+    with gzip.open(tmp_path / result['file']) as f:
+        assert [json.loads(line)['id'] for line in f] == ['1', '2', '3']
+    assert archiver.archive([], target) == {'archived': 0}
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from common import metrics
+from common.router import Router
+from src.create_messages import app
+
+
+def make_router(calls):
+    router = Router()
+    router.add('GET', '/messages', lambda input: calls.append(('all', input)) or {'statusCode': 200})
+    router.add('GET', '/messages/{owner}', lambda input: calls.append(('owner', input)) or {'statusCode': 200})
+    router.add('POST', '/messages', lambda input: calls.append(('post', input)) or {'statusCode': 201},
+               requires_body=True)
+    router.add('GET', '/files/{path+}', lambda input: calls.append(('files', input)) or {'statusCode': 200})
+    return router
+
+
+def test_api_gateway_resource_is_matched_directly():
+    calls = []
+    router = make_router(calls)
+
+    router.dispatch({'http_method': 'GET', 'resource': '/messages/{owner}', 'path': '/messages/ivan',
+                     'path_param': {'owner': 'ivan'}})
+
+    assert calls[0][0] == 'owner'
+    assert calls[0][1]['path_param'] == {'owner': 'ivan'}
+
+
+@pytest.mark.parametrize('path, name, params', [
+    ('/messages', 'all', None),
+    ('/messages/', 'all', None),
+    ('/messages/ivan', 'owner', {'owner': 'ivan'}),
+    ('/files/a/b.txt', 'files', {'path': 'a/b.txt'}),
+])
+def test_path_parameters_are_extracted_without_a_resource(path, name, params):
+    calls = []
+    router = make_router(calls)
+
+    router.dispatch({'http_method': 'GET', 'path': path})
+
+    assert calls[0][0] == name
+    assert calls[0][1].get('path_param') == params
+
+
+def test_unmatched_method_path_or_missing_body_returns_none():
+    router = make_router([])
+
+    assert router.dispatch({'http_method': 'DELETE', 'path': '/messages'}) is None
+    assert router.dispatch({'http_method': 'GET', 'path': '/users'}) is None
+    assert router.dispatch({'http_method': 'POST', 'path': '/messages', 'body': None}) is None
+
+
+def test_routes_count_calls_errors_and_latency():
+    router = Router()
+    router.add('GET', '/ok', lambda input: {'statusCode': 200})
+    router.add('GET', '/fail', lambda input: {'statusCode': 500})
+    router.add('GET', '/boom', lambda input: 1 / 0)
+
+    router.dispatch({'http_method': 'GET', 'path': '/ok'})
+    router.dispatch({'http_method': 'GET', 'path': '/fail'})
+    with pytest.raises(ZeroDivisionError):
+        router.dispatch({'http_method': 'GET', 'path': '/boom'})
+
+    stats = router.stats()
+    assert (stats['GET /ok']['count'], stats['GET /ok']['errors']) == (1, 0)
+    assert stats['GET /fail']['errors'] == 1
+    assert stats['GET /boom']['errors'] == 1
+    assert stats['GET /ok']['max_ms'] >= 0
+
+
+def test_the_routed_request_is_emitted_with_the_invocation_metrics(monkeypatch):
+    lines = []
+    monkeypatch.setattr(metrics.output, 'info', lambda line: lines.append(json.loads(line)))
+    router = make_router([])
+    router.dispatch({'http_method': 'GET', 'path': '/messages'})
+
+    with metrics.invocation(route='GET /messages/ivan'):
+        router.dispatch({'http_method': 'GET', 'path': '/messages/ivan'})
+
+    document, = lines
+    names = [m['Name'] for m in document['_aws']['CloudWatchMetrics'][0]['Metrics']]
+    assert {'RequestLatency', 'RequestErrors'} <= set(names)
+    assert document['RequestErrors'] == 0 and document['RequestLatency'] >= 0
+    assert document['routeStats']['route'] == 'GET /messages/{owner}' and document['routeStats']['count'] == 1
+
+
+def test_messages_handler_rejects_unknown_endpoints():
+    response = app.lambda_handler({'httpMethod': 'GET', 'path': '/unknown', 'headers': {}}, None)
+
+    assert response['statusCode'] == 400
+
+
+def test_messages_handler_rejects_unsupported_methods():
+    response = app.lambda_handler({'httpMethod': 'PATCH', 'path': '/messages'}, None)
+
+    assert response['statusCode'] == 400
@@ -0,0 +1,175 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.local_dynamodb import Table
+from common import recurrence, schedule
+from common.dispatch import Sender
+from src.scan_messages_lambda import app as scanner
+
+
+class RecordingSender(Sender):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        time.sleep(0.05)  # long enough for another run to reach the same message
+        if self.fail:
+            raise RuntimeError('provider rejected message')
+        with self.lock:
+            self.sent.append(message['id'])
+
+
+@pytest.fixture
+def table(local_table):
+    return local_table(Table('Messages', 'id', indexes={schedule.PENDING_INDEX: (schedule.PENDING_KEY, 'send_time')}))
+
+
+class PagedTable:
+    """Pages the table's queries limit items at a time and records them."""
+
+    def __init__(self, table, limit: int):
+        self.table = table
+        self.limit = limit
+        self.queries = []
+
+    def query(self, **params):
+        self.queries.append(params)
+        return self.table.query(Limit=self.limit, **params)
+
+
+def message(message_id: str, send_at: datetime) -> dict:
+    day = send_at.strftime('%Y-%m-%d')
+    return {'id': message_id, 'message': 'hi', 'outgoing_phone': '+1555', 'sent': 'False', 'isDeleted': 'False',
+            'send_time': send_at.strftime('%Y-%m-%dT%H:%M:%SZ'), 'send_year_month_day': day,
+            schedule.PENDING_KEY: schedule.pending_key(day, message_id)}
+
+
+def test_overlapping_runs_send_a_message_once(table):
+    due = message('m1', datetime.now(timezone.utc) - timedelta(seconds=5))
+    table.put_item(Item=due)
+    senders = [RecordingSender(), RecordingSender()]
+    deadline = time.monotonic() + 5
+    runs = [threading.Thread(target=scanner.dispatch_lookahead,
+                             args=(scanner.build_dispatcher(table, sender), [dict(due)], deadline))
+            for sender in senders]
+
+    for run in runs:
+        run.start()
+    for run in runs:
+        run.join()
+
+    assert senders[0].sent + senders[1].sent == ['m1']
+    stored = table.get_item(Key={'id': 'm1'})['Item']
+    assert stored['sent'] == 'True' and schedule.PENDING_KEY not in stored
+
+
+def test_a_failed_send_hands_the_message_back(table):
+    due = message('m1', datetime.now(timezone.utc) - timedelta(seconds=5))
+    table.put_item(Item=due)
+
+    results = scanner.build_dispatcher(table, RecordingSender(fail=True)).dispatch([due], time.monotonic() + 5)
+
+    assert len(results['failed']) == 1
+    stored = table.get_item(Key={'id': 'm1'})['Item']
+    assert stored[schedule.PENDING_KEY] == due[schedule.PENDING_KEY] and 'claimed_at' not in stored
+
+
+def test_a_sent_message_whose_next_occurrence_failed_is_finished_by_the_sweep(table, monkeypatch):
+    now = datetime.now(timezone.utc)
+    due = message('m1', now - timedelta(seconds=5))
+    due['recurrence'] = recurrence.parse({'frequency': 'daily'}, due['send_time'])
+    table.put_item(Item=due)
+    schedule_next = scanner.schedule_next
+
+    def throttled(table, message):
+        raise RuntimeError('ProvisionedThroughputExceededException')
+
+    monkeypatch.setattr(scanner, 'schedule_next', throttled)
+    sender = RecordingSender()
+    assert scanner.get_messages_to_send(table, sender)['body']['failed'] == 1
+    stored = table.get_item(Key={'id': 'm1'})['Item']
+    assert stored['sent'] == 'True' and stored[schedule.PENDING_KEY] == schedule.CLAIMED and 'claimed_at' in stored
+
+    monkeypatch.setattr(scanner, 'schedule_next', schedule_next)
+    assert scanner.sweep_claims(table, now) == {'finished': 0, 'requeued': 0}  # still fresh
+    assert scanner.sweep_claims(table, now + timedelta(hours=1)) == {'finished': 1, 'requeued': 0}
+
+    stored = table.get_item(Key={'id': 'm1'})['Item']
+    assert schedule.PENDING_KEY not in stored and 'claimed_at' not in stored
+    following = [item for item in table.scan()['Items'] if item['id'] != 'm1']
+    assert [item['occurrence'] for item in following] == [2] and sender.sent == ['m1']
+
+
+def test_a_claim_left_by_a_dead_run_is_sent_again(table):
+    now = datetime.now(timezone.utc)
+    due = message('m1', now - timedelta(seconds=5))
+    table.put_item(Item=due)
+    assert scanner.claim(table, dict(due)) is not None  # the run dies here
+    sender = RecordingSender()
+    assert scanner.get_messages_to_send(table, sender)['body']['sent'] == 0
+
+    assert scanner.sweep_claims(table, now + timedelta(hours=1)) == {'finished': 0, 'requeued': 1}
+
+    assert scanner.get_messages_to_send(table, sender)['body']['sent'] == 1
+    stored = table.get_item(Key={'id': 'm1'})['Item']
+    assert sender.sent == ['m1'] and stored['sent'] == 'True' and schedule.PENDING_KEY not in stored
+
+
+def test_a_partition_is_read_page_by_page(table):
+    now = datetime(2026, 10, 18, 12, tzinfo=timezone.utc)
+    for i in range(5):
+        table.put_item(Item=dict(message(f'm{i}', now - timedelta(minutes=i)), **{schedule.PENDING_KEY: '2026-10-18#00'}))
+    paged = PagedTable(table, limit=2)
+
+    items, complete = scanner.query_partition(paged, '2026-10-18#00', '2026-10-18T12:00:00Z', time.monotonic() + 5)
+
+    assert complete and len(paged.queries) == 3
+    assert sorted(item['id'] for item in items) == [f'm{i}' for i in range(5)]
+
+
+def test_a_partition_stops_at_the_deadline_with_a_partial_result(table):
+    now = datetime(2026, 10, 18, 12, tzinfo=timezone.utc)
+    for i in range(5):
+        table.put_item(Item=dict(message(f'm{i}', now - timedelta(minutes=i)), **{schedule.PENDING_KEY: '2026-10-18#00'}))
+    paged = PagedTable(table, limit=2)
+
+    items, complete = scanner.query_partition(paged, '2026-10-18#00', '2026-10-18T12:00:00Z', time.monotonic() - 1)
+
+    assert not complete and len(items) == 2 and len(paged.queries) == 1
+
+
+def test_messages_left_over_from_the_previous_day_are_picked_up(table, monkeypatch):
+    monkeypatch.setattr(scanner, 'scan_lookback_days', 1)
+    now = datetime(2026, 10, 18, 0, 5, tzinfo=timezone.utc)
+    table.put_item(Item=message('late', now - timedelta(hours=1)))
+    table.put_item(Item=message('due', now - timedelta(minutes=1)))
+    table.put_item(Item=message('later', now + timedelta(minutes=10)))
+
+    messages, complete = scanner.query_due_messages(table, now, time.monotonic() + 5)
+
+    assert complete and [m['id'] for m in messages] == ['late', 'due']
+    assert scanner.due_partitions(now, 1) == ['2026-10-17', '2026-10-18']
+
+
+def test_every_shard_is_queried_and_merged_in_send_time_order(table, monkeypatch):
+    monkeypatch.setattr(scanner, 'scan_lookback_days', 0)
+    monkeypatch.setattr(schedule, 'send_day_shards', 4)
+    now = datetime(2026, 10, 18, 12, tzinfo=timezone.utc)
+    messages = [message(f'm{i}', now - timedelta(minutes=i)) for i in range(24)]
+    for item in messages:
+        table.put_item(Item=item)
+    assert len({item[schedule.PENDING_KEY] for item in messages}) == 4
+    queried = []
+    query_partition = scanner.query_partition
+    monkeypatch.setattr(scanner, 'query_partition',
+                        lambda table, partition, *args: queried.append(partition) or query_partition(table, partition, *args))
+
+    due, complete = scanner.query_due_messages(table, now, time.monotonic() + 5)
+
+    assert sorted(queried) == schedule.pending_keys('2026-10-18', 4)
+    assert complete and [m['id'] for m in due] == [f'm{i}' for i in reversed(range(24))]
@@ -0,0 +1,15 @@
+from common import schedule
+
+
+def test_shard_is_stable_and_in_range():
+    shards = {schedule.shard_for(f'message-{i}', 8) for i in range(200)}
+
+    assert shards == set(range(8))
+    assert schedule.shard_for('message-1', 8) == schedule.shard_for('message-1', 8)
+
+
+def test_pending_key_is_one_of_the_day_keys():
+    keys = schedule.pending_keys('2026-10-18', 4)
+
+    assert keys == ['2026-10-18#00', '2026-10-18#01', '2026-10-18#02', '2026-10-18#03']
+    assert schedule.pending_key('2026-10-18', 'abc', 4) in keys
@@ -0,0 +1,124 @@
+import json
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from benchmarks.local_dynamodb import Table
+from common import throttle
+from common.ratelimit import AdaptiveLimiter
+from src.create_messages import app
+from src.scan_messages_lambda import app as scanner
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def throttle_error(operation='PutItem'):
+    return ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'slow down'}},
+                       operation)
+
+
+def test_limiter_is_open_until_the_first_throttle():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(clock=clock, sleep=clock.sleep)
+
+    limiter.consumed(100)
+
+    assert limiter.wait_time() == 0
+    assert limiter.available() == float('inf')
+
+
+def test_limiter_backs_off_multiplicatively_and_recovers_additively():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(beta=0.5, increase=1.0, clock=clock, sleep=clock.sleep)
+    for _ in range(10):
+        clock.now += 0.25
+        limiter.consumed(5)  # 20 units/s
+
+    limiter.throttled()
+    assert limiter.rate == pytest.approx(10 * 0.5 + 5 * 0.5, rel=0.5)
+    rate = limiter.rate
+
+    limiter.consumed(rate * 2)  # two seconds worth of capacity
+    assert limiter.wait_time() == pytest.approx(2, rel=0.1)
+    assert limiter.acquire()
+    assert clock.now == pytest.approx(4.5, rel=0.1)
+    assert limiter.rate > rate
+
+
+def test_limiter_gives_up_at_the_deadline():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(min_rate=1, clock=clock, sleep=clock.sleep)
+    limiter.throttled()
+    limiter.consumed(10)
+
+    assert limiter.acquire(deadline=clock.now + 1) is False
+    assert clock.now == 0
+    assert limiter.available(seconds=5) == 0
+
+
+@pytest.fixture
+def provisioned(local_table, monkeypatch):
+    monkeypatch.setattr(throttle, 'base_delay', 0.01)
+    return local_table(Table('Messages', 'id', write_capacity=20), enforce_capacity=True, burst_seconds=1)
+
+
+def test_bursts_are_paced_instead_of_failing(provisioned):
+    for i in range(45):
+        provisioned.put_item(Item={'id': str(i)})
+
+    limiter = throttle.get_limiter('Messages', 'write')
+    assert limiter.throttles >= 1
+    assert limiter.rate is not None
+
+
+def test_waits_never_run_past_the_deadline(provisioned):
+    throttle.set_deadline(time.monotonic() + 0.3)
+    started = time.monotonic()
+
+    with pytest.raises(Exception) as raised:
+        for i in range(200):
+            provisioned.put_item(Item={'id': str(i)})
+
+    assert throttle.is_throttle(raised.value)
+    assert time.monotonic() - started < 1
+
+
+class ThrottledTable:
+    def put_item(self, **kwargs):
+        raise throttle_error()
+
+    def scan(self, **kwargs):
+        raise throttle.CapacityExceeded('Messages', 'read', retry_after=2.5)
+
+
+def test_handlers_answer_503_with_retry_after_when_throttled():
+    body = {'message': 'hi', 'owner': 'ivan', 'display_name': 'Ivan', 'outgoing_phone': '+15555550100',
+            'send_time': '2030-01-01T10:00:00'}
+
+    created = app.create_message(body, ThrottledTable())
+    listed = app.get_all_messages({'query_params': {}}, ThrottledTable())
+
+    assert created['statusCode'] == 503
+    assert json.loads(created['body']) == {'msg': 'Too many requests, retry later'}
+    assert listed['headers']['Retry-After'] == '3'
+
+
+def test_scanner_only_sends_what_it_can_mark_sent():
+    limiter = throttle.get_limiter(scanner.table_name, 'write')
+    limiter.throttled()  # rate drops to the minimum
+    messages = [{'id': str(i)} for i in range(20)]
+
+    to_send, deferred = scanner.within_write_capacity(messages, time.monotonic() + 10)
+
+    assert 0 < len(to_send) < 20
+    assert to_send + deferred == messages
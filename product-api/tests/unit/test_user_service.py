@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from benchmarks.local_dynamodb import Table
+from common import auth, dynamodb
+from src.userService import app
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setenv('TOKEN_SECRET', 'test-secret')
+    monkeypatch.setattr(auth, 'hash_iterations', 1000)
+    app.user_cache.clear()
+
+
+@pytest.fixture
+def local(local_table):
+    local_table(Table('MessagesUsers', 'username'))
+    return local_table.database
+
+
+def call(method, path, body=None, headers=None, query=None):
+    event = {'httpMethod': method, 'path': path, 'resource': path, 'headers': headers,
+             'queryStringParameters': query, 'body': json.dumps(body) if body is not None else None}
+    response = app.lambda_handler(event, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def reads(database):
+    return sum(op['read_units'] for table in database.metrics().values() for op in table.values())
+
+
+def test_password_hashes_carry_their_cost():
+    encoded = auth.hash_password('correct horse', iterations=500)
+
+    assert encoded.startswith('pbkdf2_sha256$500$')
+    assert auth.check_password('correct horse', encoded)
+    assert not auth.check_password('wrong horse', encoded)
+    assert not auth.check_password('correct horse', 'garbage')
+    assert auth.needs_rehash(encoded)
+    assert not auth.needs_rehash(auth.hash_password('correct horse'))
+
+
+def test_tokens_are_signed_and_expire(monkeypatch):
+    token = auth.issue_token('ivan', ttl=60, now=1000)['token']
+
+    assert auth.verify_token(token, now=1030)['sub'] == 'ivan'
+    with pytest.raises(auth.InvalidToken, match='expired'):
+        auth.verify_token(token, now=1060 + auth.token_leeway + 1)
+    signature = token.split('.')[1]
+    forged = auth.issue_token('admin', ttl=60, now=1000)['token'].split('.')[0]
+    with pytest.raises(auth.InvalidToken, match='signature'):
+        auth.verify_token(f'{forged}.{signature}', now=1030)
+    monkeypatch.setenv('TOKEN_SECRET', 'another-secret')
+    with pytest.raises(auth.InvalidToken):
+        auth.verify_token(token, now=1030)
+
+
+def test_register_login_and_verify(local):
+    credentials = {'username': 'ivan', 'password': 'correct horse'}
+
+    assert call('POST', '/register', credentials) == (201, {'username': 'ivan'})
+    assert call('POST', '/register', credentials)[0] == 409
+    assert call('POST', '/register', {'username': 'x', 'password': 'correct horse'})[0] == 400
+    assert call('POST', '/login', dict(credentials, password='wrong'))[0] == 401
+    assert call('POST', '/login', {'username': 'nobody', 'password': 'correct horse'})[0] == 401
+    status, body = call('POST', '/login', credentials)
+    assert status == 200 and body['token_type'] == 'Bearer'
+
+    app.user_cache.clear()
+    local.reset_metrics()
+    headers = {'authorization': f'Bearer {body["token"]}'}
+    assert call('GET', '/verify', headers=headers)[1]['username'] == 'ivan'
+    assert reads(local) == 0
+    status, verified = call('GET', '/verify', headers=headers, query={'include': 'user'})
+    assert status == 200 and verified['user']['username'] == 'ivan' and 'password_hash' not in verified['user']
+    call('GET', '/verify', headers=headers, query={'include': 'user'})
+    assert reads(local) == 0.5  # the second lookup came from the cache
+    assert call('GET', '/verify')[0] == 401
+    assert call('GET', '/verify', headers={'Authorization': 'Bearer nope'})[0] == 401
+
+
+def test_login_upgrades_hashes_made_with_an_older_cost(local, monkeypatch):
+    call('POST', '/register', {'username': 'ivan', 'password': 'correct horse'})
+    monkeypatch.setattr(auth, 'hash_iterations', 2000)
+
+    assert call('POST', '/login', {'username': 'ivan', 'password': 'correct horse'})[0] == 200
+
+    stored = dynamodb.get_table('MessagesUsers').get_item(Key={'username': 'ivan'})['Item']
+    assert stored['password_hash'].startswith('pbkdf2_sha256$2000$')
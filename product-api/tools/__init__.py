@@ -0,0 +1,14 @@
+import os
+import sys
+
+# Tools run from the product-api folder (`python -m tools.<name>`)
+# and import the function code plus the common layer the same way Lambda does.
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+layer_path = os.path.join(project_root, 'src', 'layers', 'common', 'python')
+
+for path in (project_root, layer_path):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# tools print their own progress; keep the per-call DynamoDB metric lines out of it
+os.environ.setdefault('DDB_METRICS', 'summary')
@@ -0,0 +1,99 @@
+"""Set the TTL attribute on sent and deleted messages that do not have one yet.
+
+Run it once after enabling retention: messages sent or deleted before then carry no
+expires_at and would stay in the table (and its owner index) forever. Sent messages
+expire SENT_RETENTION_DAYS after their send_time, deleted ones DELETED_RETENTION_DAYS
+from now.
+
+    product-api$ python -m tools.apply_retention --dry-run
+    product-api$ SENT_RETENTION_DAYS=90 DELETED_RETENTION_DAYS=30 python -m tools.apply_retention --rate 1
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import tools  # noqa: F401  sets up sys.path
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from common import dynamodb, retention
+from common.ratelimit import TokenBucket
+
+logger = logging.getLogger()
+
+
+def finished_messages(table):
+    params = {
+        'FilterExpression': (Attr('sent').eq('True') | Attr('isDeleted').eq('True'))
+        & Attr(retention.TTL_ATTRIBUTE).not_exists(),
+        'ProjectionExpression': 'id, sent, isDeleted, send_time'
+    }
+    while True:
+        response = table.scan(**params)
+        yield from response['Items']
+        if not response.get('LastEvaluatedKey'):
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def expiry(item: dict, sent_days, deleted_days, now: float) -> int:
+    if item.get('isDeleted') == 'True':
+        return retention.expires_at(deleted_days, now)
+    if sent_days is None:
+        return None
+    try:
+        sent_at = datetime.strptime(item['send_time'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp()
+    except (KeyError, ValueError):
+        sent_at = now
+    return retention.expires_at(sent_days, sent_at)
+
+
+def apply(table, sent_days, deleted_days, rate: float, dry_run: bool = False) -> dict:
+    limiter = TokenBucket(rate)
+    counts = {'updated': 0, 'kept': 0, 'skipped': 0}
+    now = time.time()
+    for item in finished_messages(table):
+        expires = expiry(item, sent_days, deleted_days, now)
+        if expires is None:
+            counts['kept'] += 1
+            continue
+        if dry_run:
+            counts['updated'] += 1
+            continue
+        limiter.acquire()
+        try:
+            table.update_item(
+                Key={'id': item['id']},
+                UpdateExpression='set #ttl = :ttl',
+                # leave alone a message given a TTL since the scan page was read
+                ConditionExpression=Attr('id').exists() & Attr(retention.TTL_ATTRIBUTE).not_exists(),
+                ExpressionAttributeNames={'#ttl': retention.TTL_ATTRIBUTE},
+                ExpressionAttributeValues={':ttl': expires}
+            )
+            counts['updated'] += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            counts['skipped'] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--table', default=os.environ.get('TABLE', 'Messages'))
+    parser.add_argument('--region', default=os.environ.get('REGION', 'us-west-2'))
+    parser.add_argument('--rate', type=float, default=1.0, help='updates per second')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    counts = apply(dynamodb.get_table(args.table, args.region), retention.sent_days, retention.deleted_days,
+                   args.rate, args.dry_run)
+    logger.info(f'{"Would set" if args.dry_run else "Set"} a TTL on {counts["updated"]} messages, '
+                f'kept {counts["kept"]} (retention off), skipped {counts["skipped"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Backfill and reshard pending_send_day on unsent messages.
+
+Run it after deploying a change to the pending index or to SEND_DAY_SHARDS: messages
+written before the index existed have no pending_send_day, and messages written with a
+different shard count sit in shards the scanner no longer queries.
+
+    product-api$ python -m tools.backfill_pending_index --dry-run
+    product-api$ python -m tools.backfill_pending_index --shards 4 --rate 1
+"""
+import argparse
+import logging
+import os
+
+import tools  # noqa: F401  sets up sys.path
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from common import dynamodb, schedule
+from common.ratelimit import TokenBucket
+
+logger = logging.getLogger()
+
+
+def pending_messages(table):
+    params = {
+        # claimed messages are being sent, or are left for the scanner's sweep_claims
+        'FilterExpression': Attr('sent').eq('False') & Attr('isDeleted').eq('False') & Attr('claimed_at').not_exists(),
+        'ProjectionExpression': f'id, send_year_month_day, {schedule.PENDING_KEY}'
+    }
+    while True:
+        response = table.scan(**params)
+        yield from response['Items']
+        if not response.get('LastEvaluatedKey'):
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def backfill(table, shards: int, rate: float, dry_run: bool = False) -> dict:
+    limiter = TokenBucket(rate)
+    counts = {'updated': 0, 'unchanged': 0, 'skipped': 0}
+    for item in pending_messages(table):
+        expected = schedule.pending_key(item['send_year_month_day'], item['id'], shards)
+        if item.get(schedule.PENDING_KEY) == expected:
+            counts['unchanged'] += 1
+            continue
+        if dry_run:
+            counts['updated'] += 1
+            continue
+        limiter.acquire()
+        try:
+            table.update_item(
+                Key={'id': item['id']},
+                UpdateExpression=f"set {schedule.PENDING_KEY} = :p",
+                # the message may have been sent, deleted or rescheduled since the scan page was read
+                ConditionExpression=Attr('sent').eq('False') & Attr('isDeleted').eq('False')
+                & Attr('claimed_at').not_exists() & Attr('send_year_month_day').eq(item['send_year_month_day']),
+                ExpressionAttributeValues={':p': expected}
+            )
+            counts['updated'] += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            counts['skipped'] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--table', default=os.environ.get('TABLE', 'Messages'))
+    parser.add_argument('--region', default=os.environ.get('REGION', 'us-west-2'))
+    parser.add_argument('--shards', type=int, default=schedule.send_day_shards,
+                        help='must match SEND_DAY_SHARDS of the deployed functions')
+    parser.add_argument('--rate', type=float, default=1.0, help='updates per second')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    counts = backfill(dynamodb.get_table(args.table, args.region), args.shards, args.rate, args.dry_run)
+    logger.info(f'{"Would update" if args.dry_run else "Updated"} {counts["updated"]} messages, '
+                f'{counts["unchanged"]} already up to date, skipped {counts["skipped"]}')
+
+
+if __name__ == '__main__':
+    main()
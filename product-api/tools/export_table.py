@@ -0,0 +1,53 @@
+"""Export a table to gzip NDJSON files with a parallel segmented scan.
+
+The destination is a local folder or s3://bucket/prefix. Each segment checkpoints
+after every part file it writes, so running the same command again after an
+interruption resumes where it stopped; a finished export ends with manifest.json.
+
+    product-api$ python -m tools.export_table exports/messages --segments 16 --workers 8
+    product-api$ python -m tools.export_table s3://texter-exports/messages/2026-10-18 --fields id,owner,send_time
+    product-api$ python -m tools.export_table exports/items --table Items
+"""
+import argparse
+import logging
+import os
+
+import tools  # noqa: F401  sets up sys.path
+
+from common import dynamodb, export, pagination
+from src.create_messages import app as messages_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('destination', help='local folder or s3://bucket/prefix')
+    # the messages function's table, like tools.import_messages
+    parser.add_argument('--table', default=messages_app.table_name)
+    parser.add_argument('--region', default=messages_app.region)
+    parser.add_argument('--segments', type=int, default=16, help='Scan TotalSegments; fixed once an export started')
+    parser.add_argument('--workers', type=int, default=8, help='segments scanned at the same time')
+    parser.add_argument('--fields', default='', help='comma-separated attributes to export (default: all)')
+    parser.add_argument('--part-items', type=int, default=100000, help='items per file, rounded up to a page')
+    parser.add_argument('--page-size', type=int, help='Scan Limit (default: 1 MB pages)')
+    parser.add_argument('--s3-endpoint', default=os.environ.get('S3_ENDPOINT'),
+                        help='endpoint of an S3-compatible store')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        fields = pagination.parse_fields(args.fields)
+    except ValueError as e:
+        parser.error(str(e))
+    export.export(
+        dynamodb.get_table(args.table, args.region),
+        export.destination(args.destination, endpoint_url=args.s3_endpoint),
+        total_segments=args.segments,
+        workers=args.workers,
+        fields=fields,
+        part_items=args.part_items,
+        page_size=args.page_size
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""Bulk import scheduled messages from a CSV or NDJSON file.
+
+Every row goes through the same validation and send_year_month_day derivation
+as POST /messages, then rows are written in BatchWriteItem chunks by a pool of
+workers, paced to --wcu table write units per second. The file is streamed, so
+memory stays flat however many rows it has. Rows that fail validation or
+cannot be written go to the rejected file (NDJSON: row, error, data).
+
+Progress is checkpointed next to the input: --resume carries on from the first
+row not yet known to be written. Message ids are derived from the import id and
+the row number, and a run that continues a checkpointed import reads the ids of every chunk
+before writing it, skipping the messages that already exist. A row written by
+the interrupted run is neither duplicated nor reset to unsent once the scanner
+has sent it. The check costs one read unit per row.
+
+    product-api$ python -m tools.import_messages campaign.csv --wcu 200 --workers 8
+    product-api$ python -m tools.import_messages campaign.csv --wcu 200 --resume
+    product-api$ python -m tools.import_messages campaign.ndjson --start-row 250000
+"""
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import tools  # noqa: F401  sets up sys.path
+
+from common import batch, dynamodb, encoding
+from common.ratelimit import TokenBucket
+from src.create_messages import app as messages_app
+
+logger = logging.getLogger()
+
+FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(path: str) -> str:
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+def read_rows(path: str, fmt: str, start_row: int = 0):
+    """Yield (row number, row) from start_row on, counting data rows from 0; NDJSON rows are raw lines."""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = csv.DictReader(f) if fmt == 'csv' else (line for line in f if line.strip())
+        for number, row in enumerate(rows):
+            if number >= start_row:
+                yield number, row
+
+
+def parse_row(row) -> dict:
+    if isinstance(row, str):
+        body = encoding.loads(row)
+        if not isinstance(body, dict):
+            raise TypeError('Need a JSON object')
+        return body
+    # empty CSV cells count as missing fields
+    return {key: value for key, value in row.items() if key is not None and value not in ('', None)}
+
+
+def item_units(item: dict) -> int:
+    """Table write units of one put, from its JSON size (close to DynamoDB's own item size)."""
+    return max(1, math.ceil(len(encoding.dumps_bytes(item)) / 1024))
+
+
+def describe(error: Exception) -> str:
+    if isinstance(error, KeyError):
+        return f'Missing field: {error.args[0]}'
+    return str(error) or type(error).__name__
+
+
+def write_atomic(path: str, text: str):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
+
+
+def keep_rejected_before(path: str, row: int):
+    """Drop the rejects of rows that a resumed import is about to read again."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as source, open(path + '.tmp', 'w', encoding='utf-8') as target:
+        for line in source:
+            if line.strip() and json.loads(line)['row'] < row:
+                target.write(line)
+    os.replace(path + '.tmp', path)
+
+
+class Importer:
+    def __init__(self, resource, table_name: str, import_id: str, rejected, wcu: float = None, workers: int = 8,
+                 chunk_size: int = batch.BATCH_SIZE, max_attempts: int = 10, on_progress=None,
+                 progress_seconds: float = 10, skip_existing: bool = False):
+        self.resource = resource
+        self.table_name = table_name
+        self.import_id = import_id
+        self.rejected = rejected
+        self.limiter = TokenBucket(wcu) if wcu else None
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.on_progress = on_progress
+        self.progress_seconds = progress_seconds
+        # rows the run being resumed may have written already are not written again
+        self.skip_existing = skip_existing
+        self.lock = threading.Lock()
+        self.in_flight = set()  # first row of every chunk being written
+        self.stats = {'read': 0, 'written': 0, 'existing': 0, 'rejected': 0, 'wcu': 0}
+
+    def message_id(self, row: int) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f'texter-import:{self.import_id}:{row}'))
+
+    def reject(self, row: int, data, error: str):
+        line = encoding.dumps({'row': row, 'error': error, 'data': data})
+        with self.lock:
+            self.rejected.write(line + '\n')
+            self.stats['rejected'] += 1
+
+    def acquire(self, units: float):
+        # the bucket holds one second of units, so bigger chunks are paid for in pieces
+        while units > 0:
+            take = min(units, self.limiter.capacity)
+            self.limiter.acquire(take)
+            units -= take
+
+    def new_rows(self, chunk: list) -> list:
+        """The rows of chunk whose message does not exist yet; unconfirmed ones are rejected for a retry."""
+        keys = [{'id': item['id']} for _, _, item in chunk]
+        try:
+            found, unprocessed = batch.get_keys(self.resource, self.table_name, keys, max_attempts=self.max_attempts,
+                                                ProjectionExpression='id', ConsistentRead=True)
+        except Exception as e:
+            logger.error(f'Batch get from {self.table_name} failed: {e}')
+            found, unprocessed = [], keys
+        existing = {item['id'] for item in found}
+        unconfirmed = {key['id'] for key in unprocessed}
+        rows = []
+        for row, data, item in chunk:
+            if item['id'] in unconfirmed:
+                self.reject(row, data, 'Could not check for an existing message')
+            elif item['id'] not in existing:
+                rows.append((row, data, item))
+        with self.lock:
+            self.stats['existing'] += len(existing)
+        return rows
+
+    def write(self, chunk: list) -> int:
+        if self.skip_existing:
+            chunk = self.new_rows(chunk)
+            if not chunk:
+                return 0
+        units = sum(item_units(item) for _, _, item in chunk)
+        if self.limiter is not None:
+            self.acquire(units)
+        requests = [{'PutRequest': {'Item': item}} for _, _, item in chunk]
+        try:
+            failed = batch.write_requests(self.resource, self.table_name, requests, max_attempts=self.max_attempts)
+        except Exception as e:
+            logger.error(f'Batch write to {self.table_name} failed: {e}')
+            failed = [(request, type(e).__name__) for request in requests]
+        errors = {request['PutRequest']['Item']['id']: error for request, error in failed}
+        for row, data, item in chunk:
+            if item['id'] in errors:
+                self.reject(row, data, errors[item['id']])
+        with self.lock:
+            self.stats['written'] += len(chunk) - len(errors)
+            self.stats['wcu'] += units
+        return units
+
+    def next_row(self, buffered: list, read_up_to: int) -> int:
+        """First row not yet known to be written or rejected: where a resumed import starts."""
+        with self.lock:
+            starts = list(self.in_flight)
+        if buffered:
+            starts.append(buffered[0][0])
+        return min(starts, default=read_up_to)
+
+    def run(self, rows, start_row: int = 0) -> dict:
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        started = last_report = time.monotonic()
+        read_up_to = start_row
+        chunk = []
+
+        def done(first_row):
+            def callback(future):
+                with self.lock:
+                    self.in_flight.discard(first_row)
+                slots.release()
+            return callback
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            def submit(chunk):
+                # at most two chunks per worker wait in the queue: memory stays flat
+                slots.acquire()
+                with self.lock:
+                    self.in_flight.add(chunk[0][0])
+                executor.submit(self.write, chunk).add_done_callback(done(chunk[0][0]))
+
+            for number, row in rows:
+                read_up_to = number + 1
+                self.stats['read'] += 1
+                try:
+                    item = messages_app.build_message_item(parse_row(row), self.message_id(number))
+                except (KeyError, TypeError, ValueError) as e:
+                    self.reject(number, row, describe(e))
+                else:
+                    chunk.append((number, row, item))
+                    if len(chunk) == self.chunk_size:
+                        submit(chunk)
+                        chunk = []
+                if time.monotonic() - last_report >= self.progress_seconds:
+                    last_report = time.monotonic()
+                    self.report(self.next_row(chunk, read_up_to), last_report - started)
+            if chunk:
+                submit(chunk)
+        self.report(read_up_to, time.monotonic() - started, final=True)
+        return dict(self.stats, next_row=read_up_to)
+
+    def report(self, next_row: int, elapsed: float, final: bool = False):
+        with self.lock:
+            stats = dict(self.stats)
+        elapsed = max(elapsed, 1e-9)
+        logger.info(f'{"Imported" if final else "Importing"}: {stats["read"]} rows read, {stats["written"]} written, '
+                    f'{stats["existing"]} already there, {stats["rejected"]} rejected, {stats["written"] / elapsed:.0f} rows/s, '
+                    f'{stats["wcu"] / elapsed:.0f} WCU/s, next row {next_row}')
+        if self.on_progress is not None:
+            self.on_progress(next_row, stats)
+
+
+def import_file(path: str, resource, table_name: str, fmt: str = None, checkpoint: str = None,
+                rejected: str = None, resume: bool = False, start_row: int = None, **options) -> dict:
+    """Import one file; returns the counts of this run and the next row to resume from."""
+    fmt = fmt or detect_format(path)
+    checkpoint = checkpoint or f'{path}.import.json'
+    rejected = rejected or f'{path}.rejected.ndjson'
+    state = {}
+    if resume or start_row is not None:
+        if os.path.exists(checkpoint):
+            with open(checkpoint, encoding='utf-8') as f:
+                state = json.load(f)
+        elif resume:
+            raise ValueError(f'No checkpoint to resume from: {checkpoint}')
+    import_id = state.get('import_id') or uuid.uuid4().hex
+    if start_row is None:
+        start_row = state.get('next_row', 0)
+    if start_row:
+        keep_rejected_before(rejected, start_row)
+        logger.info(f'Resuming import {import_id} of {path} at row {start_row}')
+
+    def save(next_row, stats):
+        write_atomic(checkpoint, json.dumps({'import_id': import_id, 'input': path, 'format': fmt,
+                                             'next_row': next_row, 'run': stats}, indent=2))
+
+    with open(rejected, 'a' if start_row else 'w', encoding='utf-8') as rejected_file:
+        importer = Importer(resource, table_name, import_id, rejected_file, on_progress=save,
+                            skip_existing=bool(state), **options)
+        return importer.run(read_rows(path, fmt, start_row), start_row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help='CSV with a header row, or NDJSON: one message object per line')
+    parser.add_argument('--format', choices=FORMATS, help='default: from the file extension')
+    parser.add_argument('--table', default=messages_app.table_name)
+    parser.add_argument('--region', default=messages_app.region)
+    parser.add_argument('--wcu', type=float, help='target table write units per second (default: unpaced)')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent BatchWriteItem calls')
+    parser.add_argument('--checkpoint', help='default: <input>.import.json')
+    parser.add_argument('--rejected', help='default: <input>.rejected.ndjson')
+    parser.add_argument('--resume', action='store_true', help='start from the checkpoint')
+    parser.add_argument('--start-row', type=int, help='start from this data row (0 = first)')
+    parser.add_argument('--progress-seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        import_file(args.input, dynamodb.get_resource(args.region), args.table, fmt=args.format,
+                    checkpoint=args.checkpoint, rejected=args.rejected, resume=args.resume,
+                    start_row=args.start_row, wcu=args.wcu, workers=args.workers,
+                    progress_seconds=args.progress_seconds)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
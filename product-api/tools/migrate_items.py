@@ -0,0 +1,149 @@
+"""Prepare an existing Items table for the catalog index.
+
+The stack only creates the Items table with CreateItemsTable=true; an Items table
+that already exists is used as it is. Run this once against it: it adds the
+isActive-price-index the catalog queries (GET /items), and rewrites isActive and
+price into the types that index keys on. Items written before ItemsFunction
+stored isActive as a boolean (or a lower-case string) and sometimes price as a
+string; such items are not in the index, so the catalog would silently leave
+them out.
+
+    product-api$ python -m tools.migrate_items --dry-run
+    product-api$ python -m tools.migrate_items --rate 5
+"""
+import argparse
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+
+import tools  # noqa: F401  sets up sys.path
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from common import dynamodb
+from common.ratelimit import TokenBucket
+from src.items import app as items_app
+
+logger = logging.getLogger()
+
+FLAGS = {'true': 'True', 'false': 'False'}
+
+
+def ensure_index(table, wait_seconds: float = 5) -> bool:
+    """Add the catalog index unless the table has it; returns whether it was added, once it is ACTIVE."""
+    client = table.meta.client
+    description = client.describe_table(TableName=table.name)['Table']
+    if any(index['IndexName'] == items_app.catalog_index for index in description.get('GlobalSecondaryIndexes', [])):
+        return False
+    index = {
+        'IndexName': items_app.catalog_index,
+        'KeySchema': [{'AttributeName': 'isActive', 'KeyType': 'HASH'}, {'AttributeName': 'price', 'KeyType': 'RANGE'}],
+        'Projection': {'ProjectionType': 'ALL'}
+    }
+    if description.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+        # like the template's table
+        index['ProvisionedThroughput'] = {'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+    client.update_table(
+        TableName=table.name,
+        AttributeDefinitions=[{'AttributeName': 'isActive', 'AttributeType': 'S'},
+                              {'AttributeName': 'price', 'AttributeType': 'N'}],
+        GlobalSecondaryIndexUpdates=[{'Create': index}]
+    )
+    logger.info(f'Creating {items_app.catalog_index} on {table.name}')
+    while True:
+        time.sleep(wait_seconds)
+        indexes = client.describe_table(TableName=table.name)['Table'].get('GlobalSecondaryIndexes', [])
+        status = next(i['IndexStatus'] for i in indexes if i['IndexName'] == items_app.catalog_index)
+        if status == 'ACTIVE':
+            return True
+        logger.info(f'{items_app.catalog_index} is {status}')
+
+
+def unindexed_items(table):
+    params = {
+        'FilterExpression': (Attr('isActive').exists() & ~Attr('isActive').is_in(['True', 'False']))
+        | Attr('price').attribute_type('S'),
+        'ProjectionExpression': 'id, isActive, price'
+    }
+    while True:
+        response = table.scan(**params)
+        yield from response['Items']
+        if not response.get('LastEvaluatedKey'):
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def normalized(item: dict) -> dict:
+    """The isActive and price values to store, or None when one cannot be converted."""
+    fields = {}
+    active = item.get('isActive')
+    if active is not None and active not in ('True', 'False'):
+        if isinstance(active, bool):
+            fields['isActive'] = str(active)
+        elif isinstance(active, str) and active.lower() in FLAGS:
+            fields['isActive'] = FLAGS[active.lower()]
+        else:
+            return None
+    if isinstance(item.get('price'), str):
+        try:
+            fields['price'] = Decimal(item['price'])
+        except InvalidOperation:
+            return None
+        if not fields['price'].is_finite() or fields['price'] < 0:
+            return None
+    return fields
+
+
+def migrate(table, rate: float, dry_run: bool = False) -> dict:
+    limiter = TokenBucket(rate)
+    counts = {'updated': 0, 'invalid': 0, 'skipped': 0}
+    for item in unindexed_items(table):
+        fields = normalized(item)
+        if fields is None:
+            logger.warning(f'Cannot convert item {item["id"]}: isActive={item.get("isActive")!r} price={item.get("price")!r}')
+            counts['invalid'] += 1
+            continue
+        if dry_run:
+            counts['updated'] += 1
+            continue
+        limiter.acquire()
+        names = {f'#f{i}': name for i, name in enumerate(fields)}
+        values = {f':v{i}': value for i, value in enumerate(fields.values())}
+        old = {f':o{i}': item[name] for i, name in enumerate(fields)}
+        try:
+            table.update_item(
+                Key={'id': item['id']},
+                UpdateExpression='set ' + ', '.join(f'#f{i} = :v{i}' for i in range(len(fields))),
+                # leave alone an item changed through the API since the scan page was read
+                ConditionExpression=' and '.join(f'#f{i} = :o{i}' for i in range(len(fields))),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=dict(values, **old)
+            )
+            counts['updated'] += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            counts['skipped'] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--table', default=items_app.table_name)
+    parser.add_argument('--region', default=items_app.region)
+    parser.add_argument('--rate', type=float, default=1.0, help='updates per second')
+    parser.add_argument('--no-index', action='store_true', help='only convert the items')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    table = dynamodb.get_table(args.table, args.region)
+    if not args.no_index and not args.dry_run:
+        ensure_index(table)
+    counts = migrate(table, args.rate, args.dry_run)
+    logger.info(f'{"Would convert" if args.dry_run else "Converted"} {counts["updated"]} items, '
+                f'{counts["invalid"]} could not be converted, skipped {counts["skipped"]}')
+
+
+if __name__ == '__main__':
+    main()